@@ -3,69 +3,158 @@ building_detector.py
 ---------------------------------
 Offline building recognition using ORB descriptor matching
 Chooses which building localizer to run
+
+- Vocabulary tree (localization/vocab_tree.py) ranks every building
+  from the query's visual words in one inverted-index lookup. It is
+  loaded once at API startup (load_vocabulary_tree), built and saved
+  first if vocab_tree.npz is missing or stale (other buildings, or a
+  bank file that changed since); requests only read it.
+  MAPMATE_VOCAB_TREE overrides its path (default backend/vocab_tree.npz).
+  Worker processes never load it: ranking runs in the API process.
+- Matching against the bank index (sharded for very large banks,
+  see localization/shards.py) runs only on the top candidates
 """
 
-import cv2
-import numpy as np
+import os
+import threading
+from functools import partial
 from pathlib import Path
 
+import numpy as np
+
+from localization.buildings import BUILDINGS  # importing registers every manifest building
+from localization.imaging import to_gray
+from localization.pipeline import thread_orb
+from localization.registry import banks
+from localization.timing import count, timed
+from localization.vocab_tree import VocabularyTree
+
 BASE_DIR = Path(__file__).resolve().parent
+VOCAB_TREE_PATH = Path(os.environ.get("MAPMATE_VOCAB_TREE", BASE_DIR / "vocab_tree.npz"))
+
+# Buildings verified with full matching after vocabulary-tree ranking
+CANDIDATES = 2
+MATCH_DISTANCE = 50
+MIN_GOOD_MATCHES = 40
 
 # -------------------------------------------------
-# Load descriptor banks (LIGHTWEIGHT)
+# Descriptor banks: lazy, from the bank registry
+# (only the top candidates of a query are ever loaded)
 # -------------------------------------------------
 
-BUILDINGS = {
-    "library": {
-        "descriptors": np.load(
-            BASE_DIR / "localization" / "Library" / "descriptors_3d.npy"
-        )
-    },
-    "admin": {
-        "descriptors": np.load(
-            BASE_DIR / "localization" / "Admin" / "descriptors_3d.npy"
-        )
-    }
-}
+def _descriptors(name: str) -> np.ndarray:
+    return banks.get(name).descriptors
+
+
+def bank_sources() -> dict:
+    """
+    Building → descriptor loader for VocabularyTree.build: banks come from
+    the registry one at a time, so the memory budget holds while building
+    """
+    return {name: partial(_descriptors, name) for name in banks}
+
+
+def bank_stamps() -> dict:
+    """Building → stamp of its bank file (size + mtime; "" for banks registered without a file)"""
+    return {name: BUILDINGS[name].bank_stamp() if name in BUILDINGS else "" for name in banks}
+
+
+def build_vocabulary_tree() -> VocabularyTree:
+    """Tree over every registered bank, stamped with the bank files it was built from"""
+    stamps = bank_stamps()
+    tree = VocabularyTree.build(bank_sources())
+    tree.stamps = [stamps[name] for name in tree.buildings]
+    return tree
+
+
+_tree = None
+_tree_lock = threading.Lock()
+
+
+def load_vocabulary_tree() -> VocabularyTree:
+    """
+    vocab_tree.npz if it was built from exactly the registered banks, as
+    they are now on disk; otherwise build it (one bank at a time) and save
+    it for the next start
+    Called once at API startup; requests use the loaded tree.
+    """
+    global _tree
+    with _tree_lock:
+        if _tree is not None:
+            return _tree
+        if VOCAB_TREE_PATH.exists():
+            tree = VocabularyTree.load(VOCAB_TREE_PATH)
+            stamps = bank_stamps()
+            if tree.stamps is not None and dict(zip(tree.buildings, tree.stamps)) == stamps:
+                _tree = tree
+                return _tree
+            print("⚠️ vocab_tree.npz is stale (buildings or bank files changed), rebuilding")
+        else:
+            print("⚠️ vocab_tree.npz not found, building it (python -m localization.vocab_tree)")
+        tree = build_vocabulary_tree()
+        try:
+            tree.save(VOCAB_TREE_PATH)
+        except OSError as e:
+            print(f"⚠️ Could not save {VOCAB_TREE_PATH}: {e}")
+        _tree = tree
+        return _tree
+
+
+def vocabulary_tree() -> VocabularyTree:
+    """The loaded tree (scripts that skipped startup load it here)"""
+    return _tree if _tree is not None else load_vocabulary_tree()
+
 
 # -------------------------------------------------
-# ORB extractor
+# ORB extractor (per thread, see pipeline.thread_orb)
 # -------------------------------------------------
 
-orb = cv2.ORB_create(nfeatures=3000)
-matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+ORB_FEATURES = 3000
 
 
-def detect_building(image_path: str) -> str | None:
+def rank_buildings(des: np.ndarray) -> list:
+    """[(building, score)] best first, from the vocabulary tree"""
+    if not len(banks):
+        return []
+    with timed("rank"):
+        return vocabulary_tree().rank(des)
+
+
+def detect_building(image) -> str | None:
     """
+    image: file path or image array
     Returns:
         building name or None
+    Stage timings are recorded when called inside localization.timing.collect()
     """
 
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    with timed("decode"):
+        img = to_gray(image)
     if img is None:
         return None
 
-    kp, des = orb.detectAndCompute(img, None)
+    with timed("orb"):
+        kp, des = thread_orb(ORB_FEATURES).detectAndCompute(img, None)
+    count("keypoints", len(kp))
     if des is None:
         return None
 
     best_building = None
     best_score = 0
 
-    for name, data in BUILDINGS.items():
-        matches = matcher.match(des, data["descriptors"])
-
-        good_matches = [m for m in matches if m.distance < 50]
+    for name, _ in rank_buildings(des)[:CANDIDATES]:
+        with banks.lease(name) as bank, timed("match"):
+            matches = bank.full_index.match(des)
 
-        score = len(good_matches)
+        score = int((matches.distance < MATCH_DISTANCE).sum())
+        count("matches", score)
 
         if score > best_score:
             best_score = score
             best_building = name
 
     # Minimum confidence threshold
-    if best_score < 40:
+    if best_score < MIN_GOOD_MATCHES:
         return None
 
     return best_building
@@ -0,0 +1,336 @@
+"""
+bank.py
+---------------------------------
+Feature bank of one building
+- 3D points + ORB descriptors (the reconstruction)
+- Camera intrinsics (+ the frame size they were calibrated at)
+  and the building → campus affine transform
+- Acceptance thresholds (matches, inliers, confidence scale) and the
+  limits of the pre-flight quality gate (see quality.py)
+- Lazily built descriptor index (see matchers.py), restricted to the
+  best viewpoint clusters when cluster labels exist (see clusters.py),
+  split across shard processes when the bank is very large (see shards.py)
+- Lazily built ground-plane grid (see spatial.py) to restrict matching
+  to points visible from an approximate client position, with the
+  subset index of every snapped region cached (LRU)
+
+A bank can be exported into shared memory once and attached by
+worker processes without copying the arrays. Banks opened from a
+bundle (see bundle.py) are simply re-mapped from the file instead.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+from localization.bundle import open_bundle
+from localization.clusters import RETRIEVE_TOP, ClusteredIndex
+from localization.imaging import scale_intrinsics
+from localization.matchers import BruteForceIndex, DescriptorIndex, build_index
+from localization.shards import SHARD_MIN_ROWS, SHARDS, ShardedIndex
+from localization.spatial import SpatialIndex, map_region_to_building
+
+# Descriptor index backend for every bank (see README: MAPMATE_MATCHER)
+MATCHER_BACKEND = os.environ.get("MAPMATE_MATCHER", "bruteforce")
+
+REGION_CACHE = 32             # region subset indexes kept per bank
+REGION_WHOLE_BANK = 0.9       # regions seeing more of the bank match the whole bank
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    """Per-building acceptance thresholds of the pipeline"""
+    min_matches: int = 25               # fewer correspondences → no PnP
+    min_inliers: int = 15               # fewer PnP inliers → failure
+    full_confidence_inliers: int = 120  # inliers at which confidence reaches 1.0
+    # Quality gate (quality.py), measured on a 320 px preview; 0 disables a check
+    max_clipped: float = 0.75           # share of near-black or near-white pixels
+    min_contrast: float = 8.0           # intensity standard deviation
+    min_sharpness: float = 20.0         # variance of the Laplacian
+    min_corners: int = 40               # FAST corners
+    # Position prior (spatial.py)
+    view_distance: float = 10.0         # ground-plane matching range, building units
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable reference to an ndarray living in shared memory"""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+@dataclass(frozen=True)
+class BankHandle:
+    """Everything a worker process needs to re-open a shared bank"""
+    building: str
+    points: Optional[SharedArray]
+    descriptors: Optional[SharedArray]
+    transform_matrix: np.ndarray
+    camera_matrix: np.ndarray
+    dist_coeffs: np.ndarray
+    calibration_size: tuple
+    matcher_backend: str
+    labels: Optional[SharedArray] = None
+    bundle: Optional[str] = None          # memory-mapped bundle instead of shm
+    thresholds: Thresholds = Thresholds()
+    view_dirs: Optional[SharedArray] = None
+
+    @property
+    def key(self) -> str:
+        """Identifies the exported arrays (changes when a bank is re-shared)"""
+        return self.bundle or self.points.name
+
+
+def _to_shared(arr: np.ndarray):
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+    return shm, SharedArray(shm.name, arr.shape, arr.dtype.str)
+
+
+def _from_shared(ref: SharedArray):
+    shm = shared_memory.SharedMemory(name=ref.name)
+    arr = np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=shm.buf)
+    arr.flags.writeable = False
+    return shm, arr
+
+
+class FeatureBank:
+    """Reconstruction + alignment data of one building"""
+
+    def __init__(
+        self,
+        building: str,
+        points: np.ndarray,
+        descriptors: np.ndarray,
+        transform_matrix: np.ndarray,
+        camera_matrix: np.ndarray,
+        dist_coeffs: np.ndarray,
+        calibration_size: tuple = (1280, 720),
+        matcher_backend: str = MATCHER_BACKEND,
+        labels: Optional[np.ndarray] = None,
+        thresholds: Thresholds = Thresholds(),
+        view_dirs: Optional[np.ndarray] = None,
+    ):
+        self.building = building
+        self.points = points                  # (N, 3)
+        self.descriptors = descriptors        # (N, 32) uint8
+        self.transform_matrix = transform_matrix
+        self.camera_matrix = camera_matrix    # calibrated at calibration_size (w, h)
+        self.dist_coeffs = dist_coeffs
+        self.calibration_size = tuple(calibration_size)
+        self.matcher_backend = matcher_backend
+        self.labels = labels                  # (N,) viewpoint cluster per point, optional
+        self.thresholds = thresholds
+        self.view_dirs = view_dirs            # (N, 3) mean direction to the observing cameras, optional
+        self._intrinsics = {}                 # frame size → rescaled camera matrix
+
+        self._index: Optional[DescriptorIndex] = None
+        self._full_index: Optional[DescriptorIndex] = None
+        self._spatial: Optional[SpatialIndex] = None
+        self._regions = OrderedDict()         # snapped region key → (rows, subset index)
+        self._index_lock = threading.Lock()
+        self._region_lock = threading.Lock()
+        self._shm = []                        # SharedMemory blocks we own / attached
+        self._attached = False                # True in processes that attached a handle
+        self._handle: Optional[BankHandle] = None
+        self.bundle_path: Optional[str] = None  # set when memory-mapped from a bundle
+        self.mih_tables: Optional[tuple] = None  # precomputed MIH index, when the bundle carries it
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def nbytes(self) -> int:
+        extra = sum(a.nbytes for a in (self.labels, self.view_dirs) if a is not None)
+        extra += sum(a.nbytes for a in self.mih_tables or ())
+        return self.points.nbytes + self.descriptors.nbytes + extra
+
+    @property
+    def clustered(self) -> bool:
+        return self.labels is not None and RETRIEVE_TOP > 0
+
+    @property
+    def index(self) -> DescriptorIndex:
+        """
+        Descriptor index, built on first use and then reused
+        (clustered retrieval index when the bank has viewpoint clusters)
+        """
+        if not self.clustered:
+            return self.full_index
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = ClusteredIndex(self.descriptors, self.labels, self.matcher_backend)
+        return self._index
+
+    @property
+    def sharded(self) -> bool:
+        """Matched by the shard processes (API process only, never inside a worker)"""
+        return SHARDS > 1 and len(self) >= SHARD_MIN_ROWS and not self._attached
+
+    @property
+    def full_index(self) -> DescriptorIndex:
+        """Index over the whole bank"""
+        if self._full_index is None:
+            with self._index_lock:
+                if self._full_index is None:
+                    if self.sharded:
+                        self._full_index = ShardedIndex(self)
+                    elif self.matcher_backend == "mih" and self.mih_tables is not None:
+                        self._full_index = build_index("mih", self.descriptors, tables=self.mih_tables)
+                    else:
+                        self._full_index = build_index(self.matcher_backend, self.descriptors)
+        return self._full_index
+
+    @property
+    def spatial(self) -> SpatialIndex:
+        """Ground-plane grid over the points, built on first use"""
+        if self._spatial is None:
+            with self._index_lock:
+                if self._spatial is None:
+                    self._spatial = SpatialIndex(self.points, self.thresholds.view_distance, self.view_dirs)
+        return self._spatial
+
+    def region_index(self, map_xy, radius: float) -> Tuple[Optional[np.ndarray], Optional[DescriptorIndex]]:
+        """
+        (rows, index) for a campus-map disc (map px): the rows plausibly
+        visible from it and an exact (cross-checked) index over them whose
+        train indices refer to those rows; (None, None) when the region sees
+        more than REGION_WHOLE_BANK of the bank (match the whole bank).
+        The disc is snapped to the grid, so nearby requests reuse one cached
+        index (LRU, at most REGION_CACHE regions and one bank's worth of
+        copied descriptors).
+        """
+        spatial = self.spatial
+        centre, r = map_region_to_building(self.transform_matrix, map_xy, radius)
+        key, centre, r = spatial.snap(centre, r)
+        with self._region_lock:
+            entry = self._regions.get(key)
+            if entry is not None:
+                self._regions.move_to_end(key)
+                return entry
+
+        rows = spatial.visible_from(centre, r)
+        if len(rows) > REGION_WHOLE_BANK * len(self):
+            entry = (None, None)
+        else:
+            entry = (rows, BruteForceIndex(self.descriptors[rows]))
+        with self._region_lock:
+            self._regions[key] = entry
+            while len(self._regions) > 1 and (
+                len(self._regions) > REGION_CACHE
+                or sum(len(rows) for rows, _ in self._regions.values() if rows is not None) > len(self)
+            ):
+                self._regions.popitem(last=False)
+        return entry
+
+    def configure(self, transform_matrix, camera_matrix, dist_coeffs, calibration_size, thresholds: Thresholds):
+        """Overrides alignment, intrinsics and thresholds (e.g. a bundle's defaults)"""
+        self.transform_matrix = np.asarray(transform_matrix, np.float64)
+        self.camera_matrix = np.asarray(camera_matrix, np.float32)
+        self.dist_coeffs = np.asarray(dist_coeffs, np.float64).reshape(-1, 1)
+        self.calibration_size = tuple(calibration_size)
+        self.thresholds = thresholds
+        self._intrinsics = {}
+        self._spatial = None                  # view distance may have changed
+        with self._region_lock:
+            self._regions.clear()
+
+    def intrinsics_for(self, image_size) -> np.ndarray:
+        """Camera matrix rescaled to a decoded frame of image_size (w, h)"""
+        K = self._intrinsics.get(image_size)
+        if K is None:
+            K = scale_intrinsics(self.camera_matrix, self.calibration_size, image_size)
+            if len(self._intrinsics) >= 64:
+                self._intrinsics.clear()
+            self._intrinsics[image_size] = K
+        return K
+
+    # -----------------------------
+    # Shared memory
+    # -----------------------------
+    def share(self) -> BankHandle:
+        """Copies the arrays into shared memory (once) and returns a handle"""
+        if self._handle is not None:
+            return self._handle
+        if self.bundle_path is not None:
+            # Already file-backed: workers map the same pages
+            self._handle = BankHandle(
+                self.building, None, None,
+                self.transform_matrix, self.camera_matrix, self.dist_coeffs,
+                self.calibration_size, self.matcher_backend,
+                bundle=self.bundle_path, thresholds=self.thresholds,
+            )
+            return self._handle
+        shm_p, points = _to_shared(self.points)
+        shm_d, descriptors = _to_shared(np.ascontiguousarray(self.descriptors))
+        self._shm += [shm_p, shm_d]
+        labels = None
+        if self.labels is not None:
+            shm_l, labels = _to_shared(self.labels)
+            self._shm.append(shm_l)
+        view_dirs = None
+        if self.view_dirs is not None:
+            shm_v, view_dirs = _to_shared(np.ascontiguousarray(self.view_dirs))
+            self._shm.append(shm_v)
+        self._handle = BankHandle(
+            self.building, points, descriptors,
+            self.transform_matrix, self.camera_matrix, self.dist_coeffs,
+            self.calibration_size, self.matcher_backend, labels,
+            thresholds=self.thresholds, view_dirs=view_dirs,
+        )
+        return self._handle
+
+    @classmethod
+    def attach(cls, handle: BankHandle) -> "FeatureBank":
+        """Opens a bank exported by share() in another process (zero-copy)"""
+        if handle.bundle is not None:
+            # Alignment and thresholds come from the manifest, not the bundle header
+            bank = open_bundle(handle.bundle, handle.matcher_backend)
+            bank.configure(handle.transform_matrix, handle.camera_matrix, handle.dist_coeffs,
+                           handle.calibration_size, handle.thresholds)
+            bank._attached = True
+            return bank
+        shm_p, points = _from_shared(handle.points)
+        shm_d, descriptors = _from_shared(handle.descriptors)
+        attached = [shm_p, shm_d]
+        labels = None
+        if handle.labels is not None:
+            shm_l, labels = _from_shared(handle.labels)
+            attached.append(shm_l)
+        view_dirs = None
+        if handle.view_dirs is not None:
+            shm_v, view_dirs = _from_shared(handle.view_dirs)
+            attached.append(shm_v)
+        bank = cls(
+            handle.building, points, descriptors,
+            handle.transform_matrix, handle.camera_matrix, handle.dist_coeffs,
+            handle.calibration_size, handle.matcher_backend, labels,
+            handle.thresholds, view_dirs,
+        )
+        bank._shm = attached
+        bank._attached = True
+        return bank
+
+    def release(self, unlink: bool = False):
+        """Drops shared-memory mappings; unlink only applies to the owner"""
+        unlink = unlink and not self._attached
+        for shm in self._shm:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # arrays still exported; the mapping goes away with the process
+            if unlink:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+        self._shm = []
+        self._handle = None
@@ -0,0 +1,127 @@
+"""
+bench_matchers.py
+---------------------------------
+Recall-vs-latency report for the descriptor index backends
+
+Usage (from backend/):
+    python -m localization.bench_matchers
+    python -m localization.bench_matchers --images photos/*.jpg
+
+Reference matches come from exact brute force (kNN + same ratio test).
+Without --images, queries are bank descriptors with random bit flips
+(a stand-in for viewpoint change) mixed with random distractors.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from localization.matchers import MATCHER_BACKENDS, BruteForceIndex, build_index
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BANK = BACKEND_DIR / "Library" / "descriptors_3d.npy"
+
+
+def synthetic_queries(bank: np.ndarray, n: int, flip_bits: int, seed: int = 0) -> np.ndarray:
+    """Perturbed bank rows (75%) + uniform random descriptors (25%)"""
+    rng = np.random.default_rng(seed)
+    n_true = int(n * 0.75)
+
+    rows = bank[rng.choice(len(bank), n_true, replace=False)].copy()
+    bits = np.unpackbits(rows, axis=1)
+    for row in bits:
+        row[rng.choice(256, flip_bits, replace=False)] ^= 1
+    perturbed = np.packbits(bits, axis=1)
+
+    noise = rng.integers(0, 256, size=(n - n_true, 32), dtype=np.uint8)
+    return np.vstack([perturbed, noise])
+
+
+def image_queries(paths, nfeatures: int = 4000) -> list:
+    orb = cv2.ORB_create(nfeatures=nfeatures)
+    out = []
+    for p in paths:
+        gray = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"⚠️ Skipping unreadable image: {p}")
+            continue
+        _, des = orb.detectAndCompute(gray, None)
+        if des is not None:
+            out.append(des)
+    return out
+
+
+def _pairs(matches) -> set:
+    return set(zip(matches.query_idx.tolist(), matches.train_idx.tolist()))
+
+
+def run(bank: np.ndarray, queries: list, ratio: float, repeats: int) -> list:
+    reference = BruteForceIndex(bank, ratio=ratio)
+    ref_pairs = [_pairs(reference.match(q)) for q in queries]
+
+    rows = []
+    for name in MATCHER_BACKENDS:
+        options = {"ratio": ratio}
+        t0 = time.perf_counter()
+        index = build_index(name, bank, **options)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        latencies, hits, total, returned = [], 0, 0, 0
+        for q, ref in zip(queries, ref_pairs):
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                matches = index.match(q)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            got = _pairs(matches)
+            hits += len(got & ref)
+            total += len(ref)
+            returned += len(got)
+
+        rows.append({
+            "backend": name,
+            "build_ms": build_ms,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "recall": hits / total if total else float("nan"),
+            "matches": returned / len(queries),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bank", type=Path, default=DEFAULT_BANK)
+    parser.add_argument("--images", nargs="*", default=[])
+    parser.add_argument("--queries", type=int, default=4000, help="synthetic descriptors per query")
+    parser.add_argument("--frames", type=int, default=5, help="synthetic query frames")
+    parser.add_argument("--flip-bits", type=int, default=24)
+    parser.add_argument("--ratio", type=float, default=0.8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    bank = np.load(args.bank)
+    if args.images:
+        queries = image_queries(args.images)
+    else:
+        queries = [
+            synthetic_queries(bank, args.queries, args.flip_bits, seed=i)
+            for i in range(args.frames)
+        ]
+    if not queries:
+        print("❌ No usable queries")
+        return
+
+    print(f"Bank: {args.bank} ({len(bank)} descriptors), {len(queries)} query frame(s)")
+    print(f"{'backend':<12}{'build ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'recall':>9}{'matches':>10}")
+    for r in run(bank, queries, args.ratio, args.repeats):
+        print(
+            f"{r['backend']:<12}{r['build_ms']:>10.1f}{r['p50_ms']:>10.1f}"
+            f"{r['p95_ms']:>10.1f}{r['recall']:>9.3f}{r['matches']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+buildings.py
+---------------------------------
+Buildings from the manifest (buildings.json), one generic localizer each
+
+Every building is configuration only:
+    "<id>": {
+        "name": "Library",                          display name in results
+        "directory": "Library",                     keypoints_3d.npy, descriptors_3d.npy
+                                                    (+ clusters.npy, view_dirs.npy, bank.mmb)
+        "transform": "transform_library.json",      building (x, z) → campus map affine
+        "camera_matrix": [[fx, 0, cx], ...],        intrinsics at calibration_size
+        "dist_coeffs": [0, 0, 0, 0],
+        "calibration_size": [1280, 720],
+        "thresholds": {"min_matches": 25, ...}      optional: acceptance, quality gate
+                                                    and view distance, see bank.Thresholds
+    }
+Paths are relative to the manifest. Importing this module registers
+every building's bank loader with the bank registry (lazy load, LRU).
+
+MAPMATE_BUILDINGS    manifest path (default backend/buildings.json)
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+from localization.bank import MATCHER_BACKEND, FeatureBank, Thresholds
+from localization.bundle import BUNDLE_FILE, open_bundle
+from localization.clusters import load_labels
+from localization.imaging import to_gray
+from localization.pipeline import localize_frame
+from localization.registry import BankRegistry, banks
+from localization.spatial import load_view_dirs
+from localization.timing import timed
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MANIFEST_PATH = Path(os.environ.get("MAPMATE_BUILDINGS", BASE_DIR / "buildings.json"))
+
+KEYPOINTS_FILE = "keypoints_3d.npy"
+DESCRIPTORS_FILE = "descriptors_3d.npy"
+
+
+class BuildingLocalizer:
+    """One manifest entry: where its bank lives and how to align it"""
+
+    def __init__(
+        self,
+        building_id: str,
+        name: str,
+        directory: Path,
+        transform_path: Path,
+        camera_matrix: np.ndarray,
+        dist_coeffs: np.ndarray,
+        calibration_size: tuple = (1280, 720),
+        thresholds: Thresholds = Thresholds(),
+    ):
+        self.building_id = building_id
+        self.name = name
+        self.directory = Path(directory)
+        self.transform_path = Path(transform_path)
+        self.camera_matrix = camera_matrix
+        self.dist_coeffs = dist_coeffs
+        self.calibration_size = tuple(calibration_size)
+        self.thresholds = thresholds
+
+    @classmethod
+    def from_manifest(cls, building_id: str, entry: dict, base_dir: Path) -> "BuildingLocalizer":
+        return cls(
+            building_id,
+            entry.get("name", building_id.title()),
+            base_dir / entry.get("directory", building_id),
+            base_dir / entry["transform"],
+            np.array(entry["camera_matrix"], np.float32),
+            np.array(entry.get("dist_coeffs", [0, 0, 0, 0]), np.float64).reshape(-1, 1),
+            tuple(entry.get("calibration_size", (1280, 720))),
+            Thresholds(**entry.get("thresholds", {})),
+        )
+
+    @property
+    def bundle_path(self) -> Path:
+        return self.directory / BUNDLE_FILE
+
+    def has_bank(self) -> bool:
+        return self.bundle_path.exists() or (
+            (self.directory / KEYPOINTS_FILE).exists()
+            and (self.directory / DESCRIPTORS_FILE).exists()
+            and self.transform_path.exists()
+        )
+
+    def bank_stamp(self) -> str:
+        """Size and mtime of the descriptor file: changes when the bank is rebuilt or pruned"""
+        path = self.bundle_path if self.bundle_path.exists() else self.directory / DESCRIPTORS_FILE
+        st = path.stat()
+        return f"{path.name}:{st.st_size}:{st.st_mtime_ns}"
+
+    def transform_matrix(self) -> np.ndarray:
+        with open(self.transform_path, "r") as f:
+            return np.array(json.load(f)["transform_matrix"])   # 2x3 affine
+
+    def load_bank(self) -> FeatureBank:
+        """Memory-mapped bundle if present, else the loose .npy/.json files"""
+        if self.bundle_path.exists():
+            bank = open_bundle(self.bundle_path)
+            # The manifest is authoritative for alignment and intrinsics
+            transform = self.transform_matrix() if self.transform_path.exists() else bank.transform_matrix
+            bank.configure(transform, self.camera_matrix, self.dist_coeffs,
+                           self.calibration_size, self.thresholds)
+            return bank
+
+        return FeatureBank(
+            self.name,
+            np.load(self.directory / KEYPOINTS_FILE),      # (N, 3)
+            np.load(self.directory / DESCRIPTORS_FILE),    # (N, 32) ORB
+            self.transform_matrix(),
+            self.camera_matrix,
+            self.dist_coeffs,
+            self.calibration_size,
+            MATCHER_BACKEND,
+            labels=load_labels(self.directory),            # (N,) or None
+            thresholds=self.thresholds,
+            view_dirs=load_view_dirs(self.directory),      # (N, 3) or None
+        )
+
+    def localize(self, image, registry: BankRegistry = banks, **options) -> dict:
+        """
+        Localizes a frame of this building (scripts / in-process use)
+        image: decoded frame (gray or BGR) or an image path
+        options: passed to pipeline.localize_frame (prior, profile, deadline, region)
+        Stage timings are recorded when called inside localization.timing.collect()
+        """
+        with timed("decode"):
+            gray = to_gray(image)
+        if gray is None:
+            return {"success": False, "reason": "Image not readable"}
+
+        with registry.lease(self.building_id) as bank:
+            return localize_frame(gray, bank, **options)
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> Dict[str, BuildingLocalizer]:
+    """Building id → localizer; entries without bank files are skipped"""
+    path = Path(path)
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    localizers = {}
+    for building_id, entry in manifest.items():
+        localizer = BuildingLocalizer.from_manifest(building_id.lower(), entry, path.parent)
+        if not localizer.has_bank():
+            print(f"⚠️ Skipping building '{building_id}': no bank in {localizer.directory}")
+            continue
+        localizers[localizer.building_id] = localizer
+    return localizers
+
+
+# Building id → localizer; every bank is registered (loaded on first use)
+BUILDINGS = load_manifest()
+for _id, _localizer in BUILDINGS.items():
+    banks.add(_id, _localizer.load_bank)
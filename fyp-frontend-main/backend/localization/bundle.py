@@ -0,0 +1,159 @@
+"""
+bundle.py
+---------------------------------
+Single-file feature-bank bundle (bank.mmb)
+
+Layout (little endian):
+    magic    8 bytes   b"MMBANK\\0\\0"
+    version  uint32    BUNDLE_VERSION
+    length   uint32    size of the JSON header
+    header   JSON      building, transform, intrinsics defaults,
+                       and {name: offset, shape, dtype} of every array
+    arrays   raw       64-byte aligned: points (float32), descriptors
+                       (uint8), optional labels (viewpoint clusters),
+                       view_dirs (float32, see spatial.py) and the
+                       multi-index hashing tables mih_order (int32) and
+                       mih_keys (uint16) of the descriptors
+
+Opened with np.memmap: startup does not read the arrays, and every
+process (uvicorn/gunicorn workers, localization workers) maps the same
+file, so the pages are shared through the OS page cache.
+
+Pack a building from its loose files (from backend/):
+    python -m localization.bundle library [--mih]
+"""
+
+import argparse
+import json
+import struct
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from localization.matchers import mih_tables
+
+BUNDLE_FILE = "bank.mmb"
+BUNDLE_MAGIC = b"MMBANK\0\0"
+BUNDLE_VERSION = 1
+ALIGN = 64
+
+_PREFIX = struct.Struct("<8sII")
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_bundle(path: Path, bank, mih: bool = False) -> Path:
+    """Writes a FeatureBank as one memory-mappable bundle (mih: with the MIH index tables)"""
+    arrays = {
+        "points": np.ascontiguousarray(bank.points, np.float32),
+        "descriptors": np.ascontiguousarray(bank.descriptors, np.uint8),
+    }
+    if bank.labels is not None:
+        arrays["labels"] = np.ascontiguousarray(bank.labels, np.int32)
+    if bank.view_dirs is not None:
+        arrays["view_dirs"] = np.ascontiguousarray(bank.view_dirs, np.float32)
+    if mih:
+        arrays["mih_order"], arrays["mih_keys"] = mih_tables(arrays["descriptors"])
+
+    header = {
+        "building": bank.building,
+        "transform_matrix": np.asarray(bank.transform_matrix, np.float64).tolist(),
+        "camera_matrix": np.asarray(bank.camera_matrix, np.float64).tolist(),
+        "dist_coeffs": np.asarray(bank.dist_coeffs, np.float64).ravel().tolist(),
+        "calibration_size": list(bank.calibration_size),
+        "arrays": {},
+    }
+
+    # Offsets depend on the header length, which depends on the offsets:
+    # reserve generously, then lay the arrays out after it
+    reserved = _aligned(_PREFIX.size + len(json.dumps(header)) + 128 * len(arrays) + 256)
+    offset = reserved
+    for name, arr in arrays.items():
+        header["arrays"][name] = {"offset": offset, "shape": list(arr.shape), "dtype": arr.dtype.str}
+        offset = _aligned(offset + arr.nbytes)
+
+    blob = json.dumps(header).encode()
+    if _PREFIX.size + len(blob) > reserved:
+        raise ValueError("Bundle header does not fit the reserved space")
+
+    path = Path(path)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(blob)))
+        f.write(blob)
+        for name, arr in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(offset)
+    tmp.replace(path)  # readers never see a half-written bundle
+    return path
+
+
+def read_header(path: Path) -> dict:
+    with open(path, "rb") as f:
+        magic, version, length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a feature-bank bundle")
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"{path}: unsupported bundle version {version} (expected {BUNDLE_VERSION})")
+        return json.loads(f.read(length))
+
+
+def map_arrays(path: Path, header: dict) -> dict:
+    """Read-only memory maps of every array in the bundle"""
+    return {
+        name: np.memmap(path, dtype=np.dtype(a["dtype"]), mode="r",
+                        offset=a["offset"], shape=tuple(a["shape"]))
+        for name, a in header["arrays"].items()
+    }
+
+
+def open_bundle(path: Path, matcher_backend: Optional[str] = None):
+    """FeatureBank backed by a memory-mapped bundle (no array is read yet)"""
+    from localization.bank import MATCHER_BACKEND, FeatureBank
+
+    path = Path(path)
+    header = read_header(path)
+    arrays = map_arrays(path, header)
+    bank = FeatureBank(
+        header["building"],
+        arrays["points"],
+        arrays["descriptors"],
+        np.array(header["transform_matrix"]),
+        np.array(header["camera_matrix"], np.float32),
+        np.array(header["dist_coeffs"]).reshape(-1, 1),
+        tuple(header["calibration_size"]),
+        matcher_backend or MATCHER_BACKEND,
+        labels=arrays.get("labels"),
+        view_dirs=arrays.get("view_dirs"),
+    )
+    bank.bundle_path = str(path)
+    if "mih_order" in arrays:
+        bank.mih_tables = (arrays["mih_order"], arrays["mih_keys"])
+    return bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a building's feature bank into one bundle")
+    parser.add_argument("building", help="building id from buildings.json, e.g. library")
+    parser.add_argument("--out", type=Path, help=f"default: <building directory>/{BUNDLE_FILE}")
+    parser.add_argument("--mih", action="store_true",
+                        help="also store the multi-index hashing tables (MAPMATE_MATCHER=mih)")
+    args = parser.parse_args()
+
+    from localization.buildings import BUILDINGS
+
+    localizer = BUILDINGS[args.building.lower()]
+    out = args.out or localizer.bundle_path
+    bank = localizer.load_bank()
+    write_bundle(out, bank, args.mih)
+    header = read_header(out)
+    print(f"✅ {header['building']}: {len(bank)} points, "
+          f"arrays {', '.join(header['arrays'])} → {out} ({out.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
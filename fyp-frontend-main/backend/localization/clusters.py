@@ -0,0 +1,172 @@
+"""
+clusters.py
+---------------------------------
+Viewpoint-clustered feature bank
+Offline: partition the bank's 3D points into viewpoint clusters
+(k-means on position + facade direction around the building centre)
+and save one label per point next to the bank:
+
+    python -m localization.clusters Library --clusters 8
+
+Query time: a cheap retrieval step votes with a sample of the query
+descriptors against a small signature of every cluster, then matching
+and PnP only see the top clusters. Cost stays roughly constant as the
+reconstruction grows, because clusters stay the same size.
+"""
+
+import argparse
+import os
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from localization.matchers import DescriptorIndex, Matches, build_index, merge_matches
+
+CLUSTERS_FILE = "clusters.npy"
+
+# Clusters matched per query (0 disables clustered matching)
+RETRIEVE_TOP = int(os.environ.get("MAPMATE_CLUSTER_TOP", "3"))
+
+SIGNATURE_SIZE = 256          # descriptors sampled per cluster for retrieval
+RETRIEVAL_QUERIES = 500       # query descriptors used to vote
+RETRIEVAL_MAX_DISTANCE = 50   # Hamming distance of a vote
+
+
+# =========================================================
+# OFFLINE CLUSTERING
+# =========================================================
+
+def cluster_bank(points: np.ndarray, n_clusters: int, seed: int = 0) -> np.ndarray:
+    """
+    Viewpoint clusters of a reconstruction
+    Features: standardized position + unit facade direction (azimuth of
+    the point around the building centre on the X/Z ground plane), so
+    opposite sides of a wall end up in different clusters.
+    """
+    pts = np.asarray(points, np.float64)
+    centred = pts - np.median(pts, axis=0)
+    azimuth = np.arctan2(centred[:, 2], centred[:, 0])
+
+    pos = centred / (centred.std(axis=0) + 1e-9)
+    features = np.hstack([pos, 1.5 * np.cos(azimuth)[:, None], 1.5 * np.sin(azimuth)[:, None]])
+
+    cv2.setRNGSeed(seed)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-3)
+    _, labels, _ = cv2.kmeans(
+        features.astype(np.float32), n_clusters, None, criteria, 5, cv2.KMEANS_PP_CENTERS
+    )
+    return labels.ravel().astype(np.int32)
+
+
+# =========================================================
+# QUERY-TIME INDEX
+# =========================================================
+
+class ClusteredIndex(DescriptorIndex):
+    """
+    Retrieval over viewpoint clusters + one sub-index per cluster
+    Returned train indices refer to the full bank.
+    """
+
+    name = "clustered"
+
+    def __init__(self, descriptors: np.ndarray, labels: np.ndarray, backend: str, top: int = RETRIEVE_TOP):
+        super().__init__(descriptors)
+        self.backend = backend
+        self.top = top
+        self.members = [np.flatnonzero(labels == c) for c in range(int(labels.max()) + 1)]
+        self._indexes = {}
+        self._indexes_lock = threading.Lock()
+
+        # Retrieval signature: a fixed sample of every cluster
+        rng = np.random.default_rng(0)
+        sig_rows, sig_owner = [], []
+        for c, rows in enumerate(self.members):
+            take = rows if len(rows) <= SIGNATURE_SIZE else rng.choice(rows, SIGNATURE_SIZE, replace=False)
+            sig_rows.append(take)
+            sig_owner.append(np.full(len(take), c, np.int32))
+        self.signature = self.descriptors[np.concatenate(sig_rows)]
+        self.signature_owner = np.concatenate(sig_owner)
+        self.voter = cv2.BFMatcher(cv2.NORM_HAMMING)
+
+    def cluster_index(self, c: int) -> DescriptorIndex:
+        index = self._indexes.get(c)
+        if index is None:
+            with self._indexes_lock:
+                index = self._indexes.get(c)
+                if index is None:
+                    index = build_index(self.backend, self.descriptors[self.members[c]])
+                    self._indexes[c] = index
+        return index
+
+    def retrieve(self, query: np.ndarray) -> list:
+        """Top clusters by votes of a query sample against the signatures"""
+        if len(query) > RETRIEVAL_QUERIES:
+            step = len(query) / RETRIEVAL_QUERIES
+            query = query[(np.arange(RETRIEVAL_QUERIES) * step).astype(int)]
+        votes = np.zeros(len(self.members), np.int64)
+        for m in self.voter.match(query, self.signature):
+            if m.distance < RETRIEVAL_MAX_DISTANCE:
+                votes[self.signature_owner[m.trainIdx]] += 1
+        ranked = np.argsort(-votes, kind="stable")
+        return [int(c) for c in ranked[:self.top] if votes[c] > 0]
+
+    def clusters_for(self, query: np.ndarray) -> list:
+        """Retrieved clusters, or every cluster (= the whole bank) when no cluster got a vote"""
+        return self.retrieve(query) or list(range(len(self.members)))
+
+    def _to_global(self, c: int, m: Matches) -> Matches:
+        return Matches(m.query_idx, self.members[c][m.train_idx].astype(np.int32), m.distance)
+
+    def match(self, query: np.ndarray) -> Matches:
+        parts = [
+            self._to_global(c, self.cluster_index(c).match(query))
+            for c in self.clusters_for(query)
+        ]
+        return merge_matches(parts)
+
+    def match_many(self, queries: list) -> list:
+        """
+        Retrieval per frame (as match()), then one batched pass per cluster
+        over the frames that retrieved it
+        """
+        frames_of = {}
+        for i, query in enumerate(queries):
+            for c in self.clusters_for(query):
+                frames_of.setdefault(c, []).append(i)
+
+        parts = [[] for _ in queries]
+        for c, frames in frames_of.items():
+            matched = self.cluster_index(c).match_many([queries[i] for i in frames])
+            for i, m in zip(frames, matched):
+                parts[i].append(self._to_global(c, m))
+        return [merge_matches(p) for p in parts]
+
+
+def load_labels(bank_dir: Path):
+    """Cluster labels saved next to a bank, or None if not built"""
+    path = Path(bank_dir) / CLUSTERS_FILE
+    return np.load(path) if path.exists() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition a feature bank into viewpoint clusters")
+    parser.add_argument("bank_dir", type=Path, help="directory holding keypoints_3d.npy")
+    parser.add_argument("--clusters", type=int, default=0, help="default: one per ~2000 points")
+    args = parser.parse_args()
+
+    points = np.load(args.bank_dir / "keypoints_3d.npy")
+    n_clusters = args.clusters or max(1, len(points) // 2000)
+    labels = cluster_bank(points, n_clusters)
+
+    out = args.bank_dir / CLUSTERS_FILE
+    np.save(out, labels)
+    sizes = np.bincount(labels, minlength=n_clusters)
+    print(f"✅ {n_clusters} clusters over {len(points)} points → {out}")
+    print(f"   sizes: min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+engine.py
+---------------------------------
+Localization engine: runs the pipeline in-process or on a worker pool
+
+Banks come from a BankRegistry (see registry.py): loaded on first use,
+evicted LRU under the memory budget, pinned while a request uses them.
+Loading a bank and exporting it to shared memory run on a thread, never
+on the event loop.
+
+MAPMATE_LOCALIZE_WORKERS = N > 0
+    N worker processes. A bank is copied into shared memory once (or,
+    for bundles, re-mapped from its file) and attached by every worker
+    on its first request for that building (no per-process copy); each
+    worker keeps warm ORB extractors (per thread, see pipeline.thread_orb)
+    and descriptor indexes.
+MAPMATE_LOCALIZE_WORKERS = 0 (default)
+    Localize inside the API process, on MAPMATE_LOCALIZE_THREADS threads
+    (never on the event loop).
+MAPMATE_CV_THREADS
+    cv2.setNumThreads() inside each worker (default 1, so N workers use
+    about N cores instead of oversubscribing).
+MAPMATE_QUEUE_DEPTH
+    Requests allowed to wait for a busy worker/thread (default 16). Past
+    that, requests are rejected at once (EngineOverloaded → 503).
+
+While in-flight requests × MAPMATE_TILE_THREADS fit in the machine's
+cores, each request extracts ORB over image tiles on several threads
+(pipeline.extract_tiled); under load every request extracts on one thread.
+
+Automatic building selection (localize_auto) shares one decode + ORB
+extraction: an extract task (no bank needed), a ranking step in the API
+process (the vocabulary tree is loaded there once, never in workers), then
+tasks matching the same features against the top candidates' banks.
+
+Very large banks are matched scatter-gather by shard processes
+(MAPMATE_MATCH_SHARDS, see shards.py) behind bank.full_index, in-process
+mode only (workers=0; start() warns when both are set).
+"""
+
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional
+
+import cv2
+
+from building_detector import CANDIDATES, rank_buildings
+from localization.bank import BankHandle, FeatureBank, Thresholds
+from localization.imaging import decode_frame
+from localization.pipeline import (
+    DEFAULT_PROFILE, ORB_FEATURES, PROFILES,
+    TILE_THREADS, localize_batch, localize_features, localize_frame, localize_keypoints,
+    thread_orb, tier_features, tiled_extraction,
+)
+from localization.quality import check_quality
+from localization.registry import BankRegistry, banks
+from localization.shards import SHARDS, shutdown_shards
+from localization.solver import BUDGET_MS, deadline_at, expires_after
+from localization.timing import collect, count, merge_timing, timed
+
+WORKERS = int(os.environ.get("MAPMATE_LOCALIZE_WORKERS", "0"))
+CV_THREADS = int(os.environ.get("MAPMATE_CV_THREADS", "1"))
+THREADS = int(os.environ.get("MAPMATE_LOCALIZE_THREADS", str(os.cpu_count() or 1)))
+QUEUE_DEPTH = int(os.environ.get("MAPMATE_QUEUE_DEPTH", "16"))
+CPU_COUNT = os.cpu_count() or 1
+
+
+class EngineOverloaded(Exception):
+    """Raised when every slot is busy and the wait queue is full"""
+
+    def __init__(self, retry_after_s: int):
+        super().__init__("Localization queue is full")
+        self.retry_after_s = retry_after_s
+
+
+def localize_bytes(
+    bank: FeatureBank,
+    data: bytes,
+    orb=None,
+    prior=None,
+    profile: str = DEFAULT_PROFILE,
+    expires: Optional[float] = None,
+    region=None,
+    sensors=None,
+) -> dict:
+    """
+    Decode an uploaded frame and run the pipeline on it
+    expires (time.time() by which to answer, see solver.expires_after; set
+    when the engine admitted the request) bounds the pose solver.
+    region (map_x, map_y, radius) restricts matching to what is visible from there.
+    sensors (sensors.Sensors) carries the client's intrinsics, gravity and heading.
+    The result carries a "timing" block (stage durations + counters).
+    """
+    deadline = deadline_at(expires)
+    with collect() as timer:
+        with timed("decode"):
+            gray = decode_frame(data)
+        if gray is None:
+            result = {"success": False, "reason": "Image not readable"}
+        else:
+            result = localize_frame(gray, bank, orb, prior, profile, deadline, region, sensors)
+    result["timing"] = timer.to_dict()
+    return result
+
+
+def _local_localize(bank: FeatureBank, data: bytes, prior=None, profile: str = DEFAULT_PROFILE,
+                    expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    """In-process counterpart of _worker_localize (ORB: the executor thread's own)"""
+    return localize_bytes(bank, data, None, prior, profile, expires, region, sensors)
+
+
+def extract_bytes(data: bytes, orb=None, profile: str = DEFAULT_PROFILE) -> dict:
+    """
+    Auto mode, first task: decode once, quality gate, extract the features
+    of the profile's last tier once
+    The features travel back: the API process ranks the buildings with
+    them (rank_candidates) and the pose tasks do not extract again.
+    """
+    tier = PROFILES[profile][-1]
+    with collect() as timer:
+        with timed("decode"):
+            gray = decode_frame(data)
+        if gray is None:
+            result = {"success": False, "reason": "Image not readable"}
+        else:
+            # No building known yet: the default quality limits apply
+            result = check_quality(gray, Thresholds())
+        if result is None:
+            kp_xy, des2d, image_size = tier_features(gray, tier, orb)
+            if des2d is None:
+                result = {"success": False, "reason": "Insufficient features"}
+            else:
+                result = {"success": True, "features": (kp_xy, des2d, image_size)}
+    result["timing"] = timer.to_dict()
+    return result
+
+
+def rank_candidates(des2d) -> tuple:
+    """Auto mode, API process: top buildings from the vocabulary tree, and a timing block"""
+    with collect() as timer:
+        candidates = [name for name, _ in rank_buildings(des2d)[:CANDIDATES]]
+    return candidates, timer.to_dict()
+
+
+def localize_extracted(bank: FeatureBank, features: tuple, profile: str = DEFAULT_PROFILE,
+                       expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    """Auto mode, second task: pose of already-extracted features against one bank"""
+    deadline = deadline_at(expires)
+    with collect() as timer:
+        result = localize_features(*features, bank, PROFILES[profile][-1], deadline, region, sensors)
+    result["timing"] = timer.to_dict()
+    return result
+
+
+def localize_client_features(bank: FeatureBank, features: tuple, prior=None, profile: str = DEFAULT_PROFILE,
+                             expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    """Features uploaded by the client (see features.py): matching + PnP only"""
+    deadline = deadline_at(expires)
+    with collect() as timer:
+        count("keypoints", len(features[0]))
+        result = localize_keypoints(*features, bank, prior, profile, deadline, region, sensors)
+    result["timing"] = timer.to_dict()
+    return result
+
+
+def _extract(_, data: bytes, profile: str = DEFAULT_PROFILE) -> dict:
+    """extract_bytes() as an engine task (needs no bank; same in-process and in workers)"""
+    return extract_bytes(data, None, profile)
+
+
+def localize_frames(bank: FeatureBank, frames: list, profile: str = DEFAULT_PROFILE,
+                    expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    """localize_batch() with a "timing" block for the whole burst"""
+    deadline = deadline_at(expires)
+    with collect() as timer:
+        result = localize_batch(frames, bank, profile, deadline, region, sensors)
+    result["timing"] = timer.to_dict()
+    return result
+
+
+# =========================================================
+# WORKER PROCESS SIDE
+# =========================================================
+_worker_banks: Optional[BankRegistry] = None
+_worker_handles: Dict[str, str] = {}      # building → key of the attached export
+
+
+def _init_worker(cv_threads: int, budget_bytes: int):
+    global _worker_banks
+    cv2.setNumThreads(cv_threads)
+    thread_orb(ORB_FEATURES)   # warm extractor for the full tier
+    _worker_banks = BankRegistry(budget_bytes)
+
+
+def _worker_bank(handle: BankHandle) -> FeatureBank:
+    """Attached bank for handle; re-attaches if the API process reloaded it"""
+    if _worker_handles.get(handle.building) != handle.key:
+        _worker_banks.add(handle.building, partial(FeatureBank.attach, handle))
+        _worker_handles[handle.building] = handle.key
+    return _worker_banks.get(handle.building)
+
+
+def _worker_localize(handle: BankHandle, data: bytes, prior=None, profile: str = DEFAULT_PROFILE,
+                     expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    return localize_bytes(_worker_bank(handle), data, None, prior, profile, expires, region, sensors)
+
+
+def _worker_localize_batch(handle: BankHandle, frames: list, profile: str = DEFAULT_PROFILE,
+                           expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    return localize_frames(_worker_bank(handle), frames, profile, expires, region, sensors)
+
+
+def _worker_localize_extracted(handle: BankHandle, features: tuple, profile: str = DEFAULT_PROFILE,
+                               expires: Optional[float] = None, region=None, sensors=None) -> dict:
+    return localize_extracted(_worker_bank(handle), features, profile, expires, region, sensors)
+
+
+def _worker_localize_client_features(handle: BankHandle, features: tuple, prior=None,
+                                     profile: str = DEFAULT_PROFILE, expires: Optional[float] = None,
+                                     region=None, sensors=None) -> dict:
+    return localize_client_features(_worker_bank(handle), features, prior, profile, expires,
+                                    region, sensors)
+
+
+def _queued_call(fn, target, submitted: float, tiled: bool, *args) -> dict:
+    """Runs fn in the executor and reports how long it waited for a slot"""
+    queue_ms = max(0.0, (time.time() - submitted) * 1e3)
+    with tiled_extraction(tiled):
+        result = fn(target, *args)
+    if "timing" in result:
+        result["timing"]["queue_ms"] = round(queue_ms, 2)
+    return result
+
+
+# =========================================================
+# ENGINE (API PROCESS SIDE)
+# =========================================================
+
+class LocalizationEngine:
+    """Dispatches localization requests to the registered banks"""
+
+    def __init__(
+        self,
+        registry: BankRegistry = banks,
+        workers: int = WORKERS,
+        cv_threads: int = CV_THREADS,
+        threads: int = THREADS,
+        queue_depth: int = QUEUE_DEPTH,
+    ):
+        self.registry = registry
+        self.workers = workers
+        self.cv_threads = cv_threads
+        self.slots = workers if workers > 0 else max(1, threads)
+        self.queue_depth = queue_depth
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+
+        # Admission state (touched only from the event loop)
+        self.in_flight = 0
+        self.rejected = 0
+        self._compute_ms = 500.0   # moving average, for Retry-After
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.registry
+
+    def start(self):
+        """Spawn the workers (no-op when in-process); banks attach lazily"""
+        if self.workers <= 0 or self._pool is not None:
+            return
+        if SHARDS > 1:
+            # Shard processes serve the API process only; spawning a set per
+            # worker would multiply processes by the worker count
+            print(f"⚠️ MAPMATE_MATCH_SHARDS={SHARDS} is ignored with MAPMATE_LOCALIZE_WORKERS={self.workers}: "
+                  f"every worker matches its own unsharded index")
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.cv_threads, self.registry.budget_bytes),
+        )
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._threads is not None:
+            self._threads.shutdown(wait=True, cancel_futures=True)
+            self._threads = None
+        shutdown_shards()
+        self.registry.clear()
+
+    # -----------------------------
+    # Admission control
+    # -----------------------------
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.slots)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead should have drained"""
+        return max(1, math.ceil((self.queued + 1) * self._compute_ms / self.slots / 1000))
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "avg_compute_ms": round(self._compute_ms, 1),
+        }
+
+    def _tiled(self) -> bool:
+        """Idle cores for every in-flight request to extract on TILE_THREADS threads"""
+        return TILE_THREADS > 1 and self.in_flight * TILE_THREADS <= CPU_COUNT
+
+    def _executor(self):
+        if self.workers > 0:
+            self.start()
+            return self._pool
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="localize")
+        return self._threads
+
+    def _prepare(self, building: str):
+        """
+        The bank, loaded if needed, or its shared handle when localizing on
+        workers (blocking: disk reads and the shared-memory copy)
+        """
+        bank = self.registry.get(building)
+        return bank.share() if self.workers > 0 else bank
+
+    async def _run(self, building: Optional[str], local_fn, worker_fn, *args) -> dict:
+        """
+        Runs one request on a worker/thread, never on the event loop
+        building=None runs a task that needs no bank (it receives None).
+        Raises EngineOverloaded when all slots are busy and the queue is full.
+        """
+        if self.in_flight >= self.slots + self.queue_depth:
+            self.rejected += 1
+            raise EngineOverloaded(self.retry_after())
+
+        self.in_flight += 1
+        if building is not None:
+            # The pin keeps the bank (and its shared memory) alive until the
+            # worker has finished with it
+            self.registry.pin(building)
+        try:
+            target = None
+            if building is not None:
+                target = await asyncio.to_thread(self._prepare, building)
+            fn = worker_fn if self.workers > 0 else local_fn
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor(), _queued_call, fn, target, time.time(), self._tiled(), *args
+            )
+        finally:
+            if building is not None:
+                self.registry.unpin(building)
+            self.in_flight -= 1
+
+        if "timing" in result:
+            self._compute_ms = 0.9 * self._compute_ms + 0.1 * result["timing"]["total_ms"]
+        return result
+
+    async def localize(self, building: str, data: bytes, prior=None, profile: str = DEFAULT_PROFILE,
+                       budget_ms: float = BUDGET_MS, region=None, sensors=None) -> dict:
+        """budget_ms runs from now, so time spent waiting for a slot counts"""
+        return await self._run(
+            building, _local_localize, _worker_localize,
+            data, prior, profile, expires_after(budget_ms), region, sensors,
+        )
+
+    async def localize_client_features(self, building: str, features: tuple, prior=None,
+                                       profile: str = DEFAULT_PROFILE, budget_ms: float = BUDGET_MS,
+                                       region=None, sensors=None) -> dict:
+        """features: (kp_xy, descriptors, (w, h)) from features.decode_features"""
+        return await self._run(
+            building, localize_client_features, _worker_localize_client_features,
+            features, prior, profile, expires_after(budget_ms), region, sensors,
+        )
+
+    async def localize_batch(self, building: str, frames: list, profile: str = DEFAULT_PROFILE,
+                             budget_ms: float = BUDGET_MS, region=None, sensors=None) -> dict:
+        """A burst of frames runs as ONE task (one decode/ORB fan-out, one match pass per tier)"""
+        return await self._run(
+            building, localize_frames, _worker_localize_batch,
+            frames, profile, expires_after(budget_ms), region, sensors,
+        )
+
+    async def localize_auto(self, data: bytes, profile: str = DEFAULT_PROFILE,
+                            budget_ms: float = BUDGET_MS, region=None, sensors=None) -> dict:
+        """
+        Localize without knowing the building
+        One decode + ORB extraction ranks the buildings; the same features
+        are matched against the top candidates until one yields a pose.
+        The result names the building found ("detected") and the candidates.
+        """
+        expires = expires_after(budget_ms)
+        extracted = await self._run(None, _extract, _extract, data, profile)
+        timings = [extracted.pop("timing")]
+        if not extracted["success"]:
+            extracted["timing"] = timings[0]
+            return extracted
+
+        # Ranking needs only the tree (loaded at startup): off the loop, no slot
+        candidates, rank_timing = await asyncio.to_thread(rank_candidates, extracted["features"][1])
+        timings.append(rank_timing)
+        candidates = [name for name in candidates if name in self.registry]
+        result = {"success": False, "reason": "Building not recognized"}
+        for name in candidates:
+            if expires is not None and time.time() >= expires and name != candidates[0]:
+                break
+            attempt = await self._run(
+                name, localize_extracted, _worker_localize_extracted,
+                extracted["features"], profile, expires, region, sensors,
+            )
+            timings.append(attempt.pop("timing"))
+            if attempt["success"]:
+                result = {**attempt, "detected": name}
+                break
+
+        result["candidates"] = candidates
+        result["timing"] = merge_timing(*timings)
+        return result
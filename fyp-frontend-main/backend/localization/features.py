@@ -0,0 +1,72 @@
+"""
+features.py
+---------------------------------
+Compact binary payload of client-computed ORB features
+
+Layout (little endian):
+    magic        4 bytes   b"MMFT"
+    version      uint16    FEATURES_VERSION
+    reserved     uint16    0
+    width        uint16    size of the image the keypoints were found in (px)
+    height       uint16
+    count        uint32    number of keypoints N
+    keypoints    N × 2 float32   (x, y) in image pixels
+    descriptors  N × 32 uint8    ORB (rBRIEF, 256 bits)
+
+4000 features are 144 KB, 1000 features 36 KB (vs ~0.3–1 MB for a JPEG
+frame), and the server skips decoding and ORB entirely.
+"""
+
+import struct
+from typing import Tuple
+
+import numpy as np
+
+FEATURES_MAGIC = b"MMFT"
+FEATURES_VERSION = 1
+MAX_FEATURES = 10000
+DESCRIPTOR_BYTES = 32
+
+_HEADER = struct.Struct("<4sHHHHI")
+
+
+class InvalidFeatures(ValueError):
+    """Raised when a feature payload cannot be parsed"""
+
+
+def encode_features(kp_xy: np.ndarray, descriptors: np.ndarray, image_size: Tuple[int, int]) -> bytes:
+    """Payload for (N, 2) keypoints, (N, 32) descriptors and (w, h) (clients, tests)"""
+    kp_xy = np.ascontiguousarray(kp_xy, "<f4").reshape(-1, 2)
+    descriptors = np.ascontiguousarray(descriptors, np.uint8).reshape(-1, DESCRIPTOR_BYTES)
+    w, h = image_size
+    header = _HEADER.pack(FEATURES_MAGIC, FEATURES_VERSION, 0, w, h, len(kp_xy))
+    return header + kp_xy.tobytes() + descriptors.tobytes()
+
+
+def decode_features(data: bytes) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """
+    Parses a payload without copying the arrays
+    Returns (kp_xy (N, 2) float32, descriptors (N, 32) uint8, (w, h));
+    raises InvalidFeatures with a client-facing reason
+    """
+    if len(data) < _HEADER.size:
+        raise InvalidFeatures("Feature payload too short")
+    magic, version, _, w, h, n = _HEADER.unpack_from(data)
+    if magic != FEATURES_MAGIC:
+        raise InvalidFeatures("Not a feature payload (bad magic)")
+    if version != FEATURES_VERSION:
+        raise InvalidFeatures(f"Unsupported feature payload version {version} (expected {FEATURES_VERSION})")
+    if n > MAX_FEATURES:
+        raise InvalidFeatures(f"At most {MAX_FEATURES} features per payload")
+    if w == 0 or h == 0:
+        raise InvalidFeatures("Image size must be positive")
+
+    expected = _HEADER.size + n * (8 + DESCRIPTOR_BYTES)
+    if len(data) != expected:
+        raise InvalidFeatures(f"Feature payload is {len(data)} bytes, expected {expected} for {n} features")
+
+    kp_xy = np.frombuffer(data, "<f4", n * 2, _HEADER.size).reshape(n, 2)
+    descriptors = np.frombuffer(data, np.uint8, n * DESCRIPTOR_BYTES, _HEADER.size + n * 8).reshape(n, DESCRIPTOR_BYTES)
+    if not np.isfinite(kp_xy).all():
+        raise InvalidFeatures("Keypoint coordinates must be finite")
+    return kp_xy.astype(np.float32, copy=False), descriptors, (w, h)
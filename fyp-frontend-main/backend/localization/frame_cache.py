@@ -0,0 +1,102 @@
+"""
+frame_cache.py
+---------------------------------
+Near-duplicate frame cache for /localize/
+AR clients resend almost the same frame while the user stands still.
+Frames are keyed by building + a 64-bit perceptual hash (DCT of a
+32×32 gray thumbnail); a frame within HASH_TOLERANCE bits of a recent
+one reuses its result instead of running ORB + matching + PnP again.
+
+MAPMATE_FRAME_CACHE_BITS     Hamming tolerance in bits (default 4; 0 = exact hash only)
+MAPMATE_FRAME_CACHE_TTL_S    Seconds a result stays reusable (default 2)
+MAPMATE_FRAME_CACHE_SIZE     Entries kept, LRU (default 512; 0 disables the cache)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+HASH_TOLERANCE = int(os.environ.get("MAPMATE_FRAME_CACHE_BITS", "4"))
+CACHE_TTL_S = float(os.environ.get("MAPMATE_FRAME_CACHE_TTL_S", "2"))
+CACHE_SIZE = int(os.environ.get("MAPMATE_FRAME_CACHE_SIZE", "512"))
+
+THUMB_SIZE = 32   # DCT input
+HASH_BLOCK = 8    # low-frequency block → 64 bits
+
+
+def perceptual_hash(data: bytes) -> Optional[int]:
+    """64-bit pHash of an encoded frame (decoded at 1/8 scale), None if unreadable"""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None or img.size == 0:
+        return None
+    thumb = cv2.resize(img, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)
+    coeffs = cv2.dct(thumb.astype(np.float32))[:HASH_BLOCK, :HASH_BLOCK].ravel()
+    # Skip the DC term: it only encodes overall brightness
+    bits = coeffs > np.median(coeffs[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class FrameCache:
+    """(building, pHash) → result, with Hamming tolerance, TTL and LRU bound"""
+
+    def __init__(self, tolerance: int = HASH_TOLERANCE, ttl_s: float = CACHE_TTL_S, max_entries: int = CACHE_SIZE):
+        self.tolerance = tolerance
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (building, hash) → (result, stored)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, building: str, frame_hash: Optional[int]) -> Optional[dict]:
+        """Result of a near-duplicate frame of this building, or None"""
+        if not self.enabled or frame_hash is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            hit = None
+            # Newest first: the most recent near-duplicate is the best match
+            for key in reversed(list(self._entries)):
+                result, stored = self._entries[key]
+                if now - stored > self.ttl_s:
+                    del self._entries[key]
+                    continue
+                if hit is None and key[0] == building and (key[1] ^ frame_hash).bit_count() <= self.tolerance:
+                    hit = key
+            if hit is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(hit)
+            self.hits += 1
+            return self._entries[hit][0]
+
+    def put(self, building: str, frame_hash: Optional[int], result: dict):
+        if not self.enabled or frame_hash is None:
+            return
+        with self._lock:
+            self._entries[(building, frame_hash)] = (result, time.monotonic())
+            self._entries.move_to_end((building, frame_hash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "tolerance_bits": self.tolerance,
+                "ttl_s": self.ttl_s,
+                "max_entries": self.max_entries,
+            }
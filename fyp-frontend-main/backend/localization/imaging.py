@@ -0,0 +1,165 @@
+"""
+imaging.py
+---------------------------------
+In-memory image intake for the localization endpoints
+- Bounded, chunked reads of uploaded files (size cap enforced while streaming)
+- cv2.imdecode straight from the upload buffer (no temp files)
+- Resolution-aware decode: large photos are decoded at a reduced scale
+  (IMREAD_REDUCED_GRAYSCALE_*) and bounded to a target long edge
+- Camera intrinsics rescaled to the decoded frame size
+"""
+
+import os
+import struct
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+# Upload size cap (MB); frames above this are rejected with 413
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAPMATE_MAX_UPLOAD_MB", "15")) * 1024 * 1024)
+
+READ_CHUNK_BYTES = 256 * 1024
+
+# Frames are decoded/downscaled so their long edge is at most this (px)
+TARGET_LONG_EDGE = int(os.environ.get("MAPMATE_TARGET_LONG_EDGE", "1280"))
+
+# libjpeg can decode directly at 1/2, 1/4 and 1/8 scale
+_REDUCED_GRAYSCALE = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+
+# JPEG start-of-frame markers (baseline, progressive, ...) carrying the size
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size cap"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Image exceeds {limit / (1024 * 1024):g} MB upload limit")
+        self.limit = limit
+
+
+async def read_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Reads an UploadFile into memory in fixed-size chunks.
+    Stops as soon as the cap is exceeded instead of buffering the whole body.
+    """
+    declared = getattr(upload, "size", None)
+    if declared is not None and declared > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    buf = bytearray()
+    while True:
+        chunk = await upload.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        if len(buf) + len(chunk) > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        buf += chunk
+    return bytes(buf)
+
+
+def decode_image(data: bytes, flags: int = cv2.IMREAD_GRAYSCALE) -> Optional[np.ndarray]:
+    """Decodes JPEG/PNG bytes held in memory; None if not an image"""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+
+
+def encoded_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) read from a JPEG/PNG header without decoding, or None"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:                    # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2                            # markers without a length
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in _JPEG_SOF:
+            h, w = struct.unpack(">HH", data[i + 5:i + 9])
+            return w, h
+        i += 2 + length
+    return None
+
+
+def decode_frame(data: bytes, long_edge: int = TARGET_LONG_EDGE) -> Optional[np.ndarray]:
+    """
+    Decodes an uploaded frame to grayscale with its long edge <= long_edge
+    The JPEG header is read first so a 12 MP photo is decoded straight at
+    1/2, 1/4 or 1/8 scale instead of at full resolution.
+    """
+    flags = cv2.IMREAD_GRAYSCALE
+    size = encoded_size(data) if data else None
+    if size is not None and long_edge > 0:
+        for factor, reduced in _REDUCED_GRAYSCALE.items():
+            if max(size) // factor >= long_edge:
+                flags = reduced
+                break
+
+    gray = decode_image(data, flags)
+    if gray is None or long_edge <= 0:
+        return gray
+
+    h, w = gray.shape[:2]
+    if max(w, h) > long_edge:
+        s = long_edge / max(w, h)
+        gray = cv2.resize(gray, (round(w * s), round(h * s)), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def scale_intrinsics(camera_matrix: np.ndarray, calib_size, image_size) -> np.ndarray:
+    """
+    Intrinsics of a camera calibrated at calib_size, for a frame of image_size
+    - portrait frames use the calibration rotated to portrait
+    - focal length scales with the long edge
+    - a different aspect ratio is treated as a centred crop of the sensor
+    """
+    K = np.array(camera_matrix, dtype=np.float64)
+    cw, ch = calib_size
+    w, h = image_size
+
+    if (w >= h) != (cw >= ch):
+        K[[0, 1], [0, 1]] = K[[1, 0], [1, 0]]     # fx <-> fy
+        K[[0, 1], 2] = K[[1, 0], 2]               # cx <-> cy
+        cw, ch = ch, cw
+
+    s = max(w, h) / max(cw, ch)
+    K[:2, :] *= s
+    K[0, 2] += (w - cw * s) / 2
+    K[1, 2] += (h - ch * s) / 2
+    K[2] = [0, 0, 1]
+    return K
+
+
+def to_gray(image: Union[np.ndarray, str, Path]) -> Optional[np.ndarray]:
+    """
+    Normalizes localizer input to a grayscale frame
+    Accepts a decoded ndarray (gray or BGR) or, for scripts, an image path.
+    """
+    if isinstance(image, (str, Path)):
+        return decode_frame(Path(image).read_bytes()) if Path(image).exists() else None
+    if image is None or image.size == 0:
+        return None
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    h, w = image.shape[:2]
+    if max(w, h) > TARGET_LONG_EDGE > 0:
+        s = TARGET_LONG_EDGE / max(w, h)
+        image = cv2.resize(image, (round(w * s), round(h * s)), interpolation=cv2.INTER_AREA)
+    return image
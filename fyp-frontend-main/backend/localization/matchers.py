@@ -0,0 +1,366 @@
+"""
+matchers.py
+---------------------------------
+Persistent descriptor indexes for ORB feature banks
+Backends:
+- bruteforce : exact Hamming search (cross-check, or kNN + ratio test)
+- flann_lsh  : FLANN locality-sensitive hashing, kNN + ratio test
+- mih        : multi-index hashing over 16-bit descriptor substrings
+
+An index is built ONCE per bank (at load time) and reused for every query.
+"""
+
+from typing import NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+# =========================================================
+# MATCH RESULT
+# =========================================================
+
+class Matches(NamedTuple):
+    """Query → bank correspondences as parallel arrays"""
+    query_idx: np.ndarray   # (M,) int32, row in the query descriptors
+    train_idx: np.ndarray   # (M,) int32, row in the bank
+    distance: np.ndarray    # (M,) float32, Hamming distance
+
+    def __len__(self) -> int:
+        return len(self.query_idx)
+
+    def best(self, n: int) -> "Matches":
+        """The n lowest-distance matches, sorted by distance"""
+        order = np.argsort(self.distance, kind="stable")[:n]
+        return Matches(self.query_idx[order], self.train_idx[order], self.distance[order])
+
+
+def split_matches(matches: Matches, offsets: np.ndarray) -> list:
+    """
+    Splits matches of concatenated query frames back per frame
+    offsets: (K+1,) start row of every frame in the concatenation
+    """
+    order = np.argsort(matches.query_idx, kind="stable")
+    q, t, d = matches.query_idx[order], matches.train_idx[order], matches.distance[order]
+    bounds = np.searchsorted(q, offsets)
+    return [
+        Matches(q[a:b] - offsets[i], t[a:b], d[a:b])
+        for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+
+
+EMPTY_MATCHES = Matches(
+    np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32)
+)
+
+
+def merge_matches(parts: list) -> Matches:
+    """Union of matches against disjoint parts of a bank, nearest bank point per query"""
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return EMPTY_MATCHES
+    q = np.concatenate([p.query_idx for p in parts])
+    t = np.concatenate([p.train_idx for p in parts])
+    d = np.concatenate([p.distance for p in parts])
+    order = np.lexsort((d, q))
+    first = order[np.r_[True, q[order][1:] != q[order][:-1]]]
+    return Matches(q[first], t[first], d[first])
+
+
+def one_to_one(m: Matches) -> Matches:
+    """Keeps the best query per bank point (forward 1-NN → cross-check superset)"""
+    if len(m) == 0:
+        return m
+    order = np.lexsort((m.distance, m.train_idx))
+    first = np.r_[True, m.train_idx[order][1:] != m.train_idx[order][:-1]]
+    keep = order[first]
+    return Matches(m.query_idx[keep], m.train_idx[keep], m.distance[keep])
+
+
+def _from_dmatches(dmatches) -> Matches:
+    if not dmatches:
+        return EMPTY_MATCHES
+    return Matches(
+        np.fromiter((m.queryIdx for m in dmatches), np.int32, len(dmatches)),
+        np.fromiter((m.trainIdx for m in dmatches), np.int32, len(dmatches)),
+        np.fromiter((m.distance for m in dmatches), np.float32, len(dmatches)),
+    )
+
+
+def _ratio_test(knn, ratio: float) -> Matches:
+    """Lowe's ratio test over cv2 kNN output (rows may hold < 2 neighbours)"""
+    good = [
+        pair[0] for pair in knn
+        if len(pair) == 1 or (len(pair) >= 2 and pair[0].distance < ratio * pair[1].distance)
+    ]
+    return _from_dmatches(good)
+
+
+# =========================================================
+# HAMMING HELPERS
+# =========================================================
+
+# Number of set bits for every byte value
+POPCOUNT_TABLE = np.unpackbits(
+    np.arange(256, dtype=np.uint8)[:, None], axis=1
+).sum(axis=1).astype(np.uint16)
+
+
+def hamming_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise Hamming distance between two (M, 32) uint8 arrays"""
+    return POPCOUNT_TABLE[np.bitwise_xor(a, b)].sum(axis=1)
+
+
+def expand_ranges(lo: np.ndarray, counts: np.ndarray):
+    """
+    Flattens per-row [lo, lo + count) ranges
+    Returns (row of every element, position of every element)
+    """
+    total = int(counts.sum())
+    rows = np.repeat(np.arange(len(lo), dtype=np.int32), counts)
+    starts = np.repeat(lo, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, starts + offsets
+
+
+def best_per_query(q_idx, t_idx, dist, ratio: float, max_distance: int) -> "Matches":
+    """Nearest candidate per query with Lowe's ratio test over candidate pairs"""
+    order = np.lexsort((dist, q_idx))
+    q_idx, t_idx, dist = q_idx[order], t_idx[order], dist[order]
+
+    first = np.flatnonzero(np.r_[True, q_idx[1:] != q_idx[:-1]])
+    has_second = np.r_[first[1:] - first[:-1] > 1, len(q_idx) - first[-1] > 1]
+    second_dist = np.where(has_second, dist[np.minimum(first + 1, len(dist) - 1)], np.inf)
+
+    best = dist[first]
+    keep = (best <= max_distance) & (best < ratio * second_dist)
+    sel = first[keep]
+    return Matches(q_idx[sel], t_idx[sel], dist[sel].astype(np.float32))
+
+
+def guided_match(
+    query_xy: np.ndarray,
+    query_des: np.ndarray,
+    train_xy: np.ndarray,
+    train_des: np.ndarray,
+    radius: float,
+    ratio: float = 0.8,
+    max_distance: int = 64,
+) -> "Matches":
+    """
+    Matches each query only against train rows predicted within `radius` px
+    (train_xy = projection of the bank under a pose prior).
+    Uses a uniform grid of radius-sized cells; cost ∝ local density, not bank size.
+    """
+    if len(query_xy) == 0 or len(train_xy) == 0:
+        return EMPTY_MATCHES
+
+    origin = np.minimum(query_xy.min(axis=0), train_xy.min(axis=0)) - radius
+    cols = int((max(query_xy[:, 0].max(), train_xy[:, 0].max()) - origin[0]) // radius) + 3
+
+    t_cell = ((train_xy - origin) // radius).astype(np.int64)
+    t_key = t_cell[:, 1] * cols + t_cell[:, 0]
+    t_order = np.argsort(t_key, kind="stable")
+    t_sorted = t_key[t_order]
+
+    q_cell = ((query_xy - origin) // radius).astype(np.int64)
+    q_all, t_all = [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            key = (q_cell[:, 1] + dy) * cols + (q_cell[:, 0] + dx)
+            lo = np.searchsorted(t_sorted, key, side="left")
+            hi = np.searchsorted(t_sorted, key, side="right")
+            rows, pos = expand_ranges(lo, hi - lo)
+            q_all.append(rows)
+            t_all.append(t_order[pos])
+
+    q_idx = np.concatenate(q_all)
+    t_idx = np.concatenate(t_all).astype(np.int32)
+    near = np.linalg.norm(query_xy[q_idx] - train_xy[t_idx], axis=1) < radius
+    q_idx, t_idx = q_idx[near], t_idx[near]
+    if len(q_idx) == 0:
+        return EMPTY_MATCHES
+
+    dist = hamming_distance(query_des[q_idx], train_des[t_idx])
+    return best_per_query(q_idx, t_idx, dist, ratio, max_distance)
+
+
+# =========================================================
+# INDEX BACKENDS
+# =========================================================
+
+class DescriptorIndex:
+    """Base class: holds a bank and answers nearest-neighbour queries"""
+
+    name = "base"
+
+    def __init__(self, descriptors: np.ndarray):
+        self.descriptors = np.ascontiguousarray(descriptors, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.descriptors)
+
+    def match(self, query: np.ndarray) -> Matches:
+        raise NotImplementedError
+
+    def match_many(self, queries: list) -> list:
+        """
+        Matches several query frames in ONE pass over the index
+        (queries are concatenated, results split back per frame)
+        """
+        offsets = np.cumsum([0] + [len(q) for q in queries])
+        matches = self.match(np.vstack(queries))
+        return split_matches(matches, offsets)
+
+
+class BruteForceIndex(DescriptorIndex):
+    """
+    Exact Hamming search.
+    ratio=None keeps the original cross-checked behaviour,
+    otherwise kNN (k=2) with Lowe's ratio test.
+    """
+
+    name = "bruteforce"
+
+    def __init__(self, descriptors: np.ndarray, ratio: Optional[float] = None):
+        super().__init__(descriptors)
+        self.ratio = ratio
+        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=ratio is None)
+        self.forward = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+
+    def match(self, query: np.ndarray) -> Matches:
+        if self.ratio is None:
+            return _from_dmatches(self.matcher.match(query, self.descriptors))
+        knn = self.matcher.knnMatch(query, self.descriptors, k=2)
+        return _ratio_test(knn, self.ratio)
+
+    def forward_match(self, query: np.ndarray) -> Matches:
+        """Nearest bank point of every query descriptor (no cross-check)"""
+        return _from_dmatches(self.forward.match(query, self.descriptors))
+
+    def match_many(self, queries: list) -> list:
+        if self.ratio is not None:
+            return super().match_many(queries)
+
+        # Cross-checking the concatenation would let frames steal bank points
+        # from each other. Instead: one batched forward 1-NN pass, then keep
+        # a one-to-one assignment (best query per bank point) inside each frame,
+        # which is a superset of that frame's cross-checked matches.
+        offsets = np.cumsum([0] + [len(q) for q in queries])
+        per_frame = split_matches(self.forward_match(np.vstack(queries)), offsets)
+        return [one_to_one(m) for m in per_frame]
+
+
+class FlannLshIndex(DescriptorIndex):
+    """Approximate search with FLANN's LSH tables, kNN + ratio test"""
+
+    name = "flann_lsh"
+
+    def __init__(
+        self,
+        descriptors: np.ndarray,
+        ratio: float = 0.8,
+        table_number: int = 12,
+        key_size: int = 20,
+        multi_probe_level: int = 2,
+        checks: int = 64,
+    ):
+        super().__init__(descriptors)
+        self.ratio = ratio
+        index_params = dict(
+            algorithm=6,  # FLANN_INDEX_LSH
+            table_number=table_number,
+            key_size=key_size,
+            multi_probe_level=multi_probe_level,
+        )
+        self.matcher = cv2.FlannBasedMatcher(index_params, dict(checks=checks))
+        self.matcher.add([self.descriptors])
+        self.matcher.train()
+
+    def match(self, query: np.ndarray) -> Matches:
+        knn = self.matcher.knnMatch(query, k=2)
+        return _ratio_test(knn, self.ratio)
+
+
+def mih_tables(descriptors: np.ndarray) -> tuple:
+    """(order, sorted_keys) of multi-index hashing: bank rows sorted by each 16-bit substring"""
+    keys = np.ascontiguousarray(descriptors, dtype=np.uint8).view("<u2")    # (N, 16)
+    order = np.argsort(keys, axis=0, kind="stable").astype(np.int32)
+    return order, np.take_along_axis(keys, order, axis=0)
+
+
+class MultiIndexHashIndex(DescriptorIndex):
+    """
+    Multi-index hashing (Norouzi et al.)
+    The 256-bit descriptor is split into 16 disjoint 16-bit substrings,
+    each with its own hash table (a sorted key array). Any bank row that
+    agrees with the query on at least one substring becomes a candidate,
+    candidates are verified with exact Hamming distance.
+    tables: precomputed mih_tables() of the descriptors (e.g. from a bundle)
+    """
+
+    name = "mih"
+
+    def __init__(
+        self,
+        descriptors: np.ndarray,
+        ratio: float = 0.8,
+        max_distance: int = 64,
+        max_bucket: int = 64,
+        tables: Optional[tuple] = None,
+    ):
+        super().__init__(descriptors)
+        self.ratio = ratio
+        self.max_distance = max_distance
+        self.max_bucket = max_bucket
+
+        self.order, self.sorted_keys = tables if tables is not None else mih_tables(self.descriptors)
+
+    def _candidates(self, query: np.ndarray):
+        qkeys = np.ascontiguousarray(query, dtype=np.uint8).view("<u2")
+        q_all, t_all = [], []
+
+        for j in range(self.sorted_keys.shape[1]):
+            column = self.sorted_keys[:, j]
+            lo = np.searchsorted(column, qkeys[:, j], side="left")
+            hi = np.searchsorted(column, qkeys[:, j], side="right")
+            counts = hi - lo
+            counts[counts > self.max_bucket] = 0        # skip overfull buckets
+            total = int(counts.sum())
+            if total == 0:
+                continue
+
+            rows, pos = expand_ranges(lo, counts)
+            q_all.append(rows)
+            t_all.append(self.order[pos, j])
+
+        if not q_all:
+            return None, None
+
+        pairs = np.unique(
+            np.concatenate(q_all).astype(np.int64) * len(self.descriptors)
+            + np.concatenate(t_all)
+        )
+        return (pairs // len(self.descriptors)).astype(np.int32), (pairs % len(self.descriptors)).astype(np.int32)
+
+    def match(self, query: np.ndarray) -> Matches:
+        q_idx, t_idx = self._candidates(query)
+        if q_idx is None:
+            return EMPTY_MATCHES
+
+        dist = hamming_distance(query[q_idx], self.descriptors[t_idx])
+        return best_per_query(q_idx, t_idx, dist, self.ratio, self.max_distance)
+
+
+MATCHER_BACKENDS = {
+    cls.name: cls for cls in (BruteForceIndex, FlannLshIndex, MultiIndexHashIndex)
+}
+
+
+def build_index(backend: str, descriptors: np.ndarray, **options) -> DescriptorIndex:
+    """Build a persistent index over a descriptor bank"""
+    if backend not in MATCHER_BACKENDS:
+        raise ValueError(
+            f"Unknown matcher backend '{backend}' "
+            f"(expected one of: {', '.join(MATCHER_BACKENDS)})"
+        )
+    return MATCHER_BACKENDS[backend](descriptors, **options)
@@ -0,0 +1,699 @@
+"""
+pipeline.py
+---------------------------------
+Building-independent localization pipeline
+Uses:
+- ORB feature matching
+- 2D–3D correspondences
+- PnP for camera pose
+- Pre-aligned building → Campus transform (from the FeatureBank)
+
+Shared by every building (see buildings.py) and the worker pool.
+ORB extractors are per thread (thread_orb): created once, reused by
+every request that thread serves.
+Frames can be localized one at a time or as a batch (one match pass).
+"""
+
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from localization.bank import FeatureBank
+from localization.imaging import decode_frame
+from localization.matchers import Matches, guided_match
+from localization.quality import check_quality
+from localization.sensors import BUILDING_DOWN, HEADING_TOLERANCE_DEG, Sensors, camera_for, heading_direction
+from localization.solver import solve_pnp, solve_pnp_gravity
+from localization.timing import count, timed
+
+ORB_FEATURES = 4000
+
+# Tracking (frame-to-frame with a pose prior)
+TRACK_ORB_FEATURES = 1500
+TRACK_MARGIN_PX = 64        # bank points projecting this far outside the frame still count
+TRACK_RADIUS_PX = 40.0      # a match must land this close to its predicted position
+TRACK_MIN_VISIBLE = 100
+
+# Threads used to extract features of a batch in parallel (OpenCV releases the GIL)
+BATCH_THREADS = int(os.environ.get("MAPMATE_BATCH_THREADS", str(os.cpu_count() or 1)))
+
+# Tiled extraction of ONE frame on several threads (when the engine has idle cores)
+TILE_GRID = tuple(int(v) for v in os.environ.get("MAPMATE_ORB_TILES", "2x2").lower().split("x"))
+TILE_THREADS = int(os.environ.get("MAPMATE_TILE_THREADS", str(min(4, os.cpu_count() or 1))))
+TILE_OVERLAP_PX = 48        # tiles overlap so ORB's border margin leaves no seams
+MIN_TILE_PX = 200           # frames whose tiles would be smaller are extracted whole
+
+# Successful batch frames further than this (map px) from the median are not fused
+FUSE_RADIUS_PX = 25.0
+
+# Position prior: fewer visible points than this → match the whole bank
+MIN_REGION_POINTS = 200
+
+
+# =========================================================
+# QUALITY PROFILES (coarse-to-fine cascade)
+# =========================================================
+
+@dataclass(frozen=True)
+class Tier:
+    """One pass of the cascade"""
+    name: str
+    long_edge: int              # frame downscaled to this long edge (0 = as decoded)
+    orb_features: int
+    top_matches: int            # best matches handed to PnP
+    ransac_iterations: int
+    accept_confidence: float    # below this the next tier runs (ignored on the last)
+
+
+COARSE = Tier("coarse", 640, 1000, 100, 50, 0.35)
+FULL = Tier("full", 0, ORB_FEATURES, 200, 100, 0.0)
+ACCURATE = Tier("accurate", 0, 6000, 400, 300, 0.0)
+
+PROFILES = {
+    "fast": (COARSE,),
+    "balanced": (COARSE, FULL),
+    "accurate": (ACCURATE,),
+}
+DEFAULT_PROFILE = os.environ.get("MAPMATE_PROFILE", "balanced")
+
+# Created at import, so concurrent first requests cannot race to create
+# them; an executor only starts its threads on the first submit
+_batch_pool = ThreadPoolExecutor(max_workers=max(1, BATCH_THREADS), thread_name_prefix="batch-extract")
+_tile_pool = ThreadPoolExecutor(max_workers=max(1, TILE_THREADS), thread_name_prefix="orb-tile")
+_thread_state = threading.local()
+
+
+# =========================================================
+# STAGES
+# =========================================================
+
+def thread_orb(nfeatures: int = ORB_FEATURES) -> cv2.ORB:
+    """This thread's ORB extractor for nfeatures (created once per thread, then reused)"""
+    extractors = getattr(_thread_state, "orb", None)
+    if extractors is None:
+        extractors = _thread_state.orb = {}
+    orb = extractors.get(nfeatures)
+    if orb is None:
+        orb = extractors[nfeatures] = cv2.ORB_create(nfeatures=nfeatures)
+    return orb
+
+
+@contextmanager
+def tiled_extraction(enabled: bool = True):
+    """Inside the block, extract_features() on this thread splits frames into tiles"""
+    previous = getattr(_thread_state, "tiled", False)
+    _thread_state.tiled = enabled
+    try:
+        yield
+    finally:
+        _thread_state.tiled = previous
+
+
+def _tiles(h: int, w: int, grid: tuple) -> list:
+    """(window, core) per tile: window = core grown by the overlap, both (y0, y1, x0, x1)"""
+    rows, cols = grid
+    out = []
+    for r in range(rows):
+        for c in range(cols):
+            y0, y1 = h * r // rows, h * (r + 1) // rows
+            x0, x1 = w * c // cols, w * (c + 1) // cols
+            window = (
+                max(0, y0 - TILE_OVERLAP_PX), min(h, y1 + TILE_OVERLAP_PX),
+                max(0, x0 - TILE_OVERLAP_PX), min(w, x1 + TILE_OVERLAP_PX),
+            )
+            out.append((window, (y0, y1, x0, x1)))
+    return out
+
+
+def _extract_tile(gray: np.ndarray, window: tuple, core: tuple, quota: int):
+    """Features of one tile, in frame coordinates, only those inside its core"""
+    wy0, wy1, wx0, wx1 = window
+    kp, des = thread_orb(quota).detectAndCompute(gray[wy0:wy1, wx0:wx1], None)
+    if des is None:
+        return np.empty((0, 2), np.float32), np.empty((0, 32), np.uint8)
+    xy = cv2.KeyPoint_convert(kp) + np.float32((wx0, wy0))
+    y0, y1, x0, x1 = core
+    inside = (xy[:, 0] >= x0) & (xy[:, 0] < x1) & (xy[:, 1] >= y0) & (xy[:, 1] < y1)
+    return xy[inside], des[inside]
+
+
+def extract_tiled(gray: np.ndarray, nfeatures: int, grid: tuple = TILE_GRID):
+    """
+    ORB over overlapping tiles on TILE_THREADS threads (OpenCV releases the GIL)
+    Each tile gets an equal share of nfeatures, so coverage stays even;
+    overlap keypoints are kept by the tile whose core holds them.
+    """
+    h, w = gray.shape[:2]
+    tiles = _tiles(h, w, grid)
+    quota = math.ceil(nfeatures / len(tiles))
+    parts = list(_tile_pool.map(lambda t: _extract_tile(gray, t[0], t[1], quota), tiles))
+    count("tiles", len(tiles))
+    return np.vstack([p[0] for p in parts]), np.vstack([p[1] for p in parts])
+
+
+def _tileable(gray: np.ndarray) -> bool:
+    if not getattr(_thread_state, "tiled", False) or TILE_THREADS <= 1:
+        return False
+    rows, cols = TILE_GRID
+    h, w = gray.shape[:2]
+    return rows * cols > 1 and h // rows >= MIN_TILE_PX and w // cols >= MIN_TILE_PX
+
+
+def extract_features(gray: np.ndarray, orb: Optional[cv2.ORB] = None):
+    """
+    ORB keypoints + descriptors (tiled on several threads inside tiled_extraction())
+    Returns (kp_xy (N, 2) float32, descriptors (N, 32) uint8), or (None, None)
+    """
+    if orb is None:
+        orb = thread_orb()
+    with timed("orb"):
+        if _tileable(gray):
+            kp_xy, des2d = extract_tiled(gray, orb.getMaxFeatures())
+        else:
+            kp2d, des2d = orb.detectAndCompute(gray, None)
+            kp_xy = cv2.KeyPoint_convert(kp2d) if des2d is not None else None
+    n = 0 if des2d is None else len(des2d)
+    count("keypoints", n)
+
+    if n < 30:
+        return None, None
+    return kp_xy, des2d
+
+
+def solve_pose(
+    kp_xy: np.ndarray,
+    matches: Matches,
+    bank: FeatureBank,
+    camera_matrix: np.ndarray,
+    top_matches: int = 200,
+    ransac_iterations_max: int = 100,
+    deadline: Optional[float] = None,
+    dist_coeffs: Optional[np.ndarray] = None,
+    sensors: Optional[Sensors] = None,
+) -> dict:
+    """
+    Correspondences → PnP → campus map coordinates
+    deadline (time.monotonic()) bounds the solver; the best pose found by
+    then is returned
+    dist_coeffs: distortion of camera_matrix (default: the building's)
+    sensors: with a gravity vector the 4-DoF gravity-aligned solver runs
+             first (heading, if any, discards hypotheses facing elsewhere);
+             the full 6-DoF solver is the fallback if it finds no pose
+    """
+
+    if len(matches) < bank.thresholds.min_matches:
+        return {"success": False, "reason": "Not enough matches"}
+
+    # Sort by quality
+    matches = matches.best(top_matches)
+
+    # -----------------------------
+    # Build 2D–3D correspondences
+    # -----------------------------
+    pts_2d = np.asarray(kp_xy[matches.query_idx], np.float32)
+    pts_3d = np.asarray(bank.points[matches.train_idx], np.float32)
+
+    # -----------------------------
+    # Solve PnP (Camera pose)
+    # -----------------------------
+    dist = bank.dist_coeffs if dist_coeffs is None else dist_coeffs
+    pose = None
+    if sensors is not None and sensors.gravity is not None:
+        forward = None
+        if sensors.heading is not None:
+            forward = heading_direction(sensors.heading, bank.transform_matrix)
+        pose = solve_pnp_gravity(
+            pts_3d, pts_2d, camera_matrix, dist, sensors.gravity, BUILDING_DOWN,
+            ransac_iterations_max, deadline, forward, HEADING_TOLERANCE_DEG,
+            bank.thresholds.min_inliers,
+        )
+        if pose is None or len(pose.inliers) < bank.thresholds.min_inliers:
+            count("gravity_fallback", 1)   # bad sensor reading: solve without it
+            pose = None
+    if pose is None:
+        pose = solve_pnp(
+            pts_3d, pts_2d, camera_matrix, dist,
+            max_iterations=ransac_iterations_max, deadline=deadline,
+        )
+    n_inliers = 0 if pose is None else len(pose.inliers)
+    count("inliers", n_inliers)
+
+    if n_inliers < bank.thresholds.min_inliers:
+        return {"success": False, "reason": "PnP failed"}
+
+    return pose_result(pose.rvec, pose.tvec, n_inliers, bank)
+
+
+def pose_result(rvec: np.ndarray, tvec: np.ndarray, n_inliers: int, bank: FeatureBank) -> dict:
+    """Camera pose → campus map coordinates + confidence"""
+    with timed("transform"):
+        return _pose_result(rvec, tvec, n_inliers, bank)
+
+
+def _pose_result(rvec: np.ndarray, tvec: np.ndarray, n_inliers: int, bank: FeatureBank) -> dict:
+
+    # -----------------------------
+    # Camera position in building frame
+    # -----------------------------
+    R_cam, _ = cv2.Rodrigues(rvec)
+    cam_pos = -R_cam.T @ tvec
+    cam_pos = cam_pos.flatten()
+
+    # Ground-plane assumption: use X,Z as 2D coordinates
+    x_b = cam_pos[0]
+    z_b = cam_pos[2]
+
+    # -----------------------------
+    # Transform → Campus map
+    # -----------------------------
+    pt_h = np.array([x_b, z_b, 1.0])                  # homogeneous
+    cam_map = bank.transform_matrix @ pt_h            # 2D affine
+
+    # -----------------------------
+    # Confidence score
+    # -----------------------------
+    confidence = min(1.0, n_inliers / bank.thresholds.full_confidence_inliers)
+
+    return {
+        "success": True,
+        "building": bank.building,
+        "map_x": float(cam_map[0]),
+        "map_y": float(cam_map[1]),
+        "confidence": float(confidence),
+        "pose": {
+            "rvec": [float(v) for v in np.ravel(rvec)],
+            "tvec": [float(v) for v in np.ravel(tvec)],
+        },
+    }
+
+
+def track_pose(kp_xy: np.ndarray, des2d: np.ndarray, bank: FeatureBank, prior, image_size,
+               sensors: Optional[Sensors] = None) -> dict:
+    """
+    Guided matching from the previous pose
+    - project the bank with the prior, keep points that land near the frame
+    - match only against those, gate by distance to the predicted position
+    - solvePnP seeded with the prior (no RANSAC)
+    sensors: client intrinsics, if any, replace the building's
+    """
+    rvec0 = np.asarray(prior[0], np.float64).reshape(3, 1)
+    tvec0 = np.asarray(prior[1], np.float64).reshape(3, 1)
+    w, h = image_size
+    K, dist = camera_for(bank, (w, h), sensors)
+
+    with timed("match"):
+        # -----------------------------
+        # Predict where the bank lands in this frame
+        # -----------------------------
+        R0, _ = cv2.Rodrigues(rvec0)
+        depth = bank.points @ R0[2] + tvec0[2, 0]
+        proj, _ = cv2.projectPoints(bank.points, rvec0, tvec0, K, dist)
+        proj = proj.reshape(-1, 2)
+
+        m = TRACK_MARGIN_PX
+        visible = np.flatnonzero(
+            (depth > 0)
+            & (proj[:, 0] > -m) & (proj[:, 0] < w + m)
+            & (proj[:, 1] > -m) & (proj[:, 1] < h + m)
+        )
+        if len(visible) < TRACK_MIN_VISIBLE:
+            return {"success": False, "reason": "Tracking lost"}
+
+        # -----------------------------
+        # Match each keypoint only against bank points predicted nearby
+        # -----------------------------
+        matches = guided_match(
+            kp_xy, des2d, proj[visible], bank.descriptors[visible], TRACK_RADIUS_PX
+        )
+    q, t = matches.query_idx, visible[matches.train_idx]
+    count("matches", len(q))
+    min_inliers = bank.thresholds.min_inliers
+    if len(q) < min_inliers:
+        return {"success": False, "reason": "Tracking lost"}
+
+    pts_2d = np.asarray(kp_xy[q], np.float32)
+    pts_3d = np.asarray(bank.points[t], np.float32)
+
+    # -----------------------------
+    # Pose refinement seeded with the prior
+    # -----------------------------
+    rvec, tvec = rvec0.copy(), tvec0.copy()
+    inliers = np.ones(len(q), bool)
+    with timed("pnp"):
+        for _ in range(2):
+            ok, rvec, tvec = cv2.solvePnP(
+                pts_3d[inliers], pts_2d[inliers],
+                K, dist,
+                rvec, tvec, useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE,
+            )
+            if not ok:
+                return {"success": False, "reason": "Tracking lost"}
+            reproj, _ = cv2.projectPoints(pts_3d, rvec, tvec, K, dist)
+            inliers = np.linalg.norm(reproj.reshape(-1, 2) - pts_2d, axis=1) < 8.0
+            if inliers.sum() < min_inliers:
+                return {"success": False, "reason": "Tracking lost"}
+    count("inliers", int(inliers.sum()))
+
+    result = pose_result(rvec, tvec, int(inliers.sum()), bank)
+    result["tracking"] = "tracked"
+    return result
+
+
+# =========================================================
+# SINGLE FRAME
+# =========================================================
+
+def tier_features(gray: np.ndarray, tier: Tier, orb: Optional[cv2.ORB] = None):
+    """
+    Downscale to the tier's long edge and extract its ORB budget
+    Returns (kp_xy, des2d, (w, h)); kp_xy/des2d are None when too few features
+    """
+    h, w = gray.shape[:2]
+    if tier.long_edge and max(w, h) > tier.long_edge:
+        s = tier.long_edge / max(w, h)
+        w, h = round(w * s), round(h * s)
+        gray = cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA)
+
+    if orb is None or orb.getMaxFeatures() != tier.orb_features:
+        orb = thread_orb(tier.orb_features)
+    count("tiers", 1)
+
+    kp_xy, des2d = extract_features(gray, orb)
+    return kp_xy, des2d, (w, h)
+
+
+def localize_features(
+    kp_xy: np.ndarray,
+    des2d: np.ndarray,
+    image_size: tuple,
+    bank: FeatureBank,
+    tier: Tier,
+    deadline: Optional[float] = None,
+    region: Optional[tuple] = None,
+    sensors: Optional[Sensors] = None,
+) -> dict:
+    """
+    Match already-extracted features against a bank and solve the pose
+    region - (map_x, map_y, radius) approximate client position (map px):
+             only points visible from there are matched; if that fails
+             the whole bank is tried
+    sensors - client intrinsics / gravity / heading (see sensors.py)
+    """
+    K, dist = camera_for(bank, image_size, sensors)
+
+    if region is not None:
+        with timed("match"):
+            rows, index = bank.region_index(region[:2], region[2])
+        if rows is not None:    # None: the region sees (almost) the whole bank
+            count("region_points", len(rows))
+            if len(rows) >= MIN_REGION_POINTS:
+                with timed("match"):
+                    m = index.match(des2d)
+                    matches = Matches(m.query_idx, rows[m.train_idx].astype(np.int32), m.distance)
+                count("matches", len(matches))
+                result = solve_pose(
+                    kp_xy, matches, bank, K, tier.top_matches, tier.ransac_iterations, deadline,
+                    dist, sensors,
+                )
+                if result["success"]:
+                    return result
+            count("region_fallback", 1)
+
+    with timed("match"):
+        matches = bank.index.match(des2d)
+        if bank.clustered and len(matches) < bank.thresholds.min_matches:
+            matches = bank.full_index.match(des2d)   # retrieval missed: whole bank
+    count("matches", len(matches))
+    return solve_pose(
+        kp_xy, matches, bank, K,
+        tier.top_matches, tier.ransac_iterations, deadline, dist, sensors,
+    )
+
+
+def localize_tier(
+    gray: np.ndarray,
+    bank: FeatureBank,
+    tier: Tier,
+    orb: Optional[cv2.ORB] = None,
+    deadline: Optional[float] = None,
+    region: Optional[tuple] = None,
+    sensors: Optional[Sensors] = None,
+) -> dict:
+    """Global localization of a frame with one tier's budget"""
+    kp_xy, des2d, image_size = tier_features(gray, tier, orb)
+    if des2d is None:
+        return {"success": False, "reason": "Insufficient features"}
+    return localize_features(kp_xy, des2d, image_size, bank, tier, deadline, region, sensors)
+
+
+def localize_frame(
+    gray: np.ndarray,
+    bank: FeatureBank,
+    orb: Optional[cv2.ORB] = None,
+    prior=None,
+    profile: str = DEFAULT_PROFILE,
+    deadline: Optional[float] = None,
+    region: Optional[tuple] = None,
+    sensors: Optional[Sensors] = None,
+) -> dict:
+    """
+    Localizes a grayscale frame against one building's bank
+    Input:
+        gray (np.ndarray) - decoded grayscale frame
+        bank (FeatureBank) - reconstruction + alignment of the building
+        orb - ORB extractor (default: this thread's, see thread_orb)
+        prior - (rvec, tvec) of the previous frame of a tracking session;
+                tried first, global relocalization only if tracking is lost
+        profile - "fast" | "balanced" | "accurate" (see PROFILES): tiers
+                  run cheapest first until one is confident enough
+        deadline - time.monotonic() by which to answer: bounds the pose
+                   solver, and no further tier starts once a pose exists
+        region - (map_x, map_y, radius) approximate position in map px
+                 (GPS, last fix): global matching is restricted to the
+                 points visible from there
+        sensors - client intrinsics, gravity and heading (see sensors.py):
+                  intrinsics replace the building's, gravity selects the
+                  4-DoF solver
+    Output:
+        dict with campus map coordinates; frames failing the quality gate
+        (see quality.py) are rejected before any feature extraction
+    """
+    rejected = check_quality(gray, bank.thresholds)
+    if rejected is not None:
+        return rejected
+
+    h, w = gray.shape[:2]
+    if prior is not None:
+        kp_xy, des2d = extract_features(gray, thread_orb(TRACK_ORB_FEATURES))
+        if des2d is not None:
+            result = track_pose(kp_xy, des2d, bank, prior, (w, h), sensors)
+            if result["success"]:
+                return result
+
+    tiers = PROFILES[profile]
+    best = None
+    for tier in tiers:
+        if best is not None and deadline is not None and time.monotonic() >= deadline:
+            break
+        result = localize_tier(gray, bank, tier, orb, deadline, region, sensors)
+        result["tier"] = tier.name
+        if result["success"] and (best is None or result["confidence"] > best["confidence"]):
+            best = result
+        if result["success"] and result["confidence"] >= tier.accept_confidence:
+            break
+    # A confident-enough tier wins; otherwise the most confident pose found
+    if best is not None:
+        result = best
+
+    if prior is not None:
+        result["tracking"] = "relocalized" if result["success"] else "lost"
+    return result
+
+
+def localize_keypoints(
+    kp_xy: np.ndarray,
+    des2d: np.ndarray,
+    image_size: tuple,
+    bank: FeatureBank,
+    prior=None,
+    profile: str = DEFAULT_PROFILE,
+    deadline: Optional[float] = None,
+    region: Optional[tuple] = None,
+    sensors: Optional[Sensors] = None,
+) -> dict:
+    """
+    Localizes features extracted by the client (no decode, no ORB)
+    A prior is tracked first; global matching and PnP then use the budget
+    of the profile's last tier (the client chose the feature count).
+    """
+    if len(kp_xy) < 30:
+        return {"success": False, "reason": "Insufficient features"}
+
+    if prior is not None:
+        result = track_pose(kp_xy, des2d, bank, prior, image_size, sensors)
+        if result["success"]:
+            return result
+
+    tier = PROFILES[profile][-1]
+    result = localize_features(kp_xy, des2d, image_size, bank, tier, deadline, region, sensors)
+    result["tier"] = tier.name
+    if prior is not None:
+        result["tracking"] = "relocalized" if result["success"] else "lost"
+    return result
+
+
+# =========================================================
+# BATCH (burst of frames from one building)
+# =========================================================
+
+def _decode_checked(data: bytes, thresholds):
+    """(gray, None) for a frame worth localizing, else (None, failed result)"""
+    gray = decode_frame(data)
+    if gray is None:
+        return None, {"success": False, "reason": "Image not readable"}
+    rejected = check_quality(gray, thresholds)
+    if rejected is not None:
+        return None, rejected
+    return gray, None
+
+
+def _batch_pass(extracted: list, bank: FeatureBank, tier: Tier, deadline, region, sensors) -> list:
+    """
+    One tier over several frames' features [(kp_xy, des2d, (w, h))]:
+    ONE batched match (the region's visible points first, then the whole
+    bank for the frames that found no pose there), per-frame PnP
+    """
+    def solve(items, per_frame):
+        out = []
+        for (kp_xy, _, size), m in zip(items, per_frame):
+            K, dist = camera_for(bank, size, sensors)
+            out.append(solve_pose(kp_xy, m, bank, K, tier.top_matches, tier.ransac_iterations,
+                                  deadline, dist, sensors))
+        return out
+
+    results = [None] * len(extracted)
+    todo = list(range(len(extracted)))
+    if region is not None:
+        with timed("match"):
+            rows, index = bank.region_index(region[:2], region[2])
+        if rows is not None:
+            count("region_points", len(rows))
+            if len(rows) >= MIN_REGION_POINTS:
+                with timed("match"):
+                    per_frame = [
+                        Matches(m.query_idx, rows[m.train_idx].astype(np.int32), m.distance)
+                        for m in index.match_many([extracted[i][1] for i in todo])
+                    ]
+                count("matches", sum(len(m) for m in per_frame))
+                for i, r in zip(todo, solve([extracted[i] for i in todo], per_frame)):
+                    results[i] = r
+                todo = [i for i in todo if not results[i]["success"]]
+            count("region_fallback", len(todo))
+
+    if todo:
+        with timed("match"):
+            per_frame = bank.index.match_many([extracted[i][1] for i in todo])
+            missed = [k for k, m in enumerate(per_frame) if len(m) < bank.thresholds.min_matches]
+            if bank.clustered and missed:   # retrieval missed: whole bank
+                full = bank.full_index.match_many([extracted[todo[k]][1] for k in missed])
+                for k, m in zip(missed, full):
+                    per_frame[k] = m
+        count("matches", sum(len(m) for m in per_frame))
+        for i, r in zip(todo, solve([extracted[i] for i in todo], per_frame)):
+            results[i] = r
+    return results
+
+
+def fuse_results(results: list) -> Optional[dict]:
+    """Confidence-weighted mean of the successful frames that agree with the median"""
+    ok = [r for r in results if r.get("success")]
+    if not ok:
+        return None
+
+    xy = np.array([[r["map_x"], r["map_y"]] for r in ok])
+    w = np.array([r["confidence"] for r in ok])
+    near = np.linalg.norm(xy - np.median(xy, axis=0), axis=1) <= FUSE_RADIUS_PX
+    if not near.any():
+        near[:] = True
+    fused = np.average(xy[near], axis=0, weights=w[near] + 1e-9)
+
+    return {
+        "map_x": float(fused[0]),
+        "map_y": float(fused[1]),
+        "confidence": float(w[near].max()),
+        "frames_used": int(near.sum()),
+    }
+
+
+def localize_batch(
+    frames: list,
+    bank: FeatureBank,
+    profile: str = DEFAULT_PROFILE,
+    deadline: Optional[float] = None,
+    region: Optional[tuple] = None,
+    sensors: Optional[Sensors] = None,
+) -> dict:
+    """
+    Localizes K encoded frames of the same building
+    - decode + quality gate run in parallel threads
+    - the profile's tiers run cheapest first, each over the frames not yet
+      confident enough: ORB in parallel threads, ONE batched match of all
+      their descriptors, per-frame PnP
+    - best + fused pose
+    deadline, region and sensors apply to every frame as in localize_frame
+    (sensors: one phone, so one set of intrinsics / gravity / heading)
+    """
+    # Decode + quality gate of all frames overlap in threads: one combined stage
+    with timed("decode_orb"):
+        decoded = list(_batch_pool.map(_decode_checked, frames, repeat(bank.thresholds)))
+
+    results = [failed for _, failed in decoded]
+    poses = [None] * len(frames)
+    pending = [i for i, (_, failed) in enumerate(decoded) if failed is None]
+    for tier in PROFILES[profile]:
+        if deadline is not None and time.monotonic() >= deadline:
+            pending = [i for i in pending if poses[i] is None]   # frames with a pose stop here
+        if not pending:
+            break
+        with timed("decode_orb"):
+            extracted = list(_batch_pool.map(lambda i: tier_features(decoded[i][0], tier), pending))
+        for i, (_, des2d, _) in zip(pending, extracted):
+            if des2d is None:
+                results[i] = {"success": False, "reason": "Insufficient features", "tier": tier.name}
+        valid = [(i, f) for i, f in zip(pending, extracted) if f[1] is not None]
+        for i, f in valid:
+            count("keypoints", len(f[1]))
+
+        done = set()
+        for (i, _), result in zip(valid, _batch_pass([f for _, f in valid], bank, tier, deadline, region, sensors)):
+            result["tier"] = tier.name
+            results[i] = result
+            if result["success"] and (poses[i] is None or result["confidence"] > poses[i]["confidence"]):
+                poses[i] = result
+            if result["success"] and result["confidence"] >= tier.accept_confidence:
+                done.add(i)
+        pending = [i for i in pending if i not in done]
+
+    # A confident-enough tier wins; otherwise the most confident pose found
+    results = [pose if pose is not None else r for pose, r in zip(poses, results)]
+
+    ok = [i for i, r in enumerate(results) if r.get("success")]
+    best = max(ok, key=lambda i: results[i]["confidence"]) if ok else None
+
+    return {
+        "success": best is not None,
+        "building": bank.building,
+        "frames": results,
+        "best_frame": best,
+        "best": results[best] if best is not None else None,
+        "fused": fuse_results(results),
+    }
@@ -0,0 +1,261 @@
+"""
+prune_bank.py
+---------------------------------
+Offline feature-bank pruning: score every 3D point, keep the best N
+
+Usage (from backend/):
+    python -m localization.prune_bank library
+    python -m localization.prune_bank library --images photos/*.jpg --sizes 4000 8000 --keep 8000
+
+Score of a point (higher is kept first):
+- distinctiveness: Hamming distance to its nearest OTHER bank descriptor
+  (near-duplicates score low and attract false matches)
+- inlier frequency: how often it was a PnP inlier when the replay frames
+  were localized against the full bank
+Of two near-duplicates (descriptor distance < DUPLICATE_DISTANCE) only the
+better-scored one is kept.
+
+Replay frames are the --images (ORB as in the "full" tier) or, without
+images, synthetic frames projected from the bank. Even frames score the
+points, odd frames evaluate every candidate size: success rate and match +
+PnP latency per size are printed so a speed/accuracy operating point can
+be picked per building.
+
+--keep N writes the bank reordered best-first and cut to N points
+(keypoints_3d.npy, descriptors_3d.npy, clusters.npy if any, a bank.mmb
+bundle and prune_report.json) to --out (default <building directory>/pruned/).
+Deploy by copying bank.mmb (or the .npy files) into the building's
+directory, then rebuild the vocabulary tree.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from localization.bank import FeatureBank
+from localization.buildings import BUILDINGS
+from localization.bundle import BUNDLE_FILE, write_bundle
+from localization.clusters import CLUSTERS_FILE
+from localization.pipeline import FULL, localize_features, tier_features
+from localization.solver import solve_pnp
+from localization.spatial import VIEW_DIRS_FILE
+
+DUPLICATE_DISTANCE = 8        # Hamming bits: closer descriptors are near-duplicates
+DISTINCT_CAP = 64             # nearest-neighbour distance counted up to this
+DISTINCT_WEIGHT = 0.5         # weight of distinctiveness against inlier frequency
+
+
+# =========================================================
+# REPLAY FRAMES
+# =========================================================
+
+def image_frames(paths) -> list:
+    """(kp_xy, des2d, image_size) of every readable image, "full"-tier ORB"""
+    frames = []
+    for p in paths:
+        gray = cv2.imread(str(p), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"⚠️ Skipping unreadable image: {p}")
+            continue
+        kp_xy, des2d, size = tier_features(gray, FULL)
+        if des2d is not None:
+            frames.append((kp_xy, des2d, size))
+    return frames
+
+
+def synthetic_frames(bank: FeatureBank, n: int, flip_bits: int = 16, seed: int = 0) -> list:
+    """
+    Frames seen from jittered cameras facing the reconstruction:
+    visible points (random half) with perturbed descriptors and pixel
+    noise, plus 25% random distractor features
+    """
+    rng = np.random.default_rng(seed)
+    w, h = bank.calibration_size
+    K = bank.intrinsics_for((w, h))
+    points = np.asarray(bank.points, np.float64)
+    descriptors = np.asarray(bank.descriptors)
+    centre = points.mean(0)
+    standoff = np.ptp(points[:, 2]) * 1.5 + 1.0
+
+    frames = []
+    for _ in range(n):
+        rvec = np.array([0.0, rng.uniform(-0.2, 0.2), 0.0])
+        tvec = -centre + np.array([rng.uniform(-2, 2), rng.uniform(-1, 1), standoff])
+        R, _ = cv2.Rodrigues(rvec)
+        depth = points @ R[2] + tvec[2]
+        proj, _ = cv2.projectPoints(points, rvec, tvec, K, bank.dist_coeffs)
+        proj = proj.reshape(-1, 2)
+        visible = np.flatnonzero(
+            (depth > 0) & (proj[:, 0] >= 0) & (proj[:, 0] < w) & (proj[:, 1] >= 0) & (proj[:, 1] < h)
+        )
+        seen = visible[rng.random(len(visible)) < 0.5][:3000]
+
+        bits = np.unpackbits(descriptors[seen], axis=1)
+        for row in bits:
+            row[rng.choice(256, flip_bits, replace=False)] ^= 1
+        n_noise = len(seen) // 3
+        des2d = np.vstack([
+            np.packbits(bits, axis=1),
+            rng.integers(0, 256, (n_noise, 32), dtype=np.uint8),
+        ])
+        kp_xy = np.vstack([
+            proj[seen] + rng.normal(0, 1.0, (len(seen), 2)),
+            rng.uniform((0, 0), (w, h), (n_noise, 2)),
+        ]).astype(np.float32)
+        frames.append((kp_xy, des2d, (w, h)))
+    return frames
+
+
+# =========================================================
+# SCORING
+# =========================================================
+
+def nearest_other(descriptors: np.ndarray) -> np.ndarray:
+    """Hamming distance of every descriptor to its nearest other row"""
+    knn = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(descriptors, descriptors, k=2)
+    out = np.full(len(descriptors), 256, np.int32)
+    for i, pair in enumerate(knn):
+        for m in pair:
+            if m.trainIdx != i:
+                out[i] = int(m.distance)
+                break
+    return out
+
+
+def inlier_counts(bank: FeatureBank, frames: list) -> np.ndarray:
+    """How often every bank point was a PnP inlier over the frames"""
+    counts = np.zeros(len(bank), np.int32)
+    for kp_xy, des2d, size in frames:
+        matches = bank.full_index.match(des2d)
+        if len(matches) < bank.thresholds.min_matches:
+            continue
+        matches = matches.best(FULL.top_matches)
+        pose = solve_pnp(
+            np.asarray(bank.points[matches.train_idx], np.float32),
+            np.asarray(kp_xy[matches.query_idx], np.float32),
+            bank.intrinsics_for(size), bank.dist_coeffs, FULL.ransac_iterations,
+        )
+        if pose is not None and len(pose.inliers) >= bank.thresholds.min_inliers:
+            np.add.at(counts, matches.train_idx[pose.inliers], 1)
+    return counts
+
+
+def rank_points(bank: FeatureBank, frames: list) -> tuple:
+    """
+    Point order, best first, with near-duplicates moved to the end
+    Returns (order, scores, n_duplicates)
+    """
+    nn = nearest_other(np.ascontiguousarray(bank.descriptors))
+    distinct = np.minimum(nn, DISTINCT_CAP) / DISTINCT_CAP
+    hits = inlier_counts(bank, frames)
+    frequency = hits / hits.max() if hits.max() > 0 else np.zeros(len(bank))
+    scores = frequency + DISTINCT_WEIGHT * distinct
+
+    # Greedy duplicate suppression: walk best-first, drop rows too close to a kept one
+    order = np.argsort(-scores, kind="stable")
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    neighbours = matcher.radiusMatch(
+        np.ascontiguousarray(bank.descriptors), np.ascontiguousarray(bank.descriptors),
+        DUPLICATE_DISTANCE,
+    )
+    dropped = np.zeros(len(bank), bool)
+    for i in order:
+        if dropped[i]:
+            continue
+        for m in neighbours[i]:
+            if m.trainIdx != i:
+                dropped[m.trainIdx] = True
+    order = np.concatenate([order[~dropped[order]], order[dropped[order]]])
+    return order, scores, int(dropped.sum())
+
+
+def subset(bank: FeatureBank, rows: np.ndarray) -> FeatureBank:
+    """A bank holding only rows (in that order)"""
+    return FeatureBank(
+        bank.building,
+        np.ascontiguousarray(np.asarray(bank.points)[rows]),
+        np.ascontiguousarray(np.asarray(bank.descriptors)[rows]),
+        bank.transform_matrix,
+        bank.camera_matrix,
+        bank.dist_coeffs,
+        bank.calibration_size,
+        bank.matcher_backend,
+        None if bank.labels is None else np.ascontiguousarray(np.asarray(bank.labels)[rows]),
+        bank.thresholds,
+        None if bank.view_dirs is None else np.ascontiguousarray(np.asarray(bank.view_dirs)[rows]),
+    )
+
+
+# =========================================================
+# EVALUATION
+# =========================================================
+
+def evaluate(bank: FeatureBank, frames: list) -> dict:
+    """Success rate and match + PnP latency of the "full" tier"""
+    bank.index   # build the index outside the timed loop
+    latencies, successes = [], 0
+    for kp_xy, des2d, size in frames:
+        t0 = time.perf_counter()
+        result = localize_features(kp_xy, des2d, size, bank, FULL)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        successes += result["success"]
+    return {
+        "points": len(bank),
+        "success_rate": successes / len(frames) if frames else float("nan"),
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else float("nan"),
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("building", help="building id from buildings.json, e.g. library")
+    parser.add_argument("--images", nargs="*", default=[], help="replay frames (default: synthetic)")
+    parser.add_argument("--frames", type=int, default=20, help="synthetic replay frames")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[], help="default: 25/50/75/100%% of the bank")
+    parser.add_argument("--keep", type=int, default=0, help="write the bank cut to this size")
+    parser.add_argument("--out", type=Path, help="default: <building directory>/pruned/")
+    args = parser.parse_args()
+
+    localizer = BUILDINGS[args.building.lower()]
+    bank = localizer.load_bank()
+    frames = image_frames(args.images) if args.images else synthetic_frames(bank, args.frames)
+    if len(frames) < 2:
+        print("❌ Need at least 2 replay frames (even ones score, odd ones evaluate)")
+        return
+    score_frames, eval_frames = frames[0::2], frames[1::2]
+
+    order, scores, n_duplicates = rank_points(bank, score_frames)
+    print(f"Bank: {bank.building} ({len(bank)} points), {len(frames)} replay frame(s), "
+          f"{n_duplicates} near-duplicates ranked last")
+
+    sizes = sorted(set(args.sizes or [len(bank) * q // 4 for q in (1, 2, 3, 4)]))
+    report = []
+    print(f"{'points':>8}{'success':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for size in sizes:
+        row = evaluate(subset(bank, order[:size]), eval_frames)
+        report.append(row)
+        print(f"{row['points']:>8}{row['success_rate']:>10.2f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}")
+
+    if args.keep:
+        out = args.out or localizer.directory / "pruned"
+        out.mkdir(parents=True, exist_ok=True)
+        pruned = subset(bank, order[:args.keep])
+        np.save(out / "keypoints_3d.npy", pruned.points)
+        np.save(out / "descriptors_3d.npy", pruned.descriptors)
+        if pruned.labels is not None:
+            np.save(out / CLUSTERS_FILE, pruned.labels)
+        if pruned.view_dirs is not None:
+            np.save(out / VIEW_DIRS_FILE, pruned.view_dirs)
+        write_bundle(out / BUNDLE_FILE, pruned)
+        with open(out / "prune_report.json", "w") as f:
+            json.dump({"building": bank.building, "kept": len(pruned), "sizes": report}, f, indent=2)
+        print(f"✅ {len(pruned)} of {len(bank)} points → {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+quality.py
+---------------------------------
+Pre-flight image quality gate, run before feature extraction
+
+A few cheap measurements on a downscaled copy of the frame (~1–3 ms):
+- exposure  : share of clipped pixels (near black / near white)
+- contrast  : standard deviation of the intensities
+- sharpness : variance of the Laplacian (motion blur, focus)
+- corners   : FAST corners, a quick estimate of the ORB keypoint density
+Frames that cannot localize (pocket shots, blur, blown-out sky) are
+rejected at once instead of after hundreds of ms of ORB + matching + PnP.
+
+A rejection is a failed result with a machine-readable "rejected" code
+("underexposed" | "overexposed" | "low_contrast" | "blurry" | "few_features")
+and the measurements under "quality". Limits are per building (manifest
+"thresholds", see bank.Thresholds); a limit of 0 disables that check.
+
+MAPMATE_QUALITY_GATE    1 (default) = on, 0 = off
+"""
+
+import os
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from localization.timing import timed
+
+QUALITY_GATE = os.environ.get("MAPMATE_QUALITY_GATE", "1") != "0"
+
+PREVIEW_LONG_EDGE = 320     # measurements run on a frame downscaled to this (px)
+DARK_LEVEL = 10             # pixels at or below this count as clipped black
+BRIGHT_LEVEL = 245          # pixels at or above this count as clipped white
+FAST_THRESHOLD = 20
+
+_thread_state = threading.local()
+
+
+def _fast() -> cv2.FastFeatureDetector:
+    """This thread's FAST detector"""
+    fast = getattr(_thread_state, "fast", None)
+    if fast is None:
+        fast = _thread_state.fast = cv2.FastFeatureDetector_create(FAST_THRESHOLD, True)
+    return fast
+
+
+def preview(gray: np.ndarray) -> np.ndarray:
+    """The frame downscaled to PREVIEW_LONG_EDGE (as is when already smaller)"""
+    h, w = gray.shape[:2]
+    scale = PREVIEW_LONG_EDGE / max(h, w)
+    if scale >= 1.0:
+        return gray
+    return cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def measure(gray: np.ndarray) -> dict:
+    """Exposure, contrast, sharpness and corner density of a grayscale frame"""
+    small = preview(gray)
+    hist = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel() / small.size
+    _, std = cv2.meanStdDev(small)
+    _, lap_std = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_16S))
+    return {
+        "dark": round(float(hist[:DARK_LEVEL + 1].sum()), 3),
+        "bright": round(float(hist[BRIGHT_LEVEL:].sum()), 3),
+        "contrast": round(float(std[0, 0]), 1),
+        "sharpness": round(float(lap_std[0, 0]) ** 2, 1),
+        "corners": len(_fast().detect(small)),
+    }
+
+
+def check_quality(gray: np.ndarray, thresholds) -> Optional[dict]:
+    """
+    None if the frame is worth localizing, else a failed result
+    thresholds: bank.Thresholds of the building (max_clipped, min_contrast,
+                min_sharpness, min_corners)
+    """
+    if not QUALITY_GATE:
+        return None
+    with timed("quality"):
+        q = measure(gray)
+
+    rejected = None
+    if thresholds.max_clipped and q["dark"] > thresholds.max_clipped:
+        rejected, reason = "underexposed", "Image too dark"
+    elif thresholds.max_clipped and q["bright"] > thresholds.max_clipped:
+        rejected, reason = "overexposed", "Image overexposed"
+    elif q["contrast"] < thresholds.min_contrast:
+        rejected, reason = "low_contrast", "Image has too little contrast"
+    elif q["sharpness"] < thresholds.min_sharpness:
+        rejected, reason = "blurry", "Image too blurry"
+    elif q["corners"] < thresholds.min_corners:
+        rejected, reason = "few_features", "Too few features in view"
+    if rejected is None:
+        return None
+    return {"success": False, "reason": reason, "rejected": rejected, "quality": q}
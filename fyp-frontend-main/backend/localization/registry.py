@@ -0,0 +1,155 @@
+"""
+registry.py
+---------------------------------
+Lazy, memory-budgeted registry of building feature banks
+- Buildings register a loader, nothing is read at import
+- A bank is loaded on first use and kept while it fits the budget
+- Least-recently-used banks are evicted when the budget is exceeded
+  (banks in use by a request are never evicted)
+
+MAPMATE_BANK_BUDGET_MB
+    Resident bank budget in MB (default 512; 0 = unlimited)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from localization.bank import FeatureBank
+
+BANK_BUDGET_BYTES = int(float(os.environ.get("MAPMATE_BANK_BUDGET_MB", "512")) * 1024 * 1024)
+
+
+class BankRegistry:
+    """Building name → loader, with an LRU of resident banks"""
+
+    def __init__(self, budget_bytes: int = BANK_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._loaders: Dict[str, Callable[[], FeatureBank]] = {}
+        self._resident: "OrderedDict[str, FeatureBank]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def add(self, name: str, loader: Callable[[], FeatureBank]):
+        """Registers (or replaces) a building; a replaced bank is unloaded"""
+        with self._lock:
+            if self._loaders.get(name) is not loader:
+                self._drop(name)
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._loaders
+
+    def __iter__(self):
+        return iter(list(self._loaders))
+
+    def __len__(self) -> int:
+        return len(self._loaders)
+
+    @property
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(bank.nbytes for bank in self._resident.values())
+
+    # -----------------------------
+    # Lookup
+    # -----------------------------
+    def get(self, name: str) -> FeatureBank:
+        """Resident bank, loading it (and evicting others) if needed"""
+        with self._lock:
+            bank = self._resident.get(name)
+            if bank is not None:
+                self._resident.move_to_end(name)
+                self.hits += 1
+                return bank
+            if name not in self._loaders:
+                raise KeyError(name)
+            load_lock = self._load_locks[name]
+
+        # Load outside the registry lock so other buildings stay served
+        with load_lock:
+            with self._lock:
+                bank = self._resident.get(name)
+                if bank is not None:   # loaded by a concurrent request
+                    self._resident.move_to_end(name)
+                    self.hits += 1
+                    return bank
+                loader = self._loaders[name]
+
+            bank = loader()
+
+            with self._lock:
+                self._resident[name] = bank
+                self.loads += 1
+                self._evict(keep=name)
+            return bank
+
+    def pin(self, name: str):
+        """Protects a bank (loaded or not yet) from eviction until unpin()"""
+        with self._lock:
+            self._pins[name] = self._pins.get(name, 0) + 1
+
+    def unpin(self, name: str):
+        with self._lock:
+            self._pins[name] -= 1
+            if not self._pins[name]:
+                del self._pins[name]
+            self._evict()
+
+    @contextmanager
+    def lease(self, name: str):
+        """Bank pinned against eviction for the duration of a request"""
+        self.pin(name)
+        try:
+            yield self.get(name)
+        finally:
+            self.unpin(name)
+
+    # -----------------------------
+    # Eviction
+    # -----------------------------
+    def _evict(self, keep: str = None):
+        if self.budget_bytes <= 0:
+            return
+        for name in list(self._resident):
+            if self.resident_bytes <= self.budget_bytes:
+                return
+            if name == keep or self._pins.get(name):
+                continue
+            self._drop(name)
+            self.evictions += 1
+
+    def _drop(self, name: str):
+        bank = self._resident.pop(name, None)
+        if bank is not None:
+            bank.release(unlink=True)
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._resident):
+                self._drop(name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.loads
+            return {
+                "registered": len(self._loaders),
+                "resident": list(self._resident),
+                "resident_bytes": self.resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+# Buildings of this API process (building modules register themselves)
+banks = BankRegistry()
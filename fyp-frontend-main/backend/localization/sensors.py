@@ -0,0 +1,167 @@
+"""
+sensors.py
+---------------------------------
+Phone sensor metadata for the pose solver
+- intrinsics (fx, fy, cx, cy) reported by the client for the frame it
+  uploaded, cached per device model so later requests can omit them
+- gravity direction (accelerometer) → gravity-aligned PnP
+  (solver.solve_pnp_gravity): only yaw + position remain unknown
+- compass heading → pose hypotheses facing another way are discarded
+
+Conventions:
+    gravity  (gx, gy, gz) in OpenCV camera axes (x right, y down,
+             z forward), any length; an upright phone facing the horizon
+             reports about (0, 1, 0)
+    heading  compass bearing of the optical axis, degrees clockwise from north
+Reconstructions are Y-down (BUILDING_DOWN, the same convention as the
+camera). The campus map's "up" points MAP_NORTH_DEG clockwise from north.
+
+MAPMATE_MAP_NORTH_DEG    compass bearing of the campus map's up direction (default 0)
+MAPMATE_DEVICE_CACHE     device models whose intrinsics are remembered (default 1000)
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from localization.imaging import scale_intrinsics
+
+MAP_NORTH_DEG = float(os.environ.get("MAPMATE_MAP_NORTH_DEG", "0"))
+DEVICE_CACHE = int(os.environ.get("MAPMATE_DEVICE_CACHE", "1000"))
+
+BUILDING_DOWN = np.array([0.0, 1.0, 0.0])     # gravity in the building frame
+HEADING_TOLERANCE_DEG = 30.0                  # compass error tolerated by the solver
+NO_DISTORTION = np.zeros((4, 1))              # phone frames arrive undistorted
+
+
+class InvalidSensors(ValueError):
+    """Raised when sensor query parameters cannot be parsed"""
+
+
+@dataclass(frozen=True)
+class Sensors:
+    """What the client knows about its camera for one frame (all optional)"""
+    intrinsics: Optional[Tuple[float, float, float, float]] = None  # fx, fy, cx, cy at image_size
+    image_size: Optional[Tuple[int, int]] = None                    # (w, h) of the uploaded frame
+    gravity: Optional[Tuple[float, float, float]] = None            # unit vector, camera axes
+    heading: Optional[float] = None                                 # degrees clockwise from north
+
+    @property
+    def empty(self) -> bool:
+        return self.intrinsics is None and self.gravity is None and self.heading is None
+
+
+def camera_for(bank, image_size, sensors: Optional[Sensors] = None) -> tuple:
+    """
+    (camera matrix, distortion) for a frame of image_size (w, h): the
+    client's intrinsics rescaled to it when known, else the building's
+    """
+    if sensors is None or sensors.intrinsics is None:
+        return bank.intrinsics_for(image_size), bank.dist_coeffs
+    fx, fy, cx, cy = sensors.intrinsics
+    K = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], np.float64)
+    return scale_intrinsics(K, sensors.image_size, image_size), NO_DISTORTION
+
+
+def heading_direction(heading: float, transform_matrix: np.ndarray) -> np.ndarray:
+    """
+    Compass bearing → unit (x, z) direction on the building's ground plane,
+    through the inverse of the building → campus map affine
+    """
+    bearing = math.radians(heading - MAP_NORTH_DEG)
+    map_dir = np.array([math.sin(bearing), -math.cos(bearing)])   # map y grows downwards
+    d = np.linalg.solve(np.asarray(transform_matrix, np.float64)[:, :2], map_dir)
+    return d / np.linalg.norm(d)
+
+
+def parse_vector(text: Optional[str], n: int, name: str) -> Optional[tuple]:
+    """'a,b,c' → (a, b, c) of n finite floats; raises InvalidSensors"""
+    if text is None:
+        return None
+    try:
+        values = tuple(float(v) for v in text.split(","))
+    except ValueError:
+        raise InvalidSensors(f"{name} must be {n} comma-separated numbers")
+    if len(values) != n or not all(math.isfinite(v) for v in values):
+        raise InvalidSensors(f"{name} must be {n} comma-separated numbers")
+    return values
+
+
+# =========================================================
+# DEVICE INTRINSICS CACHE (API PROCESS)
+# =========================================================
+
+class DeviceIntrinsics:
+    """Device model → last reported intrinsics and the frame size they were for (LRU)"""
+
+    def __init__(self, max_devices: int = DEVICE_CACHE):
+        self.max_devices = max_devices
+        self._devices: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def remember(self, device: str, intrinsics: tuple, image_size: tuple):
+        with self._lock:
+            self._devices[device] = (intrinsics, image_size)
+            self._devices.move_to_end(device)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+
+    def get(self, device: str) -> Optional[tuple]:
+        """(intrinsics, image_size) last reported by this device model, or None"""
+        with self._lock:
+            entry = self._devices.get(device)
+            if entry is not None:
+                self._devices.move_to_end(device)
+                self.hits += 1
+            return entry
+
+    def sensors(
+        self,
+        image_size: Optional[tuple],
+        device: Optional[str] = None,
+        intrinsics: Optional[str] = None,
+        gravity: Optional[str] = None,
+        heading: Optional[float] = None,
+    ) -> Optional[Sensors]:
+        """
+        Sensors of one request from its query parameters
+        intrinsics "fx,fy,cx,cy" in pixels of the uploaded frame (image_size);
+        remembered for the device model, reused when a later request omits them
+        Returns None when nothing is known; raises InvalidSensors
+        """
+        K = parse_vector(intrinsics, 4, "intrinsics")
+        if K is not None:
+            if min(K[0], K[1]) <= 0:
+                raise InvalidSensors("intrinsics: focal lengths must be positive")
+            if image_size is None:
+                raise InvalidSensors("intrinsics need a JPEG/PNG frame whose size can be read")
+            if device:
+                self.remember(device, K, tuple(image_size))
+        elif device:
+            cached = self.get(device)
+            if cached is not None:
+                K, image_size = cached
+
+        g = parse_vector(gravity, 3, "gravity")
+        if g is not None:
+            norm = math.sqrt(sum(v * v for v in g))
+            if norm == 0:
+                raise InvalidSensors("gravity must be non-zero")
+            g = tuple(v / norm for v in g)
+        if heading is not None and not math.isfinite(heading):
+            raise InvalidSensors("heading must be a finite number of degrees")
+
+        sensors = Sensors(K, tuple(image_size) if K is not None else None, g, heading)
+        return None if sensors.empty else sensors
+
+    def stats(self) -> dict:
+        return {"devices": len(self._devices), "max_devices": self.max_devices, "hits": self.hits}
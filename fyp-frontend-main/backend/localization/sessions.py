@@ -0,0 +1,70 @@
+"""
+sessions.py
+---------------------------------
+Tracking sessions for continuous AR localization
+Keeps the last camera pose per session id so the next frame can be
+tracked (guided matching from that pose) instead of localized cold.
+
+Lives in the API process; the pose prior travels with each request,
+so it works the same with or without worker processes.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+SESSION_TTL_S = float(os.environ.get("MAPMATE_SESSION_TTL_S", "30"))
+MAX_SESSIONS = 1000
+
+
+@dataclass
+class TrackingSession:
+    building: str
+    rvec: list
+    tvec: list
+    updated: float
+
+
+class SessionStore:
+    """Session id → last pose, with TTL and an LRU bound"""
+
+    def __init__(self, ttl_s: float = SESSION_TTL_S, max_sessions: int = MAX_SESSIONS):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, TrackingSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def prior(self, session_id: str, building: str) -> Optional[tuple]:
+        """(rvec, tvec) of the session's last frame, or None to localize cold"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session.building != building or time.monotonic() - session.updated > self.ttl_s:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session.rvec, session.tvec
+
+    def building(self, session_id: str) -> Optional[str]:
+        """Building the session is currently tracked in, if any"""
+        session = self._sessions.get(session_id)
+        return None if session is None else session.building
+
+    def update(self, session_id: str, building: str, result: dict):
+        """Store the new pose; a failed frame ends the session"""
+        if "rejected" in result:
+            return  # never reached matching (quality gate): keep the last pose
+        if not result.get("success") or "pose" not in result:
+            self._sessions.pop(session_id, None)
+            return
+
+        self._sessions[session_id] = TrackingSession(
+            building, result["pose"]["rvec"], result["pose"]["tvec"], time.monotonic()
+        )
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
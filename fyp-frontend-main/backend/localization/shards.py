@@ -0,0 +1,162 @@
+"""
+shards.py
+---------------------------------
+Scatter-gather descriptor matching over a bank split across processes
+
+A large bank's descriptors are cut into MAPMATE_MATCH_SHARDS contiguous
+row ranges. Shard s is always searched by shard process s, which attaches
+the bank once (shared memory or the bundle file, see bank.share) and keeps
+a persistent index over its range. A query is sent to every shard at once
+and the per-shard matches are merged (nearest bank point per query), so
+matching latency follows the shard size, not the bank size.
+
+Cross-checking happens inside each shard, so the merged set can hold a
+few matches a whole-bank cross-check would reject; PnP RANSAC absorbs them.
+Batches (match_many) never cross-check the concatenated frames: each shard
+returns forward 1-NN, and the merged matches are made one-to-one per frame,
+exactly like BruteForceIndex.match_many.
+
+MAPMATE_MATCH_SHARDS      shard processes (default 0; 0 or 1 = off)
+MAPMATE_SHARD_MIN_ROWS    banks smaller than this are matched in-process
+                          (default 200000)
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from localization.matchers import (
+    BruteForceIndex, DescriptorIndex, Matches, build_index, merge_matches, one_to_one, split_matches,
+)
+from localization.timing import count
+
+SHARDS = int(os.environ.get("MAPMATE_MATCH_SHARDS", "0"))
+SHARD_MIN_ROWS = int(os.environ.get("MAPMATE_SHARD_MIN_ROWS", "200000"))
+SHARD_CACHE = 8               # shard indexes kept per shard process
+
+# =========================================================
+# SHARD PROCESS SIDE
+# =========================================================
+
+_shard_banks = {}             # handle key → attached FeatureBank
+_shard_indexes = OrderedDict()  # (handle key, lo, hi) → index over that row range
+
+
+def _handle_key(handle) -> tuple:
+    """Identifies one export of a bank (a re-shared bank gets a new key)"""
+    if handle.bundle is not None:
+        return handle.building, handle.bundle
+    return handle.building, handle.descriptors.name
+
+
+def _init_shard():
+    cv2.setNumThreads(1)
+
+
+def _shard_index(handle, lo: int, hi: int):
+    """This process's index over rows [lo, hi) of a shared bank (built once, LRU)"""
+    from localization.bank import FeatureBank   # bank.py imports this module
+
+    key = (_handle_key(handle), lo, hi)
+    index = _shard_indexes.get(key)
+    if index is None:
+        bank = _shard_banks.get(key[0])
+        if bank is None:
+            bank = _shard_banks[key[0]] = FeatureBank.attach(handle)
+        index = _shard_indexes[key] = build_index(handle.matcher_backend, bank.descriptors[lo:hi])
+        while len(_shard_indexes) > SHARD_CACHE:
+            (old, _, _), _ = _shard_indexes.popitem(last=False)
+            if not any(k[0] == old for k in _shard_indexes):
+                _shard_banks.pop(old, None)
+    else:
+        _shard_indexes.move_to_end(key)
+    return index
+
+
+def _shard_match(handle, lo: int, hi: int, query: np.ndarray) -> Matches:
+    """Matches query against rows [lo, hi) of a shared bank (train_idx relative to lo)"""
+    return _shard_index(handle, lo, hi).match(query)
+
+
+def _shard_forward(handle, lo: int, hi: int, query: np.ndarray) -> Matches:
+    """
+    Batch pass over rows [lo, hi): forward 1-NN for cross-checking indexes,
+    the index's own (ratio-tested, frame-independent) matches otherwise
+    """
+    index = _shard_index(handle, lo, hi)
+    if isinstance(index, BruteForceIndex) and index.ratio is None:
+        return index.forward_match(query)
+    return index.match(query)
+
+
+# =========================================================
+# API PROCESS SIDE
+# =========================================================
+
+_pools = []
+_pools_lock = threading.Lock()
+
+
+def shard_pools(n: int) -> list:
+    """n single-process pools, so a shard's index stays warm in one process"""
+    with _pools_lock:
+        if len(_pools) < n:
+            ctx = multiprocessing.get_context("spawn")
+            _pools.extend(
+                ProcessPoolExecutor(max_workers=1, mp_context=ctx, initializer=_init_shard)
+                for _ in range(n - len(_pools))
+            )
+        return _pools[:n]
+
+
+def shutdown_shards():
+    with _pools_lock:
+        for pool in _pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+        _pools.clear()
+
+
+class ShardedIndex(DescriptorIndex):
+    """
+    Index of a shared bank whose rows are searched by the shard processes
+    (bank.full_index when the bank has at least SHARD_MIN_ROWS rows)
+    """
+
+    name = "sharded"
+
+    def __init__(self, bank, shards: int = SHARDS):
+        super().__init__(bank.descriptors)
+        self.handle = bank.share()
+        bounds = np.linspace(0, len(bank), min(shards, len(bank)) + 1).astype(int)
+        self.ranges = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def _scatter(self, fn, query: np.ndarray) -> Matches:
+        """Runs fn on every shard at once, merges to the nearest bank point per query"""
+        query = np.ascontiguousarray(query, dtype=np.uint8)
+        pools = shard_pools(len(self.ranges))
+        futures = [
+            pool.submit(fn, self.handle, lo, hi, query)
+            for pool, (lo, hi) in zip(pools, self.ranges)
+        ]
+        parts = []
+        for (lo, _), future in zip(self.ranges, futures):
+            m = future.result()
+            parts.append(Matches(m.query_idx, m.train_idx + np.int32(lo), m.distance))
+        count("shards", len(parts))
+        return merge_matches(parts)
+
+    def match(self, query: np.ndarray) -> Matches:
+        return self._scatter(_shard_match, query)
+
+    def match_many(self, queries: list) -> list:
+        """One scatter for the whole batch; frames never compete for bank points"""
+        offsets = np.cumsum([0] + [len(q) for q in queries])
+        per_frame = split_matches(self._scatter(_shard_forward, np.vstack(queries)), offsets)
+        if self.handle.matcher_backend != "bruteforce":
+            return per_frame
+        return [one_to_one(m) for m in per_frame]
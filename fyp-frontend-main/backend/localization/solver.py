@@ -0,0 +1,299 @@
+"""
+solver.py
+---------------------------------
+Pose solver stage: robust PnP + Levenberg–Marquardt refinement
+- RANSAC (classic) or one of OpenCV's USAC variants, all with adaptive
+  termination (stop once the inlier ratio says enough samples were drawn)
+- solvePnPRefineLM on the inliers of the best hypothesis
+- Optional deadline: hypotheses are drawn in small chunks and the best
+  pose found so far is returned once the deadline passes. OpenCV reseeds
+  its sampler on every call, so each chunk sees the correspondences in a
+  different order (otherwise every chunk would redraw the same samples).
+- Gravity-aligned variant (solve_pnp_gravity): with the gravity direction
+  known, only yaw + position are unknown (4 DoF) and a hypothesis needs
+  2 correspondences instead of 5, so far fewer RANSAC iterations suffice
+
+MAPMATE_PNP_METHOD    ransac | epnp | usac_default | usac_fast | usac_accurate | usac_magsac
+                      (default usac_magsac)
+MAPMATE_BUDGET_MS     Default per-request time budget in ms (0 = no deadline)
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from localization.timing import count, ransac_iterations, timed
+
+PNP_METHODS = {
+    "ransac": cv2.SOLVEPNP_ITERATIVE,
+    "epnp": cv2.SOLVEPNP_EPNP,
+    "usac_default": cv2.USAC_DEFAULT,
+    "usac_fast": cv2.USAC_FAST,
+    "usac_accurate": cv2.USAC_ACCURATE,
+    "usac_magsac": cv2.USAC_MAGSAC,
+}
+PNP_METHOD = os.environ.get("MAPMATE_PNP_METHOD", "usac_magsac")
+BUDGET_MS = float(os.environ.get("MAPMATE_BUDGET_MS", "0"))
+
+REPROJECTION_ERROR_PX = 8.0
+CONFIDENCE = 0.99
+CHUNK_ITERATIONS = 25       # hypotheses per chunk when a deadline is set
+GRAVITY_CHUNK = 8           # 2-point samples scored per vectorized step (gravity-aligned)
+REFINE_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 20, 1e-6)
+MIN_REFINE_POINTS = 3       # solvePnPRefineLM needs at least this many inliers
+
+
+@dataclass
+class PnPSolution:
+    rvec: np.ndarray
+    tvec: np.ndarray
+    inliers: np.ndarray     # indices into the correspondences
+    iterations: int         # hypotheses drawn (estimated, see timing.ransac_iterations)
+    deadline_hit: bool
+
+
+def expires_after(budget_ms: Optional[float]) -> Optional[float]:
+    """
+    Absolute time.time() at which a budget starting now ends (None/0 = unbounded)
+    Taken when a request is admitted and handed to its task, so time spent
+    queued counts against the budget; wall-clock instants cross process
+    boundaries, monotonic ones do not.
+    """
+    return time.time() + budget_ms / 1000.0 if budget_ms else None
+
+
+def deadline_at(expires: Optional[float]) -> Optional[float]:
+    """time.monotonic() deadline of an expires_after() instant (None = unbounded)"""
+    return time.monotonic() + (expires - time.time()) if expires else None
+
+
+def _reprojection_inliers(pts_3d, pts_2d, rvec, tvec, K, dist) -> np.ndarray:
+    proj, _ = cv2.projectPoints(pts_3d, rvec, tvec, K, dist)
+    err = np.linalg.norm(proj.reshape(-1, 2) - pts_2d, axis=1)
+    return np.flatnonzero(err < REPROJECTION_ERROR_PX)
+
+
+def solve_pnp(
+    pts_3d: np.ndarray,
+    pts_2d: np.ndarray,
+    camera_matrix: np.ndarray,
+    dist_coeffs: np.ndarray,
+    max_iterations: int = 100,
+    method: str = PNP_METHOD,
+    deadline: Optional[float] = None,
+) -> Optional[PnPSolution]:
+    """
+    Best pose within max_iterations (and the deadline, if any), LM-refined
+    Returns None when no hypothesis was found.
+    """
+    flags = PNP_METHODS[method]
+    n = len(pts_2d)
+    best = None
+    drawn = 0
+    deadline_hit = False
+    rng = np.random.default_rng(0)
+
+    # -----------------------------
+    # Hypotheses (one call, or chunks checked against the deadline)
+    # -----------------------------
+    with timed("pnp"):
+        while drawn < max_iterations:
+            chunk = max_iterations - drawn
+            if deadline is not None:
+                chunk = min(chunk, CHUNK_ITERATIONS)
+            # First chunk in the given order, later ones reshuffled (fresh samples)
+            order = rng.permutation(n) if drawn else np.arange(n)
+            ok, rvec, tvec, inliers = cv2.solvePnPRansac(
+                pts_3d[order], pts_2d[order], camera_matrix, dist_coeffs,
+                iterationsCount=chunk,
+                reprojectionError=REPROJECTION_ERROR_PX,
+                confidence=CONFIDENCE,
+                flags=flags,
+            )
+            n_inliers = 0 if not ok or inliers is None else len(inliers)
+            drawn += ransac_iterations(n_inliers, n, chunk, CONFIDENCE) if n_inliers else chunk
+            if n_inliers and (best is None or n_inliers > len(best.inliers)):
+                best = PnPSolution(rvec, tvec, np.sort(order[inliers.ravel()]), 0, False)
+
+            # Adaptive termination over all chunks drawn so far
+            if best is not None and drawn >= ransac_iterations(len(best.inliers), n, max_iterations, CONFIDENCE):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                deadline_hit = drawn < max_iterations
+                break
+
+    count("ransac_iterations", drawn)
+    if deadline_hit:
+        count("deadline_hit", 1)
+    if best is None:
+        return None
+    best.iterations, best.deadline_hit = drawn, deadline_hit
+    return _refine(best, pts_3d, pts_2d, camera_matrix, dist_coeffs)
+
+
+def _refine(best: PnPSolution, pts_3d, pts_2d, camera_matrix, dist_coeffs) -> Optional[PnPSolution]:
+    """
+    LM refinement on the inliers; kept if it explains at least as many points
+    Returns None when OpenCV rejects the inlier set (degenerate frame)
+    """
+    with timed("refine"):
+        inl = best.inliers
+        if len(inl) < MIN_REFINE_POINTS:
+            return None
+        try:
+            rvec, tvec = cv2.solvePnPRefineLM(
+                pts_3d[inl], pts_2d[inl], camera_matrix, dist_coeffs,
+                best.rvec.copy(), best.tvec.copy(), REFINE_CRITERIA,
+            )
+        except cv2.error:
+            return None
+        refined = _reprojection_inliers(pts_3d, pts_2d, rvec, tvec, camera_matrix, dist_coeffs)
+        if len(refined) >= len(inl):
+            best.rvec, best.tvec, best.inliers = rvec, tvec, refined
+    return best
+
+
+# =========================================================
+# GRAVITY-ALIGNED PnP (4 DoF)
+# =========================================================
+
+def _align(down: np.ndarray, gravity: np.ndarray) -> np.ndarray:
+    """Rotation taking the building's down axis onto the camera's gravity vector"""
+    axis = np.cross(down, gravity)
+    sin, cos = np.linalg.norm(axis), float(down @ gravity)
+    if sin < 1e-9:
+        return np.eye(3) if cos > 0 else np.diag([1.0, -1.0, -1.0])   # upside down: 180° about x
+    R, _ = cv2.Rodrigues(axis / sin * np.arctan2(sin, cos))
+    return R
+
+
+def _yaw_hypotheses(u: np.ndarray, X: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """
+    Minimal 2-point solver: every pair of correspondences gives up to two
+    (cos θ, sin θ, tx, ty, tz) with u × (R_y(θ) X + t) = 0
+    u: (N, 3) bearings in the gravity-aligned camera frame, X: (N, 3) points
+    """
+    a, b = pairs[:, 0], pairs[:, 1]
+    rows = []
+    for i in (a, b):
+        u1, u2, u3 = u[i, 0], u[i, 1], u[i, 2]
+        x1, x2, x3 = X[i, 0], X[i, 1], X[i, 2]
+        zero = np.zeros_like(u1)
+        # Two independent rows of the cross product, linear in (c, s, t) + constant
+        rows.append(np.stack([u1 * x3 - u3 * x1, -u1 * x1 - u3 * x3, -u3, zero, u1, zero], 1))
+        rows.append(np.stack([u2 * x3, -u2 * x1, zero, -u3, u2, -u3 * x2], 1))
+    M = np.stack(rows, 1)                                  # (K, 4, 6)
+    A, rhs = M[:, :, :5], -M[:, :, 5]
+
+    # v = v_p + α n over the 1-D null space, then c² + s² = 1 fixes α
+    _, _, vt = np.linalg.svd(A)
+    null = vt[:, 4]                                        # (K, 5)
+    v_p = np.einsum("kij,kj->ki", np.linalg.pinv(A), rhs)
+    a2 = null[:, 0] ** 2 + null[:, 1] ** 2
+    a1 = 2 * (v_p[:, 0] * null[:, 0] + v_p[:, 1] * null[:, 1])
+    a0 = v_p[:, 0] ** 2 + v_p[:, 1] ** 2 - 1
+    disc = a1 ** 2 - 4 * a2 * a0
+    ok = (disc >= 0) & (a2 > 1e-12)
+    root = np.sqrt(np.where(ok, disc, 0))
+    out = [
+        (v_p + (alpha / np.where(ok, 2 * a2, 1))[:, None] * null)[ok]
+        for alpha in (-a1 - root, -a1 + root)
+    ]
+    return np.concatenate(out)
+
+
+def solve_pnp_gravity(
+    pts_3d: np.ndarray,
+    pts_2d: np.ndarray,
+    camera_matrix: np.ndarray,
+    dist_coeffs: np.ndarray,
+    gravity,
+    down: np.ndarray,
+    max_iterations: int = 100,
+    deadline: Optional[float] = None,
+    forward: Optional[np.ndarray] = None,
+    forward_tolerance_deg: float = 30.0,
+    min_inliers: int = MIN_REFINE_POINTS,
+) -> Optional[PnPSolution]:
+    """
+    RANSAC over the 2-point gravity-aligned solver, LM-refined
+    gravity: gravity direction in camera axes; down: the same in the building frame
+    forward: expected (x, z) ground direction of the optical axis (compass);
+             hypotheses facing further away than forward_tolerance_deg are dropped
+    Returns None when no hypothesis explains at least min_inliers points
+    (a 2-point model can "explain" just its own sample on outlier frames).
+    """
+    n = len(pts_2d)
+    if n < 2:
+        return None
+    R_g = _align(np.asarray(down, np.float64), np.asarray(gravity, np.float64))
+    X = np.asarray(pts_3d, np.float64)
+    xn = cv2.undistortPoints(np.asarray(pts_2d, np.float64).reshape(-1, 1, 2),
+                             camera_matrix, dist_coeffs).reshape(-1, 2)
+    u = np.hstack([xn, np.ones((n, 1))]) @ R_g              # rows: R_g^T · bearing
+    focal = 0.5 * (camera_matrix[0, 0] + camera_matrix[1, 1])
+    threshold = REPROJECTION_ERROR_PX / focal
+    min_cos = np.cos(np.radians(forward_tolerance_deg))
+
+    rng = np.random.default_rng(0)   # reproducible, like OpenCV's fixed RANSAC seed
+    best = None
+    drawn = 0
+    deadline_hit = False
+
+    with timed("pnp"):
+        while drawn < max_iterations:
+            chunk = min(max_iterations - drawn, GRAVITY_CHUNK)
+            first = rng.integers(0, n, chunk)
+            pairs = np.stack([first, (first + rng.integers(1, n, chunk)) % n], 1)
+            drawn += chunk
+
+            h = _yaw_hypotheses(u, X, pairs)
+            if len(h):
+                norm = np.hypot(h[:, 0], h[:, 1])[:, None]
+                c, s = (h[:, 0:1] / norm), (h[:, 1:2] / norm)
+                if forward is not None:
+                    # Optical axis in the building frame: R_y(θ)^T · R_g^T · e_z
+                    f = R_g[2]
+                    fx, fz = c * f[0] - s * f[2], s * f[0] + c * f[2]
+                    facing = (fx * forward[0] + fz * forward[1]) / np.hypot(fx, fz)
+                    keep = facing.ravel() >= min_cos
+                    h, c, s = h[keep], c[keep], s[keep]
+                # Back to camera axes (P · R_g^T), then normalized reprojection error
+                P = np.stack([
+                    c * X[:, 0] + s * X[:, 2] + h[:, 2:3],
+                    np.broadcast_to(X[:, 1] + h[:, 3:4], (len(h), n)),
+                    -s * X[:, 0] + c * X[:, 2] + h[:, 4:5],
+                ], -1) @ R_g.T
+                z = P[..., 2]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    err = np.hypot(P[..., 0] / z - xn[:, 0], P[..., 1] / z - xn[:, 1])
+                inlier = (z > 0) & (err < threshold)
+                scores = inlier.sum(1)
+                if len(scores) and scores.max() > 0:
+                    k = int(scores.argmax())
+                    if best is None or scores[k] > len(best.inliers):
+                        R = R_g @ np.array([[c[k, 0], 0, s[k, 0]], [0, 1, 0], [-s[k, 0], 0, c[k, 0]]])
+                        rvec, _ = cv2.Rodrigues(R)
+                        tvec = (R_g @ h[k, 2:5]).reshape(3, 1)
+                        best = PnPSolution(rvec, tvec, np.flatnonzero(inlier[k]), 0, False)
+
+            if best is not None and drawn >= ransac_iterations(
+                len(best.inliers), n, max_iterations, CONFIDENCE, model_points=2
+            ):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                deadline_hit = drawn < max_iterations
+                break
+
+    count("ransac_iterations", drawn)
+    count("gravity_pnp", 1)
+    if deadline_hit:
+        count("deadline_hit", 1)
+    if best is None or len(best.inliers) < max(MIN_REFINE_POINTS, min_inliers):
+        return None
+    best.iterations, best.deadline_hit = drawn, deadline_hit
+    return _refine(best, X.astype(np.float32), np.asarray(pts_2d, np.float32), camera_matrix, dist_coeffs)
@@ -0,0 +1,129 @@
+"""
+spatial.py
+---------------------------------
+Spatial index over a bank's 3D points, for position-prior matching
+
+The client's approximate map position (GPS or a previous fix, in campus
+map pixels) is taken back through the inverse of the building → map
+affine transform onto the building's ground plane (X, Z). Only points
+plausibly visible from that region are matched:
+- within the building's view distance of the region (manifest
+  "thresholds" → "view_distance", building units; uniform grid lookup)
+- seen from the region's side: when the reconstruction exported viewing
+  directions (VIEW_DIRS_FILE, the mean unit vector from each point to
+  the cameras that observed it), points only observed from the other
+  side are dropped. Without that file only the distance prunes; points
+  with a zero direction are always kept.
+
+Regions are snapped to the grid (the centre to a block of cells about a
+quarter of the radius wide, the radius up to whole blocks), so nearby
+requests share one subset; the bank caches the subset's index per
+snapped region (bank.region_index).
+
+The grid is built once per bank (CSR: points sorted by cell).
+"""
+
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+VIEW_DIRS_FILE = "view_dirs.npy"
+
+GRID_CELLS = 32             # cells along the longer ground-plane side
+SNAP_FRACTION = 4           # region centres are snapped to blocks of radius / 4
+HALF_DIAGONAL = np.sqrt(0.5)  # block centre → corner, in blocks
+
+
+def map_region_to_building(transform_matrix: np.ndarray, map_xy, radius: float) -> Tuple[np.ndarray, float]:
+    """
+    Campus map disc → building ground-plane disc
+    transform_matrix: 2x3 affine, building (x, z, 1) → map (x, y)
+    The radius is scaled by the transform's mean linear scale.
+    """
+    T = np.asarray(transform_matrix, np.float64)
+    A, t = T[:, :2], T[:, 2]
+    centre = np.linalg.solve(A, np.asarray(map_xy, np.float64) - t)
+    scale = np.sqrt(abs(np.linalg.det(A)))
+    return centre, float(radius) / scale
+
+
+def load_view_dirs(bank_dir: Path) -> Optional[np.ndarray]:
+    """Per-point viewing directions saved next to a bank, or None if not exported"""
+    path = Path(bank_dir) / VIEW_DIRS_FILE
+    return np.load(path) if path.exists() else None
+
+
+class SpatialIndex:
+    """Uniform ground-plane grid over a bank's points + per-point viewing direction"""
+
+    def __init__(
+        self,
+        points: np.ndarray,
+        view_distance: float,
+        view_dirs: Optional[np.ndarray] = None,
+        cells: int = GRID_CELLS,
+    ):
+        self.xz = np.asarray(points, np.float64)[:, [0, 2]]
+        self.lo = self.xz.min(0)
+        extent = np.maximum(self.xz.max(0) - self.lo, 1e-9)
+        self.cell = float(extent.max()) / cells
+        self.shape = np.maximum(1, np.ceil(extent / self.cell).astype(int))
+        self.view_distance = float(view_distance)
+
+        # Ground-plane viewing direction of every point (None: no facing test)
+        self.dirs = None
+        if view_dirs is not None:
+            d = np.asarray(view_dirs, np.float64)[:, [0, 2]]
+            norm = np.linalg.norm(d, axis=1, keepdims=True)
+            # Points seen from (almost) straight above or below face everywhere
+            self.dirs = np.where(norm > 1e-6, d / np.maximum(norm, 1e-9), 0.0)
+
+        # CSR grid: rows of cell c are order[start[c]:start[c + 1]]
+        cell_ids = self._cell_ids(self.xz)
+        self.order = np.argsort(cell_ids, kind="stable").astype(np.int32)
+        counts = np.bincount(cell_ids, minlength=int(self.shape.prod()))
+        self.start = np.concatenate([[0], np.cumsum(counts)])
+
+    def _cell_ids(self, xz: np.ndarray) -> np.ndarray:
+        ij = np.clip(((xz - self.lo) / self.cell).astype(int), 0, self.shape - 1)
+        return ij[:, 0] * self.shape[1] + ij[:, 1]
+
+    def snap(self, centre: np.ndarray, radius: float) -> Tuple[tuple, np.ndarray, float]:
+        """
+        (key, centre, radius) of the grid-aligned disc covering (centre, radius)
+        The centre is snapped to a block of k x k cells (k ≈ radius / 4 cells),
+        the radius rounded up to whole blocks: every disc centred in the same
+        block, with a radius in the same bucket, gets the same covering disc
+        and key. The covering disc is at most ~1.5 x the radius.
+        """
+        k = max(1, int(radius / (SNAP_FRACTION * self.cell)))
+        block = k * self.cell
+        ij = np.floor((np.asarray(centre, np.float64) - self.lo) / block).astype(int)
+        steps = max(1, int(np.ceil(radius / block)))
+        snapped = self.lo + (ij + 0.5) * block
+        return (k, int(ij[0]), int(ij[1]), steps), snapped, (steps + HALF_DIAGONAL) * block
+
+    def near(self, centre: np.ndarray, radius: float) -> np.ndarray:
+        """Rows within radius of centre (ground plane), sorted"""
+        lo = np.floor((centre - radius - self.lo) / self.cell).astype(int)
+        hi = np.floor((centre + radius - self.lo) / self.cell).astype(int)
+        lo, hi = np.maximum(lo, 0), np.minimum(hi, self.shape - 1)
+        if np.any(lo > hi):
+            return np.empty(0, np.int32)
+        ii, jj = np.meshgrid(np.arange(lo[0], hi[0] + 1), np.arange(lo[1], hi[1] + 1), indexing="ij")
+        cells = (ii * self.shape[1] + jj).ravel()
+        rows = np.concatenate([self.order[self.start[c]:self.start[c + 1]] for c in cells])
+        d = np.linalg.norm(self.xz[rows] - centre, axis=1)
+        return np.sort(rows[d <= radius])
+
+    def visible_from(self, centre: np.ndarray, radius: float) -> np.ndarray:
+        """Rows plausibly visible from a camera somewhere in the disc (centre, radius)"""
+        rows = self.near(centre, radius + self.view_distance)
+        if len(rows) == 0 or self.dirs is None:
+            return rows
+        to_camera = centre - self.xz[rows]
+        # Facing test with the disc's slack: some camera in the disc is on
+        # the side the point was observed from
+        facing = np.einsum("ij,ij->i", self.dirs[rows], to_camera) > -radius
+        return rows[facing]
@@ -0,0 +1,176 @@
+"""
+timing.py
+---------------------------------
+Per-stage timing of the localization pipeline
+- collect(): activates a StageTimer for the current request (context
+  variable, so it also works inside a worker process)
+- timed("orb") / count("keypoints", n): no-ops when nothing is collecting
+- StageTimer.server_timing(): value of the HTTP Server-Timing header
+- merge_timing(): one block for a request split into several tasks
+  (queue wait, when reported by the engine, is kept apart from total,
+  which is compute time only)
+- TimingStats: per-building histograms of every stage, for /localize/timing/
+
+Stages: decode, orb, rank, match, pnp, transform (decode_orb for batches)
+Counters: keypoints, matches, inliers, ransac_iterations
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import numpy as np
+
+# Histogram bucket upper bounds (ms); the last bucket is open-ended
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_current: ContextVar[Optional["StageTimer"]] = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """Stage durations (ms, summed if a stage repeats) + counters of one request"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, ms: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def to_dict(self) -> dict:
+        return {
+            "stages_ms": {k: round(v, 2) for k, v in self.stages.items()},
+            "total_ms": round((time.perf_counter() - self._start) * 1e3, 2),
+            "counters": dict(self.counters),
+        }
+
+    @staticmethod
+    def server_timing(timing: dict) -> str:
+        """Server-Timing header value for a to_dict() block"""
+        parts = []
+        if "queue_ms" in timing:
+            parts.append(f"queue;dur={timing['queue_ms']}")
+        parts += [f"{stage};dur={ms}" for stage, ms in timing["stages_ms"].items()]
+        parts.append(f"total;dur={timing['total_ms']}")
+        parts += [f'{name};desc="{value}"' for name, value in timing["counters"].items()]
+        return ", ".join(parts)
+
+
+@contextmanager
+def collect():
+    """Times the pipeline stages run inside the block"""
+    timer = StageTimer()
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage, (time.perf_counter() - t0) * 1e3)
+
+
+def count(name: str, value: int):
+    timer = _current.get()
+    if timer is not None:
+        timer.count(name, value)
+
+
+def merge_timing(*blocks: dict) -> dict:
+    """Sum of to_dict() blocks of one request that ran as several tasks"""
+    merged = {"stages_ms": {}, "total_ms": 0.0, "counters": {}}
+    for block in blocks:
+        for stage, ms in block["stages_ms"].items():
+            merged["stages_ms"][stage] = round(merged["stages_ms"].get(stage, 0.0) + ms, 2)
+        for name, value in block["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + value
+        merged["total_ms"] = round(merged["total_ms"] + block["total_ms"], 2)
+        if "queue_ms" in block:
+            merged["queue_ms"] = round(merged.get("queue_ms", 0.0) + block["queue_ms"], 2)
+    return merged
+
+
+def ransac_iterations(n_inliers: int, n_points: int, max_iters: int,
+                      confidence: float = 0.99, model_points: int = 5) -> int:
+    """
+    Iterations solvePnPRansac ran, from its adaptive stopping rule
+    (OpenCV does not return the count; this mirrors RANSACUpdateNumIters)
+    """
+    if n_points <= 0:
+        return 0
+    inlier_ratio = n_inliers / n_points
+    p_good = inlier_ratio ** model_points
+    if p_good <= 0:
+        return max_iters
+    if p_good >= 1:
+        return 1
+    needed = np.log(1 - confidence) / np.log(1 - p_good)
+    return int(min(max_iters, max(1, np.ceil(needed))))
+
+
+# =========================================================
+# AGGREGATION (API PROCESS)
+# =========================================================
+
+class TimingStats:
+    """Per building and stage: request count, sum and a latency histogram"""
+
+    def __init__(self, buckets_ms: tuple = BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._stages: Dict[str, Dict[str, dict]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, building: str, stage: str, ms: float):
+        per = self._stages.setdefault(building, {})
+        h = per.get(stage)
+        if h is None:
+            h = per[stage] = {"count": 0, "sum_ms": 0.0, "buckets": [0] * (len(self.buckets_ms) + 1)}
+        h["count"] += 1
+        h["sum_ms"] += ms
+        h["buckets"][int(np.searchsorted(self.buckets_ms, ms))] += 1
+
+    def record(self, building: str, timing: dict):
+        with self._lock:
+            for stage, ms in timing["stages_ms"].items():
+                self._observe(building, stage, ms)
+            self._observe(building, "total", timing["total_ms"])
+            if "queue_ms" in timing:
+                self._observe(building, "queue", timing["queue_ms"])
+            counters = self._counters.setdefault(building, {})
+            for name, value in timing["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets_ms] + ["inf"]
+        with self._lock:
+            return {
+                building: {
+                    "stages": {
+                        stage: {
+                            "count": h["count"],
+                            "mean_ms": round(h["sum_ms"] / h["count"], 2),
+                            "histogram_ms": dict(zip(labels, h["buckets"])),
+                        }
+                        for stage, h in per.items()
+                    },
+                    "counters_total": dict(self._counters.get(building, {})),
+                }
+                for building, per in self._stages.items()
+            }
@@ -0,0 +1,213 @@
+"""
+vocab_tree.py
+---------------------------------
+Binary bag-of-visual-words vocabulary tree (Nistér & Stewénius)
+for building recognition
+- Hierarchical k-majority clustering of ORB descriptors
+- Inverted index: visual word → (building, weight)
+- TF-IDF weighting, L1-normalized scoring
+
+Ranking a query costs O(descriptors × depth × branching) + postings of
+the query's words, independent of how many descriptors the banks hold.
+
+Build offline from the registered banks (from backend/):
+    python -m localization.vocab_tree
+Banks are read one at a time while building (training sample, then the
+inverted index), so the build never holds more than one bank.
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from localization.matchers import POPCOUNT_TABLE, expand_ranges
+
+BRANCHING = 8
+DEPTH = 4                     # 8^4 = 4096 visual words
+KMAJORITY_ITERATIONS = 6
+TRAIN_PER_BUILDING = 50000    # descriptors sampled per bank for clustering
+
+
+def _distances(des: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """(n, k) Hamming distances, descriptors (n, 32) vs candidate centers (n, k, 32)"""
+    return POPCOUNT_TABLE[np.bitwise_xor(des[:, None, :], centers)].sum(axis=2)
+
+
+def _kmajority(des: np.ndarray, k: int, rng) -> np.ndarray:
+    """k binary centers of `des` (bitwise majority vote per cluster)"""
+    centers = des[rng.choice(len(des), k, replace=len(des) < k)].copy()
+    bits = np.unpackbits(des, axis=1)
+    for _ in range(KMAJORITY_ITERATIONS):
+        assign = _distances(des, np.broadcast_to(centers, (len(des), k, 32))).argmin(axis=1)
+        for c in range(k):
+            members = bits[assign == c]
+            if len(members):
+                centers[c] = np.packbits(members.mean(axis=0) >= 0.5)
+    return centers
+
+
+class VocabularyTree:
+    """Complete k-ary tree; level l holds k^(l+1) centers, leaves are words"""
+
+    def __init__(self, levels: List[np.ndarray], buildings: List[str],
+                 idf: np.ndarray, post_start: np.ndarray,
+                 post_building: np.ndarray, post_weight: np.ndarray,
+                 stamps: Optional[List[str]] = None):
+        self.levels = levels
+        self.branching = len(levels[0])
+        self.buildings = buildings
+        self.idf = idf                        # (W,)
+        self.post_start = post_start          # (W + 1,) CSR offsets into postings
+        self.post_building = post_building    # (P,) building id
+        self.post_weight = post_weight        # (P,) L1-normalized TF-IDF weight
+        self.stamps = stamps                  # per building: the bank it was built from, if known
+
+    @property
+    def n_words(self) -> int:
+        return len(self.levels[-1])
+
+    # -----------------------------
+    # Quantization
+    # -----------------------------
+    def quantize(self, des: np.ndarray) -> np.ndarray:
+        """Visual word id of every descriptor (greedy descent)"""
+        des = np.ascontiguousarray(des, dtype=np.uint8)
+        k = self.branching
+        node = np.zeros(len(des), np.int64)
+        for level, centers in enumerate(self.levels):
+            first_child = node * k if level else np.zeros_like(node)
+            children = first_child[:, None] + np.arange(k)
+            best = _distances(des, centers[children]).argmin(axis=1)
+            node = first_child + best
+        return node
+
+    def _bow(self, words: np.ndarray):
+        """Unique words with L1-normalized TF-IDF weights"""
+        uniq, counts = np.unique(words, return_counts=True)
+        w = counts * self.idf[uniq]
+        total = w.sum()
+        return uniq, (w / total if total > 0 else w)
+
+    # -----------------------------
+    # Scoring
+    # -----------------------------
+    def rank(self, des: np.ndarray) -> List[Tuple[str, float]]:
+        """
+        Buildings sorted by similarity to the query (score in [0, 1])
+        L1 score 1 - |q - d|/2, accumulated over the inverted lists of the
+        query's words only.
+        """
+        if des is None or len(des) == 0:
+            return []
+        words, q = self._bow(self.quantize(des))
+        lo = self.post_start[words]
+        counts = self.post_start[words + 1] - lo
+        owner, pos = expand_ranges(lo, counts)
+
+        b = self.post_building[pos]
+        d = self.post_weight[pos]
+        qw = q[owner]
+        # |q - d|_1 = 2 + sum over shared words of (|q - d| - q - d)
+        acc = np.zeros(len(self.buildings))
+        np.add.at(acc, b, np.abs(qw - d) - qw - d)
+        scores = -acc / 2.0
+
+        order = np.argsort(-scores, kind="stable")
+        return [(self.buildings[i], float(scores[i])) for i in order]
+
+    # -----------------------------
+    # Build / persist
+    # -----------------------------
+    @classmethod
+    def build(cls, banks: Dict[str, Callable[[], np.ndarray]], branching: int = BRANCHING,
+              depth: int = DEPTH, seed: int = 0) -> "VocabularyTree":
+        """banks: building → loader of its (N, 32) descriptors (called twice, one bank at a time)"""
+        rng = np.random.default_rng(seed)
+        names = list(banks)
+
+        train = []
+        for name in names:
+            des = np.asarray(banks[name]())
+            if len(des) > TRAIN_PER_BUILDING:
+                des = des[rng.choice(len(des), TRAIN_PER_BUILDING, replace=False)]
+            train.append(np.array(des, np.uint8))
+        train = np.vstack(train)
+
+        # Level by level: split every node's descriptors into `branching` children
+        levels = []
+        node_of = np.zeros(len(train), np.int64)
+        for level in range(depth):
+            n_nodes = branching ** level
+            centers = np.zeros((n_nodes * branching, 32), np.uint8)
+            for node in range(n_nodes):
+                members = train[node_of == node]
+                if len(members) == 0:
+                    members = train[rng.choice(len(train), 1)]
+                centers[node * branching:(node + 1) * branching] = _kmajority(members, branching, rng)
+            levels.append(centers)
+
+            children = node_of[:, None] * branching + np.arange(branching)
+            node_of = children[np.arange(len(train)), _distances(train, centers[children]).argmin(axis=1)]
+
+        tree = cls(levels, names, np.ones(len(levels[-1])), np.zeros(1, np.int64),
+                   np.zeros(0, np.int64), np.zeros(0))
+        tree._index_banks(banks)
+        return tree
+
+    def _index_banks(self, banks: Dict[str, Callable[[], np.ndarray]]):
+        """Fill IDF + inverted index from the full banks"""
+        n_words, n_b = self.n_words, len(self.buildings)
+        tf = np.zeros((n_words, n_b))
+        for b, name in enumerate(self.buildings):
+            tf[:, b] = np.bincount(self.quantize(banks[name]()), minlength=n_words)
+
+        df = (tf > 0).sum(axis=1)
+        self.idf = np.where(df > 0, np.log((n_b + 1) / (df + 0.5)), 0.0)
+
+        weights = tf * self.idf[:, None]
+        weights /= np.maximum(weights.sum(axis=0, keepdims=True), 1e-12)
+
+        word, building = np.nonzero(weights)            # row-major → sorted by word
+        self.post_building = building.astype(np.int64)
+        self.post_weight = weights[word, building]
+        self.post_start = np.searchsorted(word, np.arange(n_words + 1)).astype(np.int64)
+
+    def save(self, path: Path):
+        np.savez(
+            path,
+            buildings=np.array(self.buildings),
+            idf=self.idf,
+            post_start=self.post_start,
+            post_building=self.post_building,
+            post_weight=self.post_weight,
+            **({"stamps": np.array(self.stamps)} if self.stamps is not None else {}),
+            **{f"level_{i}": c for i, c in enumerate(self.levels)},
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "VocabularyTree":
+        data = np.load(path)
+        levels = []
+        while f"level_{len(levels)}" in data:
+            levels.append(data[f"level_{len(levels)}"])
+        stamps = [str(s) for s in data["stamps"]] if "stamps" in data else None
+        return cls(levels, [str(b) for b in data["buildings"]], data["idf"],
+                   data["post_start"], data["post_building"], data["post_weight"], stamps)
+
+
+def main():
+    import time
+    import building_detector
+
+    t0 = time.perf_counter()
+    tree = building_detector.build_vocabulary_tree()
+    tree.save(building_detector.VOCAB_TREE_PATH)
+    print(
+        f"✅ Vocabulary tree: {tree.n_words} words over {len(tree.buildings)} building(s) "
+        f"in {time.perf_counter() - t0:.1f}s → {building_detector.VOCAB_TREE_PATH}"
+    )
+
+
+if __name__ == "__main__":
+    main()
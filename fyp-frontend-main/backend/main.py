@@ -4,7 +4,7 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from starlette.requests import Request
-from routes import localize, navigate
+from routes import localize, localize_stream, navigate
 
 app = FastAPI()
 
@@ -17,6 +17,7 @@ app.add_middleware(
 )
 
 app.include_router(localize.router)
+app.include_router(localize_stream.router)
 app.include_router(navigate.router)
 
 
@@ -1,45 +1,343 @@
-from fastapi import APIRouter, UploadFile, File
-from typing import Optional
-import shutil
-import os
-from pathlib import Path
+import asyncio
+import time
 
-# Import your building localizers
-from Library.LC_Lib import localize_library
+from fastapi import APIRouter, UploadFile, File, Response
+from fastapi.responses import JSONResponse
+from typing import List, Optional
+
+# Buildings come from the manifest (buildings.json); importing registers their banks
+import localization.buildings  # noqa: F401
+from building_detector import load_vocabulary_tree
+from localization.engine import EngineOverloaded, LocalizationEngine
+from localization.features import InvalidFeatures, decode_features
+from localization.frame_cache import FrameCache, perceptual_hash
+from localization.imaging import UploadTooLarge, encoded_size, read_upload
+from localization.pipeline import DEFAULT_PROFILE, PROFILES
+from localization.registry import banks
+from localization.sensors import DeviceIntrinsics, InvalidSensors
+from localization.sessions import SessionStore
+from localization.solver import BUDGET_MS
+from localization.timing import StageTimer, TimingStats
 
 router = APIRouter()
 
-# Temporary upload folder
-UPLOAD_DIR = (Path(__file__).resolve().parent.parent / "temp_uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Most frames accepted by /localize/batch/ in one request
+MAX_BATCH_FRAMES = 8
+
+# Manifest buildings → feature banks (lazy, memory-budgeted; see localization/registry.py)
+LOCALIZERS = banks
+
+# building=auto: recognize the building from the frame's own features
+AUTO_BUILDING = "auto"
+
+# Uncertainty (map px) of a map_x/map_y position prior sent without a radius
+DEFAULT_RADIUS_PX = 30.0
+
+# In-process or worker-pool execution (see localization/engine.py)
+engine = LocalizationEngine(LOCALIZERS)
+
+# Last pose per AR tracking session (see localization/sessions.py)
+sessions = SessionStore()
+
+# Intrinsics per phone model, reused when a request omits them (see localization/sensors.py)
+devices = DeviceIntrinsics()
+
+# Results of recent frames, reused for near-duplicates (see localization/frame_cache.py)
+frame_cache = FrameCache()
+
+# Per-building stage histograms (see localization/timing.py)
+timing_stats = TimingStats()
+
+
+def _with_timing(building: str, result: dict, timing: dict, response: Response, debug: bool) -> dict:
+    """Server-Timing header, optional debug block, histogram update"""
+    timing_stats.record(building, timing)
+    response.headers["Server-Timing"] = StageTimer.server_timing(timing)
+    if debug:
+        result = {**result, "debug": timing}
+    return result
+
+
+async def localize_upload(
+    building: str,
+    data: bytes,
+    session_id: Optional[str] = None,
+    profile: str = DEFAULT_PROFILE,
+    budget_ms: float = BUDGET_MS,
+    region: Optional[tuple] = None,
+    sensors=None,
+):
+    """
+    Frame cache → session prior → engine, shared by POST /localize/ and
+    the WebSocket stream. Returns (result, timing); raises EngineOverloaded.
+    building=auto keeps tracking the building a session was last found in
+    and only runs recognition when there is none.
+    """
+    target = building
+    if building == AUTO_BUILDING and session_id is not None:
+        target = sessions.building(session_id) or AUTO_BUILDING
+    prior = None
+    if target != AUTO_BUILDING and session_id is not None:
+        prior = sessions.prior(session_id, target)
+
+    # The key holds every request parameter that changes the answer. A frame
+    # tracked from a session's last pose depends on that session, so it skips
+    # the cache both ways.
+    cache_key = f"{target}/{profile}/{budget_ms}/{region}/{sensors}"
+    t0 = time.perf_counter()
+    frame_hash = None
+    if frame_cache.enabled and prior is None:
+        frame_hash = await asyncio.to_thread(perceptual_hash, data)
+    result = frame_cache.get(cache_key, frame_hash)
+    cache_ms = round((time.perf_counter() - t0) * 1e3, 2)
+
+    if result is not None:
+        result = {**result, "cached": True}
+        timing = {"stages_ms": {"cache": cache_ms}, "total_ms": cache_ms, "counters": {}}
+    else:
+        if target == AUTO_BUILDING:
+            result = await engine.localize_auto(data, profile, budget_ms, region, sensors)
+        else:
+            result = await engine.localize(target, data, prior, profile, budget_ms, region, sensors)
+        timing = result.pop("timing")
+        timing["stages_ms"] = {"cache": cache_ms, **timing["stages_ms"]}
+        timing["total_ms"] = round(timing["total_ms"] + cache_ms, 2)
+        if result.get("success"):    # a failure may succeed on the next, nearly equal frame
+            frame_cache.put(cache_key, frame_hash, dict(result))
+
+    if building == AUTO_BUILDING and target != AUTO_BUILDING:
+        result["detected"] = target
+    if session_id is not None:
+        sessions.update(session_id, result.get("detected", building), result)
+    return result, timing
+
+
+def _invalid_sensors(e: InvalidSensors) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"success": False, "reason": str(e)})
+
+
+def _overloaded(e: EngineOverloaded) -> JSONResponse:
+    """Fast rejection when the localization queue is full"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": str(e.retry_after_s)},
+        content={"success": False, "reason": str(e), "retry_after_s": e.retry_after_s},
+    )
+
+
+@router.on_event("startup")
+def start_engine():
+    engine.start()
+    # Building recognition for building=auto: load (or build once) before serving
+    if len(LOCALIZERS):
+        load_vocabulary_tree()
+
+
+@router.on_event("shutdown")
+def stop_engine():
+    engine.shutdown()
 
-# Map building types to functions
-LOCALIZERS = {
-    "library": localize_library,
-}
 
 @router.post("/localize/")
-async def localize_building(building: str, image: UploadFile = File(...)):
+async def localize_building(
+    building: str,
+    response: Response,
+    image: UploadFile = File(...),
+    session_id: Optional[str] = None,
+    profile: str = DEFAULT_PROFILE,
+    budget_ms: float = BUDGET_MS,
+    map_x: Optional[float] = None,
+    map_y: Optional[float] = None,
+    radius: float = DEFAULT_RADIUS_PX,
+    device: Optional[str] = None,
+    intrinsics: Optional[str] = None,
+    gravity: Optional[str] = None,
+    heading: Optional[float] = None,
+    debug: bool = False,
+):
+    """
+    Receives a building name (or "auto") and image, returns 2D campus coordinates
+    With a session_id, consecutive frames are tracked from the last pose
+    profile: fast | balanced | accurate (coarse-to-fine cascade depth)
+    budget_ms: time budget; the best pose found by then is returned (0 = none)
+    map_x/map_y/radius: approximate position (GPS, last fix) in map px;
+    only bank points visible from there are matched
+    intrinsics ("fx,fy,cx,cy" in px of the uploaded frame; remembered per
+    device model), gravity ("gx,gy,gz" in camera axes) and heading (compass
+    degrees) constrain the pose solver (see localization/sensors.py)
+    Stage timings go to the Server-Timing header (and "debug" with debug=true)
+    """
+    building = building.lower()
+
+    if building not in LOCALIZERS and building != AUTO_BUILDING:
+        return {"success": False, "reason": f"Unknown building '{building}'"}
+
+    if profile not in PROFILES:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "reason": f"Unknown profile '{profile}' (use {', '.join(PROFILES)})"},
+        )
+
+    # Read the upload into memory (size-capped); decoding happens in the engine
+    try:
+        data = await read_upload(image)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"success": False, "reason": str(e)})
+
+    region = (map_x, map_y, radius) if map_x is not None and map_y is not None else None
+    try:
+        sensors = devices.sensors(encoded_size(data), device, intrinsics, gravity, heading)
+    except InvalidSensors as e:
+        return _invalid_sensors(e)
+    try:
+        result, timing = await localize_upload(building, data, session_id, profile, budget_ms, region, sensors)
+    except EngineOverloaded as e:
+        return _overloaded(e)
+    return _with_timing(building, result, timing, response, debug)
+
+
+@router.post("/localize/features/")
+async def localize_building_features(
+    building: str,
+    response: Response,
+    features: UploadFile = File(...),
+    session_id: Optional[str] = None,
+    profile: str = DEFAULT_PROFILE,
+    budget_ms: float = BUDGET_MS,
+    map_x: Optional[float] = None,
+    map_y: Optional[float] = None,
+    radius: float = DEFAULT_RADIUS_PX,
+    device: Optional[str] = None,
+    intrinsics: Optional[str] = None,
+    gravity: Optional[str] = None,
+    heading: Optional[float] = None,
+    debug: bool = False,
+):
     """
-    Receives a building name and image, returns 2D campus coordinates
+    Like /localize/, but the client uploads its own ORB features
+    (binary payload, see localization/features.py) instead of the image:
+    the server only matches and solves PnP
     """
     building = building.lower()
 
     if building not in LOCALIZERS:
         return {"success": False, "reason": f"Unknown building '{building}'"}
 
-    # Save uploaded image to disk
-    img_path = UPLOAD_DIR / image.filename
-    with open(img_path, "wb") as f:
-        shutil.copyfileobj(image.file, f)
+    if profile not in PROFILES:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "reason": f"Unknown profile '{profile}' (use {', '.join(PROFILES)})"},
+        )
 
-    # Call the corresponding localization function
-    result = LOCALIZERS[building](str(img_path))
+    try:
+        payload = decode_features(await read_upload(features))
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"success": False, "reason": str(e)})
+    except InvalidFeatures as e:
+        return JSONResponse(status_code=400, content={"success": False, "reason": str(e)})
 
-    # Optional: delete the temp file after processing
+    region = (map_x, map_y, radius) if map_x is not None and map_y is not None else None
     try:
-        os.remove(img_path)
-    except:
-        pass
+        # Intrinsics refer to the image size in the payload header
+        sensors = devices.sensors(payload[2], device, intrinsics, gravity, heading)
+    except InvalidSensors as e:
+        return _invalid_sensors(e)
+    prior = sessions.prior(session_id, building) if session_id is not None else None
+    try:
+        result = await engine.localize_client_features(building, payload, prior, profile, budget_ms,
+                                                       region, sensors)
+    except EngineOverloaded as e:
+        return _overloaded(e)
+    if session_id is not None:
+        sessions.update(session_id, building, result)
 
-    return result
+    timing = result.pop("timing")
+    return _with_timing(building, result, timing, response, debug)
+
+
+@router.post("/localize/batch/")
+async def localize_building_batch(
+    building: str,
+    response: Response,
+    images: List[UploadFile] = File(...),
+    profile: str = DEFAULT_PROFILE,
+    budget_ms: float = BUDGET_MS,
+    map_x: Optional[float] = None,
+    map_y: Optional[float] = None,
+    radius: float = DEFAULT_RADIUS_PX,
+    device: Optional[str] = None,
+    intrinsics: Optional[str] = None,
+    gravity: Optional[str] = None,
+    heading: Optional[float] = None,
+    debug: bool = False,
+):
+    """
+    Receives a burst of frames of one building
+    Returns per-frame results plus the best and the fused campus coordinates
+    profile, budget_ms, map_x/map_y/radius and the sensor parameters work as
+    for /localize/ and apply to every frame (intrinsics: in px of the frames)
+    """
+    building = building.lower()
+
+    if building not in LOCALIZERS:
+        return {"success": False, "reason": f"Unknown building '{building}'"}
+
+    if len(images) > MAX_BATCH_FRAMES:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "reason": f"At most {MAX_BATCH_FRAMES} frames per batch"},
+        )
+
+    if profile not in PROFILES:
+        return JSONResponse(
+            status_code=400,
+            content={"success": False, "reason": f"Unknown profile '{profile}' (use {', '.join(PROFILES)})"},
+        )
+
+    try:
+        frames = [await read_upload(image) for image in images]
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"success": False, "reason": str(e)})
+
+    region = (map_x, map_y, radius) if map_x is not None and map_y is not None else None
+    try:
+        sensors = devices.sensors(encoded_size(frames[0]) if frames else None,
+                                  device, intrinsics, gravity, heading)
+    except InvalidSensors as e:
+        return _invalid_sensors(e)
+    try:
+        result = await engine.localize_batch(building, frames, profile, budget_ms, region, sensors)
+    except EngineOverloaded as e:
+        return _overloaded(e)
+    timing = result.pop("timing")
+    return _with_timing(building, result, timing, response, debug)
+
+
+@router.get("/localize/banks/")
+def bank_stats():
+    """Resident feature banks and load/eviction counters"""
+    return LOCALIZERS.stats()
+
+
+@router.get("/localize/devices/")
+def device_stats():
+    """Device models with remembered intrinsics"""
+    return devices.stats()
+
+
+@router.get("/localize/cache/")
+def frame_cache_stats():
+    """Near-duplicate frame cache hit rate and size"""
+    return frame_cache.stats()
+
+
+@router.get("/localize/queue/")
+def queue_stats():
+    """Localization slots, queue occupancy and rejections"""
+    return engine.stats()
+
+
+@router.get("/localize/timing/")
+def stage_timing_stats():
+    """Per-building stage latency histograms and counter totals"""
+    return timing_stats.snapshot()
@@ -0,0 +1,124 @@
+"""
+localize_stream.py
+---------------------------------
+WebSocket pose stream for the AR view
+
+    ws://<host>/localize/stream/?building=library[&profile=fast][&budget_ms=150]
+    (building=auto recognizes the building, then keeps tracking it)
+
+- The client sends binary JPEG/PNG frames whenever it likes; a text
+  message is answered with an error result ("frame": null) and ignored
+- The server keeps only the NEWEST unprocessed frame per connection:
+  a frame that arrives while another is waiting replaces it, so stale
+  frames are dropped, never processed
+- Each result is pushed back as JSON as soon as it is ready, tagged with
+  the frame number it belongs to
+- The connection is one tracking session (see localization/sessions.py)
+"""
+
+import asyncio
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+
+from localization.engine import EngineOverloaded
+from localization.imaging import MAX_UPLOAD_BYTES, UploadTooLarge
+from localization.pipeline import DEFAULT_PROFILE, PROFILES
+from localization.solver import BUDGET_MS
+from routes.localize import AUTO_BUILDING, LOCALIZERS, localize_upload, sessions, timing_stats
+
+router = APIRouter()
+
+
+class LatestFrame:
+    """Single-slot mailbox: put() overwrites whatever was not taken yet"""
+
+    def __init__(self):
+        self._frame: Optional[tuple] = None
+        self._ready = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, data: bytes):
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (self.received, data)
+        self._ready.set()
+
+    async def take(self) -> tuple:
+        await self._ready.wait()
+        frame, self._frame = self._frame, None
+        self._ready.clear()
+        return frame
+
+
+@router.websocket("/localize/stream/")
+async def localize_stream(
+    websocket: WebSocket,
+    building: str,
+    profile: str = DEFAULT_PROFILE,
+    budget_ms: float = BUDGET_MS,
+):
+    building = building.lower()
+    await websocket.accept()
+
+    known = building in LOCALIZERS or building == AUTO_BUILDING
+    if not known or profile not in PROFILES:
+        reason = (f"Unknown building '{building}'" if not known
+                  else f"Unknown profile '{profile}' (use {', '.join(PROFILES)})")
+        await websocket.send_json({"success": False, "reason": reason})
+        await websocket.close(code=1008)
+        return
+
+    session_id = f"ws-{uuid.uuid4().hex}"
+    mailbox = LatestFrame()
+    send_lock = asyncio.Lock()
+
+    async def send(payload: dict):
+        # Both loops send; a client that already left ends the stream quietly
+        async with send_lock:
+            if websocket.client_state == WebSocketState.DISCONNECTED:
+                raise WebSocketDisconnect()
+            await websocket.send_json(payload)
+
+    async def receive():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                mailbox.put(message["bytes"])
+            else:
+                await send({"success": False, "reason": "Frames must be binary JPEG/PNG messages",
+                            "frame": None, "dropped": mailbox.dropped})
+
+    async def process():
+        while True:
+            frame, data = await mailbox.take()
+            try:
+                if len(data) > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(MAX_UPLOAD_BYTES)
+                result, timing = await localize_upload(building, data, session_id, profile, budget_ms)
+                timing_stats.record(building, timing)
+                result = {**result, "timing": timing}
+            except UploadTooLarge as e:
+                result = {"success": False, "reason": str(e)}
+            except EngineOverloaded as e:
+                result = {"success": False, "reason": str(e), "retry_after_s": e.retry_after_s}
+            await send({**result, "frame": frame, "dropped": mailbox.dropped})
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(process())]
+    try:
+        # The client leaving ends the stream; any other error is a real failure
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            exc = task.exception()
+            if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                raise exc
+    finally:
+        for task in tasks:
+            task.cancel()
+        sessions.update(session_id, building, {"success": False})   # ends the session
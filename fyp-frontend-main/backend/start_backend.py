@@ -20,13 +20,18 @@ def main():
     # Check if required files exist
     required_files = [
         "main.py",
-        "Library/LC_Lib.py",
-        "Library/keypoints_3d.npy",
-        "Library/descriptors_3d.npy",
+        "buildings.json",
         "maps/campus_graph.json",
-        "transform_library.json"
     ]
 
+    # A bank bundle replaces the loose feature files
+    if not (backend_dir / "Library/bank.mmb").exists():
+        required_files += [
+            "Library/keypoints_3d.npy",
+            "Library/descriptors_3d.npy",
+            "transform_library.json",
+        ]
+
     optional_files = [
         "maps/giki_graph.json",
     ]
@@ -0,0 +1,71 @@
+"""
+conftest.py
+---------------------------------
+Shared fixtures of the localization tests (run from backend/: python -m pytest tests)
+Synthetic data only: no bank files, no images.
+"""
+
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+IMAGE_SIZE = (1280, 720)
+NO_DIST = np.zeros((4, 1))
+
+
+def noisy_copies(descriptors: np.ndarray, bits: int, rng: np.random.Generator) -> np.ndarray:
+    """Copies of descriptors with `bits` random bits flipped in each row"""
+    unpacked = np.unpackbits(descriptors, axis=1)
+    for row in unpacked:
+        flip = rng.choice(unpacked.shape[1], bits, replace=False)
+        row[flip] ^= 1
+    return np.packbits(unpacked, axis=1)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def rotation_error_deg(rvec, R_true) -> float:
+    R, _ = cv2.Rodrigues(rvec)
+    cos = (np.trace(R.T @ R_true) - 1) / 2
+    return float(np.degrees(np.arccos(np.clip(cos, -1, 1))))
+
+
+@pytest.fixture
+def camera_matrix():
+    return np.array([[1000.0, 0, 640], [0, 1000.0, 360], [0, 0, 1]])
+
+
+@pytest.fixture
+def scene(rng, camera_matrix):
+    """
+    300 points in front of a camera, their projections, and the true pose
+    The camera is upright (building Y-down), turned 25° about the vertical axis.
+    """
+    yaw = np.radians(25.0)
+    R = np.array([[np.cos(yaw), 0, np.sin(yaw)], [0, 1, 0], [-np.sin(yaw), 0, np.cos(yaw)]])
+    rvec, _ = cv2.Rodrigues(R)
+    tvec = np.array([[0.5], [-1.0], [2.0]])
+
+    cam = np.column_stack([rng.uniform(-6, 6, 300), rng.uniform(-3, 3, 300), rng.uniform(8, 20, 300)])
+    pts_3d = (R.T @ (cam.T - tvec)).T
+    pts_2d, _ = cv2.projectPoints(pts_3d, rvec, tvec, camera_matrix, None)
+    pts_2d = pts_2d.reshape(-1, 2) + rng.normal(0, 0.5, (300, 2))
+    return pts_3d.astype(np.float32), pts_2d.astype(np.float32), R, tvec
+
+
+def with_outliers(pts_2d: np.ndarray, share: float, rng: np.random.Generator) -> tuple:
+    """pts_2d with a share of rows replaced by random pixels; returns (pts, outlier mask)"""
+    out = pts_2d.copy()
+    bad = rng.random(len(out)) < share
+    out[bad] = rng.uniform([0, 0], IMAGE_SIZE, (int(bad.sum()), 2))
+    return out, bad
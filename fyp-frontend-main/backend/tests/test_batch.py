@@ -0,0 +1,59 @@
+"""Batched matching and burst fusion (localization/matchers.py, localization/pipeline.py)"""
+
+import numpy as np
+import pytest
+
+from conftest import noisy_copies
+from localization.matchers import BruteForceIndex, Matches, one_to_one
+from localization.pipeline import FUSE_RADIUS_PX, fuse_results
+
+
+@pytest.fixture
+def bank(rng):
+    return rng.integers(0, 256, (5000, 32), dtype=np.uint8)
+
+
+def hit(x, y, confidence):
+    return {"success": True, "map_x": x, "map_y": y, "confidence": confidence}
+
+
+def test_match_many_keeps_frames_independent(bank, rng):
+    """Two frames seeing the same points both keep them (no cross-frame stealing)"""
+    rows = rng.choice(len(bank), 300, replace=False)
+    a, b = noisy_copies(bank[rows], 8, rng), noisy_copies(bank[rows], 8, rng)
+    index = BruteForceIndex(bank)
+
+    per_frame = index.match_many([a, b])
+
+    for frame, m in zip((a, b), per_frame):
+        single = index.match(frame)
+        assert set(zip(single.query_idx.tolist(), single.train_idx.tolist())) <= \
+            set(zip(m.query_idx.tolist(), m.train_idx.tolist()))
+        assert len(np.unique(m.train_idx)) == len(m)
+
+
+def test_one_to_one_keeps_the_closest_query():
+    m = Matches(np.array([0, 1, 2], np.int32), np.array([7, 7, 9], np.int32), np.array([30, 10, 5], np.float32))
+    kept = one_to_one(m)
+    assert sorted(zip(kept.query_idx.tolist(), kept.train_idx.tolist())) == [(1, 7), (2, 9)]
+
+
+def test_fuse_is_none_without_a_success():
+    assert fuse_results([{"success": False, "reason": "PnP failed"}]) is None
+
+
+def test_fuse_weights_by_confidence():
+    fused = fuse_results([hit(100.0, 100.0, 0.75), hit(104.0, 100.0, 0.25)])
+    assert fused["map_x"] == pytest.approx(101.0)
+    assert fused["map_y"] == pytest.approx(100.0)
+    assert fused["confidence"] == 0.75
+    assert fused["frames_used"] == 2
+
+
+def test_fuse_drops_frames_far_from_the_median():
+    outlier = hit(100.0 + 4 * FUSE_RADIUS_PX, 100.0, 0.9)
+    fused = fuse_results([hit(100.0, 100.0, 0.5), hit(102.0, 100.0, 0.5), outlier,
+                          {"success": False, "reason": "PnP failed"}])
+    assert fused["frames_used"] == 2
+    assert fused["map_x"] == pytest.approx(101.0)
+    assert fused["confidence"] == 0.5
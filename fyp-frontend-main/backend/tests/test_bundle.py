@@ -0,0 +1,80 @@
+"""Memory-mapped bank bundles (localization/bundle.py)"""
+
+import struct
+
+import numpy as np
+import pytest
+
+from localization.bank import FeatureBank
+from localization.bundle import BUNDLE_VERSION, open_bundle, read_header, write_bundle
+
+
+def make_bank(rng, n=500, labels=True, view_dirs=True) -> FeatureBank:
+    return FeatureBank(
+        "Test",
+        rng.normal(0, 5, (n, 3)).astype(np.float32),
+        rng.integers(0, 256, (n, 32), dtype=np.uint8),
+        np.array([[2.0, 0.0, 100.0], [0.0, 2.0, 50.0]]),
+        np.array([[900, 0, 640], [0, 900, 360], [0, 0, 1]], np.float32),
+        np.zeros((4, 1)),
+        (1280, 720),
+        "bruteforce",
+        labels=rng.integers(0, 4, n).astype(np.int32) if labels else None,
+        view_dirs=rng.normal(size=(n, 3)).astype(np.float32) if view_dirs else None,
+    )
+
+
+@pytest.mark.parametrize("optional", [True, False])
+def test_round_trip(tmp_path, rng, optional):
+    bank = make_bank(rng, labels=optional, view_dirs=optional)
+    path = write_bundle(tmp_path / "bank.mmb", bank)
+    opened = open_bundle(path)
+
+    assert opened.building == "Test" and opened.bundle_path == str(path)
+    assert isinstance(opened.descriptors, np.memmap)
+    np.testing.assert_array_equal(opened.points, bank.points)
+    np.testing.assert_array_equal(opened.descriptors, bank.descriptors)
+    np.testing.assert_allclose(opened.transform_matrix, bank.transform_matrix)
+    np.testing.assert_allclose(opened.camera_matrix, bank.camera_matrix)
+    assert opened.calibration_size == (1280, 720)
+    if optional:
+        np.testing.assert_array_equal(opened.labels, bank.labels)
+        np.testing.assert_array_equal(opened.view_dirs, bank.view_dirs)
+    else:
+        assert opened.labels is None and opened.view_dirs is None
+
+
+def test_arrays_are_aligned_and_read_only(tmp_path, rng):
+    path = write_bundle(tmp_path / "bank.mmb", make_bank(rng))
+    header = read_header(path)
+    assert all(a["offset"] % 64 == 0 for a in header["arrays"].values())
+    with pytest.raises(ValueError):
+        open_bundle(path).descriptors[0, 0] = 1
+
+
+def test_rejects_foreign_and_newer_files(tmp_path, rng):
+    path = write_bundle(tmp_path / "bank.mmb", make_bank(rng))
+    data = path.read_bytes()
+
+    (tmp_path / "foreign.mmb").write_bytes(b"NOTABANK" + data[8:])
+    with pytest.raises(ValueError, match="not a feature-bank bundle"):
+        open_bundle(tmp_path / "foreign.mmb")
+
+    (tmp_path / "newer.mmb").write_bytes(data[:8] + struct.pack("<I", BUNDLE_VERSION + 1) + data[12:])
+    with pytest.raises(ValueError, match="unsupported bundle version"):
+        open_bundle(tmp_path / "newer.mmb")
+
+
+def test_mih_tables_are_mapped_from_the_bundle(tmp_path, rng):
+    bank = make_bank(rng)
+    plain = open_bundle(write_bundle(tmp_path / "plain.mmb", bank), "mih")
+    indexed = open_bundle(write_bundle(tmp_path / "indexed.mmb", bank, mih=True), "mih")
+
+    assert plain.mih_tables is None
+    order, keys = indexed.mih_tables
+    assert isinstance(order, np.memmap) and isinstance(keys, np.memmap)
+    assert indexed.full_index.order is order and indexed.nbytes > plain.nbytes
+
+    query = bank.descriptors[::5]
+    for built, mapped in zip(plain.full_index.match(query), indexed.full_index.match(query)):
+        np.testing.assert_array_equal(built, mapped)
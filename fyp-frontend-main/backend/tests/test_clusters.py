@@ -0,0 +1,70 @@
+"""Viewpoint-clustered matching (localization/clusters.py)"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from conftest import noisy_copies
+from localization import clusters as clusters_module
+from localization.clusters import ClusteredIndex
+
+
+@pytest.fixture
+def clustered(rng):
+    """4 clusters of 1000 random descriptors, top-1 retrieval"""
+    descriptors = rng.integers(0, 256, (4000, 32), dtype=np.uint8)
+    labels = np.repeat(np.arange(4, dtype=np.int32), 1000)
+    return ClusteredIndex(descriptors, labels, "bruteforce", top=1)
+
+
+def frame_of(index, c, rng, n=300):
+    """Noisy copies of n points of cluster c, and their bank rows"""
+    rows = rng.choice(index.members[c], n, replace=False)
+    return noisy_copies(index.descriptors[rows], 8, rng), rows
+
+
+def pairs(m):
+    return set(zip(m.query_idx.tolist(), m.train_idx.tolist()))
+
+
+def test_match_many_retrieves_per_frame(clustered, rng):
+    """Frames of different clusters each get their own cluster, as with match()"""
+    (a, rows_a), (b, rows_b) = frame_of(clustered, 0, rng), frame_of(clustered, 3, rng)
+
+    many = clustered.match_many([a, b])
+
+    assert clustered.retrieve(a) == [0] and clustered.retrieve(b) == [3]
+    for query, rows, m in ((a, rows_a, many[0]), (b, rows_b, many[1])):
+        assert pairs(m) == pairs(clustered.match(query))
+        found = dict(pairs(m))
+        assert sum(found.get(i) == r for i, r in enumerate(rows)) >= 0.95 * len(rows)
+
+
+def test_no_votes_falls_back_to_every_cluster(clustered, rng, monkeypatch):
+    monkeypatch.setattr(clusters_module, "RETRIEVAL_MAX_DISTANCE", 0)
+    query, rows = frame_of(clustered, 2, rng)
+    assert clustered.retrieve(query) == []
+
+    for m in (clustered.match(query), clustered.match_many([query])[0]):
+        found = dict(pairs(m))
+        assert sum(found.get(i) == r for i, r in enumerate(rows)) >= 0.95 * len(rows)
+
+
+def test_cluster_index_is_built_once_under_concurrency(clustered, monkeypatch):
+    builds = []
+    build = clusters_module.build_index
+
+    def slow_build(*args, **kwargs):
+        builds.append(threading.get_ident())
+        time.sleep(0.05)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(clusters_module, "build_index", slow_build)
+    with ThreadPoolExecutor(8) as pool:
+        indexes = list(pool.map(lambda _: clustered.cluster_index(1), range(8)))
+
+    assert len(builds) == 1
+    assert all(index is indexes[0] for index in indexes)
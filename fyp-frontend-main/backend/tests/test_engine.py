@@ -0,0 +1,102 @@
+"""Localization engine scheduling (localization/engine.py), with stand-in tasks"""
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from localization import engine as engine_module
+from localization.bank import FeatureBank
+from localization.engine import LocalizationEngine
+from localization.registry import BankRegistry
+from localization.solver import deadline_at, expires_after
+
+
+def tiny_bank() -> FeatureBank:
+    return FeatureBank("Test", np.zeros((1, 3), np.float32), np.zeros((1, 32), np.uint8),
+                       np.eye(2, 3), np.eye(3, dtype=np.float32), np.zeros((4, 1)))
+
+
+@pytest.fixture
+def engine():
+    registry = BankRegistry(budget_bytes=0)
+    registry.add("test", tiny_bank)
+    eng = LocalizationEngine(registry, workers=0, threads=1, queue_depth=1)
+    yield eng
+    eng.shutdown()
+
+
+def test_expires_after_converts_to_a_monotonic_deadline():
+    assert expires_after(0) is None and deadline_at(None) is None
+    remaining = deadline_at(expires_after(200)) - time.monotonic()
+    assert 0.19 < remaining <= 0.2
+
+
+def test_budget_includes_time_spent_queued(engine, monkeypatch):
+    release = threading.Event()
+    seen = {}
+
+    def task(bank, data, prior, profile, expires, region, sensors):
+        if data == b"slow":
+            release.wait(5)
+        seen[data] = (time.time(), expires)
+        return {"success": True, "timing": {"total_ms": 1.0}}
+
+    monkeypatch.setattr(engine_module, "_local_localize", task)
+
+    async def run():
+        slow = asyncio.create_task(engine.localize("test", b"slow"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(engine.localize("test", b"queued", budget_ms=100))
+        await asyncio.sleep(0.3)     # the queued request's budget runs out while it waits
+        release.set()
+        await asyncio.gather(slow, queued)
+
+    asyncio.run(run())
+    started, expires = seen[b"queued"]
+    assert expires is not None and started > expires
+
+
+def test_full_queue_rejects_at_once(engine, monkeypatch):
+    release = threading.Event()
+
+    def task(bank, data, *args):
+        release.wait(5)
+        return {"success": True, "timing": {"total_ms": 1.0}}
+
+    monkeypatch.setattr(engine_module, "_local_localize", task)
+
+    async def run():
+        # One slot + one queued request fill the engine
+        busy = [asyncio.create_task(engine.localize("test", b"frame")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(engine_module.EngineOverloaded) as rejected:
+            await engine.localize("test", b"frame")
+        assert rejected.value.retry_after_s >= 1
+        assert engine.stats()["rejected"] == 1 and engine.stats()["queued"] == 1
+        release.set()
+        await asyncio.gather(*busy)
+
+    asyncio.run(run())
+    assert engine.in_flight == 0
+
+
+def test_overload_is_a_503_with_retry_after(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from routes import localize as routes
+
+    async def overloaded(*args, **kwargs):
+        raise engine_module.EngineOverloaded(3)
+
+    monkeypatch.setattr(routes.engine, "localize", overloaded)
+    app = FastAPI()
+    app.include_router(routes.router)
+
+    response = TestClient(app).post("/localize/?building=library", files={"image": ("f.jpg", b"\xff\xd8 frame")})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert response.json() == {"success": False, "reason": "Localization queue is full", "retry_after_s": 3}
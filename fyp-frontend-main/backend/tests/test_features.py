@@ -0,0 +1,51 @@
+"""Client feature payloads (localization/features.py)"""
+
+import struct
+
+import numpy as np
+import pytest
+
+from localization.features import (
+    FEATURES_VERSION, MAX_FEATURES, InvalidFeatures, decode_features, encode_features,
+)
+
+
+def payload(rng, n=100, size=(640, 480)):
+    kp = rng.uniform(0, 480, (n, 2)).astype(np.float32)
+    des = rng.integers(0, 256, (n, 32), dtype=np.uint8)
+    return kp, des, encode_features(kp, des, size)
+
+
+def test_round_trip(rng):
+    kp, des, data = payload(rng)
+    kp2, des2, size = decode_features(data)
+    assert size == (640, 480)
+    np.testing.assert_array_equal(kp2, kp)
+    np.testing.assert_array_equal(des2, des)
+
+
+def test_empty_payload_round_trips(rng):
+    kp2, des2, size = decode_features(encode_features(np.empty((0, 2)), np.empty((0, 32)), (10, 10)))
+    assert kp2.shape == (0, 2) and des2.shape == (0, 32) and size == (10, 10)
+
+
+@pytest.mark.parametrize("mutate, reason", [
+    (lambda d: d[:10], "too short"),
+    (lambda d: b"XXXX" + d[4:], "bad magic"),
+    (lambda d: d[:4] + struct.pack("<H", FEATURES_VERSION + 1) + d[6:], "Unsupported"),
+    (lambda d: d[:-1], "expected"),
+    (lambda d: d + b"\0", "expected"),
+    (lambda d: d[:8] + struct.pack("<H", 0) + d[10:], "Image size"),
+    (lambda d: d[:12] + struct.pack("<I", MAX_FEATURES + 1) + d[16:], "At most"),
+])
+def test_malformed_payloads(rng, mutate, reason):
+    _, _, data = payload(rng)
+    with pytest.raises(InvalidFeatures, match=reason):
+        decode_features(mutate(data))
+
+
+def test_non_finite_keypoints(rng):
+    kp, des, _ = payload(rng)
+    kp[3, 0] = np.nan
+    with pytest.raises(InvalidFeatures, match="finite"):
+        decode_features(encode_features(kp, des, (640, 480)))
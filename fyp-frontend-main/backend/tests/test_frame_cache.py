@@ -0,0 +1,120 @@
+"""Near-duplicate frame cache (localization/frame_cache.py) and its use by /localize/"""
+
+import asyncio
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from localization.frame_cache import FrameCache, perceptual_hash
+from localization.sessions import SessionStore
+
+
+@pytest.fixture
+def frame(rng):
+    """A textured JPEG and a copy shifted by 4 px"""
+    texture = cv2.resize(rng.integers(0, 256, (60, 80), dtype=np.uint8), (640, 480), interpolation=cv2.INTER_CUBIC)
+    shifted = np.roll(texture, 4, axis=1)
+    return cv2.imencode(".jpg", texture)[1].tobytes(), cv2.imencode(".jpg", shifted)[1].tobytes()
+
+
+def test_near_duplicate_hits_within_tolerance(frame):
+    cache = FrameCache(tolerance=4, ttl_s=60, max_entries=8)
+    h, near = perceptual_hash(frame[0]), perceptual_hash(frame[1])
+    assert (h ^ near).bit_count() <= 4
+
+    assert cache.get("library", h) is None
+    cache.put("library", h, {"success": True})
+
+    assert cache.get("library", near) == {"success": True}
+    assert cache.get("admin", h) is None                 # another key
+    assert cache.get("library", h ^ 0b11111) is None      # 5 bits away
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+
+def test_entries_expire_after_the_ttl():
+    cache = FrameCache(tolerance=0, ttl_s=0.05, max_entries=8)
+    cache.put("library", 1, {"success": True})
+    assert cache.get("library", 1) is not None
+    time.sleep(0.1)
+    assert cache.get("library", 1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_bounded_lru_and_disabled_cache():
+    cache = FrameCache(tolerance=0, ttl_s=60, max_entries=2)
+    for h in (1, 2, 3):
+        cache.put("library", h, {"h": h})
+    assert cache.get("library", 1) is None and cache.get("library", 3) == {"h": 3}
+
+    off = FrameCache(max_entries=0)
+    off.put("library", 1, {"h": 1})
+    assert not off.enabled and off.get("library", 1) is None
+
+
+# =========================================================
+# /localize/ cache keys
+# =========================================================
+
+POSE = {"rvec": [0.0, 0.0, 0.0], "tvec": [0.0, 0.0, 0.0]}
+
+
+@pytest.fixture
+def routes(monkeypatch):
+    """routes.localize with a fresh cache and sessions, and an engine that records its calls"""
+    from routes import localize as routes
+
+    calls = []
+
+    async def localize(target, data, prior, profile, budget_ms, region, sensors):
+        calls.append((target, prior, budget_ms))
+        success = data != b"fail"
+        return {"success": success, "pose": POSE, "timing": {"stages_ms": {}, "total_ms": 1.0, "counters": {}}}
+
+    monkeypatch.setattr(routes, "frame_cache", FrameCache(tolerance=4, ttl_s=60, max_entries=8))
+    monkeypatch.setattr(routes, "sessions", SessionStore())
+    monkeypatch.setattr(routes.engine, "localize", localize)
+    monkeypatch.setattr(routes, "perceptual_hash", lambda data: 42)
+    monkeypatch.setattr(routes, "calls", calls, raising=False)
+    return routes
+
+
+def upload(routes, building="library", data=b"frame", **kwargs):
+    return asyncio.run(routes.localize_upload(building, data, **kwargs))[0]
+
+
+def test_budget_is_part_of_the_key(routes):
+    upload(routes, budget_ms=300)
+    assert upload(routes, budget_ms=300).get("cached")
+    assert not upload(routes, budget_ms=0).get("cached")
+    assert len(routes.calls) == 2
+
+
+def test_failures_are_not_cached(routes):
+    upload(routes, data=b"fail")
+    assert not upload(routes, data=b"fail").get("cached")
+    assert len(routes.calls) == 2
+
+
+def test_tracked_frames_skip_the_cache(routes):
+    upload(routes)                                        # cached for everyone
+    first = upload(routes, session_id="s1")              # no prior yet: served from the cache
+    assert first.get("cached")
+
+    tracked = upload(routes, session_id="s1")             # tracked from s1's pose
+    assert not tracked.get("cached")
+    assert routes.calls[-1][1] is not None
+    assert routes.frame_cache.stats()["entries"] == 1     # and not stored for others
+
+
+def test_auto_with_a_session_uses_the_session_building(routes):
+    upload(routes)
+    routes.sessions._sessions.clear()
+    routes.sessions.update("s1", "library", {"success": True, "pose": POSE})
+    routes.sessions._sessions["s1"].updated -= 3600      # building known, pose expired
+
+    result = upload(routes, building="auto", session_id="s1")
+
+    assert result.get("cached") and result["detected"] == "library"
+    assert len(routes.calls) == 1
@@ -0,0 +1,55 @@
+"""Gravity-aligned PnP on synthetic scenes (localization/solver.py)"""
+
+import numpy as np
+import pytest
+
+from conftest import NO_DIST, rotation_error_deg, with_outliers
+from localization.sensors import BUILDING_DOWN
+from localization.solver import MIN_REFINE_POINTS, solve_pnp_gravity
+
+
+def gravity_in_camera(R_true) -> np.ndarray:
+    """What the phone's accelerometer reports for the true pose"""
+    return R_true @ BUILDING_DOWN
+
+
+def test_solve_pnp_gravity_outlier_heavy(scene, camera_matrix, rng):
+    pts_3d, pts_2d, R, tvec = scene
+    noisy, _ = with_outliers(pts_2d, 0.7, rng)
+
+    pose = solve_pnp_gravity(pts_3d, noisy, camera_matrix, NO_DIST, gravity_in_camera(R), BUILDING_DOWN,
+                             max_iterations=500, min_inliers=15)
+
+    assert pose is not None
+    assert rotation_error_deg(pose.rvec, R) < 1.0
+    assert np.linalg.norm(pose.tvec - tvec) < 0.2
+
+
+def test_solve_pnp_gravity_heading_rejects_wrong_direction(scene, camera_matrix, rng):
+    pts_3d, pts_2d, R, _ = scene
+    optical_axis = R.T @ np.array([0.0, 0.0, 1.0])
+    backwards = -optical_axis[[0, 2]] / np.linalg.norm(optical_axis[[0, 2]])
+
+    pose = solve_pnp_gravity(pts_3d, pts_2d, camera_matrix, NO_DIST, gravity_in_camera(R), BUILDING_DOWN,
+                             max_iterations=200, forward=backwards, min_inliers=15)
+
+    assert pose is None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_solve_pnp_gravity_pure_outliers_never_raises(camera_matrix, seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(2, 40))
+    pts_3d = rng.uniform(-10, 10, (n, 3)).astype(np.float32)
+    pts_2d = rng.uniform([0, 0], [1280, 720], (n, 2)).astype(np.float32)
+
+    pose = solve_pnp_gravity(pts_3d, pts_2d, camera_matrix, NO_DIST, (0.0, 1.0, 0.0), BUILDING_DOWN,
+                             max_iterations=100)
+
+    assert pose is None or len(pose.inliers) >= MIN_REFINE_POINTS
+
+
+def test_solve_pnp_gravity_too_few_points(camera_matrix):
+    pose = solve_pnp_gravity(np.zeros((1, 3), np.float32), np.zeros((1, 2), np.float32),
+                             camera_matrix, NO_DIST, (0.0, 1.0, 0.0), BUILDING_DOWN)
+    assert pose is None
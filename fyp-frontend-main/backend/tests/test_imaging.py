@@ -0,0 +1,44 @@
+"""Intrinsics of decoded frames (localization/imaging.py scale_intrinsics)"""
+
+import numpy as np
+import pytest
+
+from localization.imaging import scale_intrinsics
+
+CALIB = (1280, 720)
+
+
+@pytest.fixture
+def K():
+    return np.array([[1000.0, 0, 650], [0, 1010.0, 355], [0, 0, 1]])
+
+
+def test_same_size_is_unchanged(K):
+    assert np.allclose(scale_intrinsics(K, CALIB, CALIB), K)
+
+
+def test_downscaled_frame_scales_focal_and_centre(K):
+    half = scale_intrinsics(K, CALIB, (640, 360))
+    assert np.allclose(half, [[500, 0, 325], [0, 505, 177.5], [0, 0, 1]])
+
+
+def test_portrait_frame_uses_the_rotated_calibration(K):
+    portrait = scale_intrinsics(K, CALIB, (720, 1280))
+    assert np.allclose(portrait, [[1010, 0, 355], [0, 1000, 650], [0, 0, 1]])
+
+    small = scale_intrinsics(K, CALIB, (360, 640))
+    assert np.allclose(small, [[505, 0, 177.5], [0, 500, 325], [0, 0, 1]])
+
+
+def test_other_aspect_is_a_centred_crop(K):
+    """A 4:3 frame with the same long edge: focal kept, principal point shifted by half the extra height"""
+    cropped = scale_intrinsics(K, CALIB, (1280, 960))
+    assert np.allclose(cropped[[0, 1], [0, 1]], [1000, 1010])
+    assert cropped[0, 2] == pytest.approx(650)
+    assert cropped[1, 2] == pytest.approx(355 + (960 - 720) / 2)
+
+    # a centre pixel of the calibration stays the centre pixel of the frame
+    centred = np.array([[1000.0, 0, 640], [0, 1000.0, 360], [0, 0, 1]])
+    for size in [(1280, 960), (960, 720), (720, 960)]:
+        k = scale_intrinsics(centred, CALIB, size)
+        assert k[0, 2] == pytest.approx(size[0] / 2) and k[1, 2] == pytest.approx(size[1] / 2)
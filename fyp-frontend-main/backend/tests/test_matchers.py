@@ -0,0 +1,42 @@
+"""Descriptor indexes against exact brute force (localization/matchers.py)"""
+
+import numpy as np
+import pytest
+
+from conftest import noisy_copies
+from localization.matchers import BruteForceIndex, build_index
+
+
+@pytest.fixture
+def bank(rng):
+    return rng.integers(0, 256, (5000, 32), dtype=np.uint8)
+
+
+@pytest.fixture
+def queries(bank, rng):
+    """1000 bank rows seen again with 24 of 256 bits flipped, plus 200 unrelated descriptors"""
+    rows = rng.choice(len(bank), 1000, replace=False)
+    seen = noisy_copies(bank[rows], 24, rng)
+    unrelated = rng.integers(0, 256, (200, 32), dtype=np.uint8)
+    return np.vstack([seen, unrelated]), rows
+
+
+def test_bruteforce_finds_every_true_match(bank, queries):
+    query, rows = queries
+    m = BruteForceIndex(bank).match(query)
+    found = dict(zip(m.query_idx.tolist(), m.train_idx.tolist()))
+    assert all(found.get(i) == r for i, r in enumerate(rows))
+
+
+@pytest.mark.parametrize("backend, min_recall", [("mih", 0.97), ("flann_lsh", 0.95)])
+def test_recall_against_bruteforce(bank, queries, backend, min_recall):
+    query, rows = queries
+    exact = BruteForceIndex(bank).match(query)
+    truth = {q: t for q, t in zip(exact.query_idx.tolist(), exact.train_idx.tolist()) if q < len(rows)}
+
+    m = build_index(backend, bank).match(query)
+    found = dict(zip(m.query_idx.tolist(), m.train_idx.tolist()))
+    recall = np.mean([found.get(q) == t for q, t in truth.items()])
+    assert recall >= min_recall
+    # Unrelated descriptors are ~128 bits away from everything: (almost) none may pass
+    assert sum(q >= len(rows) for q in found) <= 0.05 * (len(query) - len(rows))
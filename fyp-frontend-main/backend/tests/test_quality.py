@@ -0,0 +1,58 @@
+"""Pre-flight image quality gate (localization/quality.py)"""
+
+import dataclasses
+
+import cv2
+import numpy as np
+import pytest
+
+from localization import quality
+from localization.bank import Thresholds
+from localization.quality import check_quality
+
+SIZE = (480, 640)
+
+
+@pytest.fixture
+def textured(rng):
+    return cv2.resize(rng.integers(0, 256, (240, 320), dtype=np.uint8), SIZE[::-1])
+
+
+def stripes() -> np.ndarray:
+    """Sharp vertical edges, no corners"""
+    img = np.zeros(SIZE, np.uint8)
+    for x in range(0, SIZE[1], 32):
+        img[:, x:x + 16] = 200
+    return img
+
+
+def test_textured_frame_passes(textured):
+    assert check_quality(textured, Thresholds()) is None
+
+
+@pytest.mark.parametrize("make, code", [
+    (lambda rng: np.zeros(SIZE, np.uint8), "underexposed"),
+    (lambda rng: np.full(SIZE, 255, np.uint8), "overexposed"),
+    (lambda rng: (128 + rng.normal(0, 2, SIZE)).astype(np.uint8), "low_contrast"),
+    (lambda rng: cv2.resize(rng.integers(0, 256, (12, 16), dtype=np.uint8), SIZE[::-1],
+                            interpolation=cv2.INTER_CUBIC), "blurry"),
+    (lambda rng: stripes(), "few_features"),
+])
+def test_rejection_codes(make, code, rng):
+    result = check_quality(make(rng), Thresholds())
+
+    assert result["success"] is False and result["rejected"] == code
+    assert set(result["quality"]) == {"dark", "bright", "contrast", "sharpness", "corners"}
+
+
+def test_zero_limit_disables_a_check():
+    no_corner_check = dataclasses.replace(Thresholds(), min_corners=0)
+    assert check_quality(stripes(), no_corner_check) is None
+
+    no_clip_check = dataclasses.replace(Thresholds(), max_clipped=0)
+    assert check_quality(np.zeros(SIZE, np.uint8), no_clip_check)["rejected"] == "low_contrast"
+
+
+def test_gate_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(quality, "QUALITY_GATE", False)
+    assert check_quality(np.zeros(SIZE, np.uint8), Thresholds()) is None
@@ -0,0 +1,98 @@
+"""Memory-budgeted bank registry (localization/registry.py)"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from localization.bank import FeatureBank
+from localization.registry import BankRegistry
+
+ROWS = 1000    # 44 kB per bank: 12 B of point + 32 B of descriptor per row
+
+
+def loader(name: str, calls: list):
+    def load() -> FeatureBank:
+        calls.append(name)
+        return FeatureBank(name, np.zeros((ROWS, 3), np.float32), np.zeros((ROWS, 32), np.uint8),
+                           np.eye(2, 3), np.eye(3, dtype=np.float32), np.zeros((4, 1)))
+    return load
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def registry(calls):
+    """Budget for two banks out of three"""
+    reg = BankRegistry(budget_bytes=2 * ROWS * 44)
+    for name in ("a", "b", "c"):
+        reg.add(name, loader(name, calls))
+    return reg
+
+
+def test_loads_lazily_and_reuses(registry, calls):
+    assert calls == [] and registry.stats()["resident"] == []
+    assert registry.get("a") is registry.get("a")
+    assert calls == ["a"]
+    assert registry.stats()["hits"] == 1 and registry.stats()["loads"] == 1
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_evicts_the_least_recently_used(registry, calls):
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")          # b is now the least recently used
+    registry.get("c")
+
+    assert registry.stats()["resident"] == ["a", "c"]
+    assert registry.evictions == 1
+    assert registry.resident_bytes <= registry.budget_bytes
+
+    registry.get("b")          # reloaded, evicting a
+    assert calls == ["a", "b", "c", "b"]
+    assert registry.stats()["resident"] == ["c", "b"]
+
+
+def test_pinned_banks_are_not_evicted(registry):
+    with registry.lease("a") as a:
+        registry.get("b")
+        registry.get("c")      # evicts b, not the older but pinned a
+        registry.get("b")      # evicts c
+        assert registry.stats()["resident"] == ["a", "b"]
+        assert registry.get("a") is a
+    assert registry.evictions == 2
+
+
+def test_pinned_bank_over_budget_is_evicted_on_unpin(calls):
+    reg = BankRegistry(budget_bytes=ROWS * 44)
+    for name in ("a", "b"):
+        reg.add(name, loader(name, calls))
+
+    reg.pin("a")
+    reg.get("a")
+    reg.get("b")               # a is pinned: both stay, over budget
+    assert reg.stats()["resident"] == ["a", "b"]
+
+    reg.unpin("a")
+    assert reg.stats()["resident"] == ["b"]
+
+
+def test_concurrent_first_use_loads_once(calls):
+    reg = BankRegistry(budget_bytes=0)
+    slow = loader("a", calls)
+    reg.add("a", lambda: (time.sleep(0.05), slow())[1])
+
+    banks = []
+    threads = [threading.Thread(target=lambda: banks.append(reg.get("a"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["a"]
+    assert all(bank is banks[0] for bank in banks)
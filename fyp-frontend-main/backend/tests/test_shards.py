@@ -0,0 +1,69 @@
+"""Scatter-gather matching over shard processes (localization/shards.py)"""
+
+import numpy as np
+import pytest
+
+from conftest import noisy_copies
+from localization.bank import FeatureBank
+from localization.matchers import BruteForceIndex
+from localization.shards import ShardedIndex, shutdown_shards
+
+
+def pairs(m) -> set:
+    return set(zip(m.query_idx.tolist(), m.train_idx.tolist()))
+
+
+@pytest.fixture(scope="module")
+def sharded():
+    rng = np.random.default_rng(1)
+    bank = FeatureBank(
+        "Test", rng.normal(size=(6000, 3)).astype(np.float32),
+        rng.integers(0, 256, (6000, 32), dtype=np.uint8),
+        np.eye(2, 3), np.eye(3, dtype=np.float32), np.zeros((4, 1)),
+    )
+    index = ShardedIndex(bank, shards=3)
+    yield bank, index
+    shutdown_shards()
+    bank.release(unlink=True)
+
+
+@pytest.fixture
+def frames(sharded, rng):
+    """Three frames that partly see the same bank points"""
+    bank, _ = sharded
+    shared = rng.choice(len(bank), 200, replace=False)
+    out = []
+    for _ in range(3):
+        own = rng.choice(len(bank), 300, replace=False)
+        rows = np.concatenate([shared, own])
+        out.append(np.vstack([noisy_copies(bank.descriptors[rows], 16, rng),
+                              rng.integers(0, 256, (50, 32), dtype=np.uint8)]))
+    return out
+
+
+def test_match_many_equals_bruteforce(sharded, frames):
+    bank, index = sharded
+    expected = BruteForceIndex(bank.descriptors).match_many(frames)
+    got = index.match_many(frames)
+    assert len(got) == len(frames)
+    for e, g in zip(expected, got):
+        assert pairs(g) == pairs(e)
+
+
+def test_match_contains_whole_bank_cross_check(sharded, frames):
+    bank, index = sharded
+    exact = BruteForceIndex(bank.descriptors).match(frames[0])
+    assert pairs(exact) <= pairs(index.match(frames[0]))
+
+
+def test_workers_warn_that_sharding_is_off(monkeypatch, capsys):
+    from localization import engine as engine_module
+    from localization.registry import BankRegistry
+
+    monkeypatch.setattr(engine_module, "SHARDS", 4)
+    engine = engine_module.LocalizationEngine(BankRegistry(budget_bytes=0), workers=1)
+    try:
+        engine.start()
+    finally:
+        engine.shutdown()
+    assert "MAPMATE_MATCH_SHARDS=4 is ignored" in capsys.readouterr().out
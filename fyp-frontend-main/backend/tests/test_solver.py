@@ -0,0 +1,43 @@
+"""Deadline-bounded PnP on synthetic scenes (localization/solver.py)"""
+
+import time
+
+import numpy as np
+import pytest
+
+from conftest import NO_DIST, rotation_error_deg, with_outliers
+from localization.solver import solve_pnp
+
+
+@pytest.mark.parametrize("method", ["usac_magsac", "ransac"])
+def test_solve_pnp_recovers_pose(scene, camera_matrix, rng, method):
+    pts_3d, pts_2d, R, tvec = scene
+    noisy, bad = with_outliers(pts_2d, 0.3, rng)
+
+    pose = solve_pnp(pts_3d, noisy, camera_matrix, NO_DIST, max_iterations=500, method=method)
+
+    assert pose is not None and not pose.deadline_hit
+    assert rotation_error_deg(pose.rvec, R) < 1.0
+    assert np.linalg.norm(pose.tvec - tvec) < 0.2
+    assert np.isin(pose.inliers, np.flatnonzero(bad)).mean() < 0.05
+
+
+def test_solve_pnp_with_deadline(scene, camera_matrix, rng):
+    pts_3d, pts_2d, R, _ = scene
+    noisy, _ = with_outliers(pts_2d, 0.3, rng)
+
+    pose = solve_pnp(pts_3d, noisy, camera_matrix, NO_DIST, max_iterations=500,
+                     deadline=time.monotonic() + 5.0)
+
+    assert pose is not None and not pose.deadline_hit
+    assert rotation_error_deg(pose.rvec, R) < 1.0
+
+
+def test_solve_pnp_expired_deadline_stops_after_one_chunk(scene, camera_matrix, rng):
+    pts_3d, pts_2d, _, _ = scene
+    noisy, _ = with_outliers(pts_2d, 0.9, rng)
+
+    pose = solve_pnp(pts_3d, noisy, camera_matrix, NO_DIST, max_iterations=10000,
+                     deadline=time.monotonic() - 1.0)
+
+    assert pose is None or (pose.deadline_hit and pose.iterations < 10000)
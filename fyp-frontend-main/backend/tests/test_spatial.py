@@ -0,0 +1,77 @@
+"""Position-prior spatial index (localization/spatial.py)"""
+
+import numpy as np
+import pytest
+
+from localization.spatial import SpatialIndex, map_region_to_building
+
+
+@pytest.fixture
+def ring(rng):
+    """2000 points on a 20 x 20 square facade ring around the origin, observed from outside"""
+    side = rng.integers(0, 4, 2000)
+    s = rng.uniform(-10, 10, 2000)
+    x = np.select([side == 0, side == 1, side == 2], [s, s, np.full(2000, -10.0)], np.full(2000, 10.0))
+    z = np.select([side == 0, side == 1, side == 2], [np.full(2000, -10.0), np.full(2000, 10.0), s], s)
+    points = np.column_stack([x, rng.uniform(-3, 0, 2000), z])
+    outward = np.zeros_like(points)
+    outward[side == 0, 2], outward[side == 1, 2] = -1, 1
+    outward[side == 2, 0], outward[side == 3, 0] = -1, 1
+    return points, outward
+
+
+def brute_force(points, centre, radius):
+    return np.flatnonzero(np.linalg.norm(points[:, [0, 2]] - centre, axis=1) <= radius)
+
+
+@pytest.mark.parametrize("centre, radius", [((0, -14), 3.0), ((12, 12), 6.0), ((0, 0), 30.0), ((50, 50), 5.0)])
+def test_distance_only_equals_brute_force(ring, centre, radius):
+    points, _ = ring
+    index = SpatialIndex(points, view_distance=2.0)
+
+    rows = index.visible_from(np.array(centre, float), radius)
+
+    np.testing.assert_array_equal(rows, brute_force(points, np.array(centre, float), radius + 2.0))
+
+
+def test_facing_drops_points_seen_from_the_other_side(ring):
+    points, outward = ring
+    index = SpatialIndex(points, view_distance=25.0, view_dirs=outward)
+    centre = np.array([0.0, -14.0])                # 4 units in front of the z = -10 facade
+
+    rows = index.visible_from(centre, 1.0)
+
+    near = brute_force(points, centre, 26.0)
+    assert set(rows) < set(near)
+    facade = points[rows, 2]
+    assert np.all(facade < 10)                      # the far facade is never kept
+    assert np.sum(facade == -10) == np.sum(points[near, 2] == -10)
+
+
+def test_zero_directions_are_always_kept(ring):
+    points, outward = ring
+    outward[points[:, 2] == 10] = 0                 # far facade: direction unknown
+    index = SpatialIndex(points, view_distance=25.0, view_dirs=outward)
+
+    rows = index.visible_from(np.array([0.0, -14.0]), 1.0)
+
+    assert np.all(np.isin(np.flatnonzero(points[:, 2] == 10), rows))
+
+
+def test_snapped_disc_covers_the_request(ring):
+    points, _ = ring
+    index = SpatialIndex(points, view_distance=2.0)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        centre, radius = rng.uniform(-15, 15, 2), rng.uniform(1, 12)
+        key, snapped, r = index.snap(centre, radius)
+        assert np.linalg.norm(snapped - centre) + radius <= r + 1e-9
+        assert r <= 2.5 * radius + index.cell
+        assert index.snap(snapped, radius)[0] == key
+
+
+def test_map_disc_goes_through_the_inverse_transform():
+    T = np.array([[2.0, 0.0, 100.0], [0.0, 2.0, 50.0]])
+    centre, radius = map_region_to_building(T, (120.0, 30.0), 10.0)
+    np.testing.assert_allclose(centre, [10.0, -10.0])
+    assert radius == pytest.approx(5.0)
@@ -0,0 +1,75 @@
+"""WebSocket pose stream (routes/localize_stream.py)"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes import localize_stream as stream
+from routes.localize_stream import LatestFrame
+
+
+def test_mailbox_keeps_only_the_newest_frame():
+    async def run():
+        box = LatestFrame()
+        waiting = asyncio.create_task(box.take())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()            # take() waits for a frame
+
+        box.put(b"one")
+        assert await waiting == (1, b"one")
+
+        box.put(b"two")
+        box.put(b"three")                    # replaces "two" before anyone took it
+        assert await box.take() == (3, b"three")
+        assert box.received == 3 and box.dropped == 1
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """The stream with a localizer that holds frame 1 until released"""
+    started, release = threading.Event(), threading.Event()
+    seen = []
+
+    async def localize_upload(building, data, *args):
+        seen.append(data)
+        if data == b"1":
+            started.set()
+            await asyncio.to_thread(release.wait, 5)
+        return {"success": True}, {"stages_ms": {}, "total_ms": 1.0, "counters": {}}
+
+    monkeypatch.setattr(stream, "localize_upload", localize_upload)
+    monkeypatch.setattr(stream, "LOCALIZERS", {"library"})
+    app = FastAPI()
+    app.include_router(stream.router)
+    with TestClient(app) as c:
+        yield c, started, release, seen
+
+
+def test_stale_frames_are_dropped(client):
+    c, started, release, seen = client
+    with c.websocket_connect("/localize/stream/?building=library") as ws:
+        ws.send_bytes(b"1")
+        assert started.wait(5)
+        ws.send_bytes(b"2")
+        ws.send_bytes(b"3")                  # replaces 2 while 1 is processed
+        ws.send_text("not a frame")
+        error = ws.receive_json()
+        release.set()
+        first, second = ws.receive_json(), ws.receive_json()
+
+    assert error["success"] is False and error["frame"] is None
+    assert (first["frame"], second["frame"]) == (1, 3)
+    assert second["dropped"] == 1
+    assert seen == [b"1", b"3"]
+
+
+def test_unknown_building_closes_the_stream(client):
+    c, *_ = client
+    with c.websocket_connect("/localize/stream/?building=nowhere") as ws:
+        assert ws.receive_json() == {"success": False, "reason": "Unknown building 'nowhere'"}
+        assert ws.receive()["type"] == "websocket.close"
@@ -0,0 +1,56 @@
+"""Guided tracking from the previous pose (localization/pipeline.py track_pose)"""
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import IMAGE_SIZE, NO_DIST, noisy_copies, rotation_error_deg
+from localization.bank import FeatureBank
+from localization.pipeline import track_pose
+
+
+@pytest.fixture
+def tracked(scene, camera_matrix, rng):
+    """A bank of the scene points (map = building X, Z) and the frame that sees them"""
+    pts_3d, pts_2d, R, tvec = scene
+    descriptors = rng.integers(0, 256, (len(pts_3d), 32), dtype=np.uint8)
+    bank = FeatureBank("Test", pts_3d, descriptors, np.eye(2, 3),
+                       camera_matrix, NO_DIST, calibration_size=IMAGE_SIZE)
+    frame_des = noisy_copies(descriptors, 16, rng)
+    return bank, pts_2d, frame_des, R, tvec
+
+
+def test_exact_prior_is_kept(tracked):
+    bank, kp_xy, des, R, tvec = tracked
+    rvec, _ = cv2.Rodrigues(R)
+
+    result = track_pose(kp_xy, des, bank, (rvec, tvec), IMAGE_SIZE)
+
+    assert result["success"] and result["tracking"] == "tracked"
+    cam = (-R.T @ tvec).ravel()
+    assert result["map_x"] == pytest.approx(cam[0], abs=0.05)
+    assert result["map_y"] == pytest.approx(cam[2], abs=0.05)
+
+
+def test_nearby_prior_converges_to_the_true_pose(tracked):
+    bank, kp_xy, des, R, tvec = tracked
+    rvec, _ = cv2.Rodrigues(R)
+    prior = (rvec + np.radians(1.0), tvec + 0.1)
+
+    result = track_pose(kp_xy, des, bank, prior, IMAGE_SIZE)
+
+    assert result["success"]
+    cam = (-R.T @ tvec).ravel()
+    assert result["map_x"] == pytest.approx(cam[0], abs=0.05)
+    assert result["map_y"] == pytest.approx(cam[2], abs=0.05)
+
+
+def test_prior_facing_away_loses_tracking(tracked):
+    bank, kp_xy, des, R, tvec = tracked
+    turned = np.array([[-1.0, 0, 0], [0, 1, 0], [0, 0, -1]]) @ R
+    rvec, _ = cv2.Rodrigues(turned)
+    assert rotation_error_deg(rvec, R) > 170
+
+    result = track_pose(kp_xy, des, bank, (rvec, tvec), IMAGE_SIZE)
+
+    assert result == {"success": False, "reason": "Tracking lost"}
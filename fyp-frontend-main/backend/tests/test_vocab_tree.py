@@ -0,0 +1,77 @@
+"""Building recognition by vocabulary tree (localization/vocab_tree.py)"""
+
+import numpy as np
+import pytest
+
+from conftest import noisy_copies
+from localization.vocab_tree import VocabularyTree
+
+BUILDINGS = ["Library", "Admin", "Hostel"]
+
+
+@pytest.fixture
+def prototypes(rng):
+    """40 distinct descriptors per building; a building's bank is noisy views of them"""
+    return {name: rng.integers(0, 256, (40, 32), dtype=np.uint8) for name in BUILDINGS}
+
+
+@pytest.fixture
+def tree(prototypes, rng):
+    banks = {name: np.repeat(p, 25, axis=0) for name, p in prototypes.items()}
+    banks = {name: noisy_copies(des, 10, rng) for name, des in banks.items()}
+    return VocabularyTree.build({name: (lambda d=des: d) for name, des in banks.items()},
+                                branching=6, depth=3)
+
+
+@pytest.mark.parametrize("building", BUILDINGS)
+def test_query_ranks_its_building_first(tree, prototypes, building, rng):
+    query = noisy_copies(prototypes[building][:15], 12, rng)
+
+    ranking = tree.rank(query)
+
+    assert [name for name, _ in ranking][0] == building
+    scores = [score for _, score in ranking]
+    assert scores == sorted(scores, reverse=True)
+    assert 0.0 <= scores[-1] and scores[0] <= 1.0 + 1e-9
+    assert scores[0] > 2 * scores[1]
+
+
+def test_empty_query_ranks_nothing(tree):
+    assert tree.rank(np.zeros((0, 32), np.uint8)) == []
+    assert tree.rank(None) == []
+
+
+def test_save_load_keeps_the_ranking(tree, prototypes, rng, tmp_path):
+    query = noisy_copies(prototypes["Admin"], 12, rng)
+    tree.save(tmp_path / "tree.npz")
+
+    loaded = VocabularyTree.load(tmp_path / "tree.npz")
+
+    assert loaded.buildings == tree.buildings
+    assert loaded.rank(query) == tree.rank(query)
+
+
+def test_changed_bank_files_make_the_saved_tree_stale(tree, tmp_path, monkeypatch):
+    import building_detector as detector
+
+    stamps = {name: f"descriptors_3d.npy:{i}:1" for i, name in enumerate(BUILDINGS)}
+    builds = []
+
+    def build():
+        builds.append(dict(stamps))
+        tree.stamps = [stamps[name] for name in tree.buildings]
+        return tree
+
+    monkeypatch.setattr(detector, "VOCAB_TREE_PATH", tmp_path / "tree.npz")
+    monkeypatch.setattr(detector, "bank_stamps", lambda: dict(stamps))
+    monkeypatch.setattr(detector, "build_vocabulary_tree", build)
+
+    def load():
+        monkeypatch.setattr(detector, "_tree", None)
+        return detector.load_vocabulary_tree()
+
+    load()                                      # missing: built and saved
+    assert load().stamps == tree.stamps         # unchanged banks: loaded
+    stamps["Admin"] = "descriptors_3d.npy:1:2"  # a bank was pruned
+    load()
+    assert len(builds) == 2 and VocabularyTree.load(tmp_path / "tree.npz").stamps[1] == stamps["Admin"]